@@ -0,0 +1,76 @@
+from __future__ import annotations
+import tracemalloc
+
+from benchmarks.common import FIB, best_of
+
+# What a call allocates, on every backend.
+#
+#   - live blocks/bytes: what tracemalloc sees allocated, and not yet freed,
+#     between just before `work(10)` and the middle of its loop body
+#   - environments/call: environments created over 100 calls of
+#     `work(100)`, counted with instrumentation.py
+#
+#     $ python -m benchmarks.allocations
+
+WORK = """
+fun work(n) {
+    var total = 0;
+    var i = 0;
+    while (i < n) {
+        if (i == n - 1) { probe(); }
+        total = total + i;
+        i = i + 1;
+    }
+    return total;
+}
+"""
+
+def live() -> tuple[int, int]:
+    snapshot = tracemalloc.take_snapshot()
+    stats = snapshot.statistics("filename")
+    return sum(stat.count for stat in stats), sum(stat.size for stat in stats)
+
+def measure(backend: str) -> tuple[int, int, float]:
+    import libffi
+    from instrumentation import instrument, uninstrument
+    from interpreter import Interp, interpret
+    from parser import parse
+    from scanner import scan
+
+    marks: list[tuple[int, int]] = []
+
+    interp = Interp()
+    libffi.define(interp, "mark",  lambda: marks.append(live()))
+    libffi.define(interp, "probe", lambda: marks.append(live()))
+    libffi.define(interp, "noop",  lambda: None)
+    interpret(parse(scan(WORK.replace("probe()", "noop()"))), backend, interp=interp)
+
+    calls = parse(scan("var k = 0; while (k < 100) { work(100); k = k + 1; }"))
+    counters = instrument(interp)
+    interpret(calls, backend, interp=interp)
+    uninstrument(interp)
+
+    interpret(parse(scan(WORK)), backend, interp=interp)
+    probed = parse(scan("work(10); mark(); work(10);"))
+    tracemalloc.start()
+    interpret(probed, backend, interp=interp)
+    tracemalloc.stop()
+
+    (beforeBlocks, beforeBytes), (blocks, size) = marks[-2], marks[-1]
+    return blocks - beforeBlocks, size - beforeBytes, counters.environmentsCreated / 100
+
+def main() -> None:
+    from interpreter import BACKENDS, interpret
+    from parser import parse
+    from scanner import scan
+
+    print(f"    {'':<10}{'live blocks':>12}{'live bytes':>12}{'envs/call':>12}{'fib(20)':>10}")
+    for backend in BACKENDS:
+        blocks, size, environments = measure(backend)
+        fib = parse(scan(FIB.replace("{n}", "20")))
+        seconds = best_of(lambda: interpret(fib, backend))
+        print(f"    {backend:<10}{blocks:>12}{size:>12}{environments:>12.2f}{seconds:>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
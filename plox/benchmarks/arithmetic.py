@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from benchmarks.common import FIB, LOOP, compare_backends
+
+# Arithmetic microbenchmarks: tight loops over every binary operator, and
+# numeric recursion.
+#
+#     $ python -m benchmarks.arithmetic
+
+MIXED = """
+var i = 0;
+var x = 1;
+while (i < {n}) {
+    x = (x * 3 + i) / 2 - i * 0.5;
+    i = i + 1;
+}
+print(x);
+"""
+
+COMPARE = """
+var i     = 0;
+var count = 0;
+while (i < {n}) {
+    if (i >= 10 and i <= {n} - 10 and i != 500 and !(i == 7) and i > -1) {
+        count = count + 1;
+    }
+    i = i + 1;
+}
+print(count);
+"""
+
+NESTED = """
+var total = 0;
+var i = 0;
+while (i < {n}) {
+    var j = 0;
+    while (j < 10) {
+        total = total + i * j - j;
+        j = j + 1;
+    }
+    i = i + 1;
+}
+print(total);
+"""
+
+TAK = """
+fun tak(x, y, z) {
+    if (y >= x) return z;
+    return tak(tak(x - 1, y, z), tak(y - 1, z, x), tak(z - 1, x, y));
+}
+print(tak({n}, 12, 6));
+"""
+
+SCRIPTS: dict[str, str] = {
+    "sum loop, 100k"  : LOOP.replace("{n}", "100000"),
+    "mixed ops, 50k"  : MIXED.replace("{n}", "50000"),
+    "comparisons, 50k": COMPARE.replace("{n}", "50000"),
+    "nested loop, 10k": NESTED.replace("{n}", "10000"),
+    "fib(20)"         : FIB.replace("{n}", "20"),
+    "tak(18, 12, 6)"  : TAK.replace("{n}", "18"),
+}
+
+
+def main() -> None:
+    compare_backends(SCRIPTS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+from benchmarks.common import FIB, LOOP, compare_backends
+
+# Every backend on the same scripts.
+#
+#     $ python -m benchmarks.backends
+
+SCRIPTS: dict[str, str] = {
+    "fib(20)"         : FIB.replace("{n}", "20"),
+    "while, 200k iter": LOOP.replace("{n}", "200000"),
+}
+
+
+def main() -> None:
+    compare_backends(SCRIPTS)
+
+
+if __name__ == "__main__":
+    main()
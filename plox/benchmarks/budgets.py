@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from benchmarks.common import FIB, LOOP, best_of
+
+# What running under a budget costs: each program with no budget, then
+# with every limit set high enough never to be hit.
+#
+#     $ python -m benchmarks.budgets
+#
+# Without a budget loops and calls still pay for the fuel check, compare
+# the first column against the same programs on an older checkout to see
+# that part.
+
+INSTANCES = """
+class Point {
+    init(x, y) { this.x = x; this.y = y; }
+    plus(other) { return Point(this.x + other.x, this.y + other.y); }
+}
+var p = Point(0, 0);
+for (var i in range(20000)) {
+    p = p.plus(Point(i, 1));
+}
+print(p.x);
+"""
+
+PROGRAMS: dict[str, str] = {
+    "while loop 300k": LOOP.replace("{n}", "300000"),
+    "fib(20)"        : FIB.replace("{n}", "20"),
+    "20k instances"  : INSTANCES,
+}
+
+def main() -> None:
+    from budgets import Budget
+    from interpreter import BACKENDS, interpret
+    from parser import parse
+    from scanner import scan
+
+    budget = Budget(maxNodes=10 ** 9, seconds=3600, maxInstances=10 ** 6, maxDepth=900)
+
+    for backend in BACKENDS:
+        print(backend)
+        print(f"    {'':<24}{'no budget':>10}{'budget':>10}{'overhead':>10}")
+        for name, source in PROGRAMS.items():
+            stmts = parse(scan(source))
+            # Taking turns, so neither side gets all of the warm up or all
+            # of the noise.
+            free, limited = float("inf"), float("inf")
+            for _ in range(5):
+                free    = min(free, best_of(lambda: interpret(stmts, backend), 1))
+                limited = min(limited, best_of(lambda: interpret(stmts, backend, budget=budget), 1))
+            print(f"    {name:<24}{free:>9.3f}s{limited:>9.3f}s{limited / free - 1:>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
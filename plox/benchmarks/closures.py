@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from scanner import scan
+from parser import parse
+from interpreter import interpret
+from benchmarks.common import FIB, LOOP, best_of, report
+
+# Tree-walking `evaluate` vs. the closure-compiled backend.
+#
+#     $ python -m benchmarks.closures
+
+SCRIPTS: dict[str, str] = {
+    "fib(20)"         : FIB.replace("{n}", "20"),
+    "while, 200k iter": LOOP.replace("{n}", "200000"),
+}
+
+
+def main() -> None:
+    rows: list[tuple[str, float, float]] = []
+
+    for name, source in SCRIPTS.items():
+        tree    = best_of(lambda: interpret(parse(scan(source)), backend="tree"))
+        closure = best_of(lambda: interpret(parse(scan(source)), backend="closure"))
+        rows.append((name, tree, closure))
+
+    report("tree-walker (before) vs. closure compiled (after)", rows)
+
+
+if __name__ == "__main__":
+    main()
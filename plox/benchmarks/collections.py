@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from benchmarks.common import compare_backends
+
+# Lists against what Lox code had to write before them: a chain of
+# instances linked through `next`. Building 10k items, reading the 10k
+# items back by position and looping over them.
+#
+#     $ python -m benchmarks.collections
+
+N = 10_000
+
+LINKED = f"""
+class Node {{
+    init(value, next) {{
+        this.value = value;
+        this.next  = next;
+    }}
+}}
+var head = nil;
+var i = {N} - 1;
+while (i >= 0) {{
+    head = Node(i, head);
+    i = i - 1;
+}}
+"""
+
+LINKED_BUILD = LINKED + "print(head.value);"
+
+# Without indexing, the k'th item costs a walk from the head.
+LINKED_INDEX = LINKED + """
+fun nth(node, k) {
+    while (k > 0) { node = node.next; k = k - 1; }
+    return node.value;
+}
+var sum = 0;
+var k = 0;
+while (k < 1000) {
+    sum = sum + nth(head, k);
+    k = k + 1;
+}
+print(sum);
+"""
+
+LINKED_LOOP = LINKED + """
+var sum = 0;
+var node = head;
+while (node != nil) {
+    sum = sum + node.value;
+    node = node.next;
+}
+print(sum);
+"""
+
+LIST = f"""
+var items = [];
+var i = 0;
+while (i < {N}) {{
+    push(items, i);
+    i = i + 1;
+}}
+"""
+
+LIST_BUILD = LIST + "print(items[0]);"
+
+LIST_INDEX = LIST + """
+var sum = 0;
+var k = 0;
+while (k < 1000) {
+    sum = sum + items[k];
+    k = k + 1;
+}
+print(sum);
+"""
+
+LIST_LOOP = LIST + """
+var sum = 0;
+for (var item in items) sum = sum + item;
+print(sum);
+"""
+
+
+def main() -> None:
+    compare_backends({
+        "build, linked"    : LINKED_BUILD,
+        "build, list"      : LIST_BUILD,
+        "1k index, linked" : LINKED_INDEX,
+        "1k index, list"   : LIST_INDEX,
+        "loop, linked"     : LINKED_LOOP,
+        "loop, list"       : LIST_LOOP,
+    })
+
+
+if __name__ == "__main__":
+    main()
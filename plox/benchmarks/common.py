@@ -0,0 +1,73 @@
+from __future__ import annotations
+import contextlib
+import io
+import time
+from typing import Callable
+
+# Shared helpers for the benchmarks in this directory.
+#
+# Run them from the plox directory so the flat imports resolve:
+#     $ python -m benchmarks.closures
+
+FIB = """
+fun fib(n) {
+    if (n < 2) return n;
+    return fib(n - 1) + fib(n - 2);
+}
+print(fib({n}));
+"""
+
+LOOP = """
+var i   = 0;
+var sum = 0;
+while (i < {n}) {
+    sum = sum + i;
+    i   = i + 1;
+}
+print(sum);
+"""
+
+
+# A large program that only has to scan and parse, not run.
+def synthetic_program(lines: int) -> str:
+    out: list[str] = ["var v0 = 0;"]
+    for i in range(1, lines // 4 + 1):
+        out.append(f"var v{i} = (v{i - 1} + {i}) * 2 - 1;")
+        out.append(f"fun f{i}(a, b) {{")
+        out.append(f"    if (a < b and !(a == {i})) return a + b; else return this_{i}.field;")
+        out.append("}")
+    return "\n".join(out) + "\n"
+
+def quietly(fn: Callable[[], object]) -> str:
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        fn()
+    return out.getvalue()
+
+def best_of(fn: Callable[[], object], repeat: int = 3) -> float:
+    best: float = float("inf")
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        quietly(fn)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def compare_backends(scripts: dict[str, str], repeat: int = 3) -> None:
+    from scanner import scan
+    from parser import parse
+    from interpreter import BACKENDS, interpret
+
+    print(f"    {'':<24}" + "".join(f"{backend:>10}" for backend in BACKENDS))
+
+    for name, source in scripts.items():
+        times: list[float] = [
+            best_of(lambda: interpret(parse(scan(source)), backend=backend), repeat)
+            for backend in BACKENDS
+        ]
+        print(f"    {name:<24}" + "".join(f"{t:>9.3f}s" for t in times))
+
+def report(title: str, rows: list[tuple[str, float, float]]) -> None:
+    print(title)
+    print(f"    {'':<24}{'before':>10}{'after':>10}{'speedup':>10}")
+    for name, before, after in rows:
+        print(f"    {name:<24}{before:>9.3f}s{after:>9.3f}s{before / after:>9.2f}x")
@@ -0,0 +1,61 @@
+from __future__ import annotations
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+
+# Runs per second of a small script: one python process per run, the way
+# a host had to do it while errors called `exit`, against program.py in
+# the host's own process, compiling every time or once.
+#
+#     $ python -m benchmarks.embedding
+
+# A pricing rule, the kind of snippet a server would run per request.
+RULE = """
+fun discount(total, items) {
+    if (items >= 10) return total * 0.1;
+    if (total > 100) return 5;
+    return 0;
+}
+var sum = 0;
+for (var price in prices) sum = sum + price;
+"""
+RESULT = "sum - discount(sum, len(prices))"
+
+PRICES: list[float] = [19.99, 5.0, 42.5, 7.25, 31.0]
+
+def rate(fn: Callable[[], object], seconds: float = 1.0) -> float:
+    runs : int   = 0
+    start: float = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn()
+        runs += 1
+    return runs / (time.perf_counter() - start)
+
+def main() -> None:
+    import program
+    from interpreter import BACKENDS
+
+    source : str               = RULE + RESULT + ";"
+    globals: dict[str, object] = {"prices": PRICES}
+    # A process only gets its input through the source.
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        f.write(f"var prices = {PRICES};\n{RULE}print({RESULT});\n")
+
+    try:
+        print(f"    {'':<10}{'process':>10}{'compile+run':>14}{'run':>10}   runs/sec")
+        for backend in BACKENDS:
+            command = [sys.executable, "interpreter.py", "--no-cache", "--backend", backend, f.name]
+            process = rate(lambda: subprocess.run(command, capture_output=True), 3.0)
+            fresh   = rate(lambda: program.compile(source, backend).run(globals))
+            compiled: program.Program = program.compile(source, backend)
+            reused  = rate(lambda: compiled.run(globals))
+            print(f"    {backend:<10}{process:>10.1f}{fresh:>14.0f}{reused:>10.0f}")
+    finally:
+        os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from benchmarks.common import LOOP, compare_backends
+
+# Variable access through deeply nested scopes: `a` and `b` are read four
+# and three environments up from the loop body on every iteration.
+#
+#     $ python -m benchmarks.environments
+
+DEEP_CLOSURE = """
+fun outer() {
+    var a = 1;
+    fun middle() {
+        var b = 2;
+        fun inner() {
+            var i   = 0;
+            var sum = 0;
+            while (i < {n}) {
+                sum = sum + a + b;
+                i   = i + 1;
+            }
+            return sum;
+        }
+        return inner;
+    }
+    return middle();
+}
+print(outer()());
+"""
+
+SCRIPTS: dict[str, str] = {
+    "deep closure, 100k iter": DEEP_CLOSURE.replace("{n}", "100000"),
+    "globals, 100k iter"     : LOOP.replace("{n}", "100000"),
+}
+
+
+def main() -> None:
+    compare_backends(SCRIPTS)
+
+
+if __name__ == "__main__":
+    main()
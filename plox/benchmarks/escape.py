@@ -0,0 +1,77 @@
+from __future__ import annotations
+import tracemalloc
+
+from benchmarks.common import FIB, best_of, quietly
+
+# What escape analysis buys: memory kept alive by long-lived closures, and
+# the speed of calls whose locals no closure can see.
+#
+#     $ python -m benchmarks.escape
+
+# 1000 closures that each only need `id`, made by calls that also had a
+# 100 item list in a local.
+CLOSURES = """
+fun makeGetter(id) {
+    var scratch = range(100);
+    var total = sum(scratch);
+    fun get() { return id; }
+    return get;
+}
+var getters = [];
+var i = 0;
+while (i < 1000) {
+    push(getters, makeGetter(i));
+    i = i + 1;
+}
+"""
+
+CALLS = """
+fun work(n) {
+    var total = 0;
+    var i = 0;
+    while (i < n) {
+        var square = i * i;
+        total = total + square;
+        i = i + 1;
+    }
+    return total;
+}
+var k = 0;
+while (k < 2000) {
+    work(50);
+    k = k + 1;
+}
+"""
+
+def retained(backend: str) -> int:
+    from interpreter import Interp, interpret
+    from parser import parse
+    from scanner import scan
+
+    stmts = parse(scan(CLOSURES))
+    interp = Interp()
+    tracemalloc.start()
+    before: int = tracemalloc.get_traced_memory()[0]
+    quietly(lambda: interpret(stmts, backend, interp=interp))
+    after: int = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before
+
+def main() -> None:
+    from interpreter import BACKENDS, interpret
+    from parser import parse
+    from scanner import scan
+
+    fib  = parse(scan(FIB.replace("{n}", "20")))
+    work = parse(scan(CALLS))
+
+    print(f"    {'':<10}{'1k closures':>14}{'fib(20)':>10}{'2k calls':>10}")
+    for backend in BACKENDS:
+        size: int = retained(backend)
+        print(f"    {backend:<10}{size / 1024:>11.0f} KB"
+              f"{best_of(lambda: interpret(fib, backend)):>9.3f}s"
+              f"{best_of(lambda: interpret(work, backend)):>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
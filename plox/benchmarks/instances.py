@@ -0,0 +1,66 @@
+from __future__ import annotations
+import gc
+import sys
+import tracemalloc
+
+from scanner import scan
+from parser import parse
+from interpreter import BACKENDS, interpret
+from benchmarks.common import best_of, quietly
+
+# Makes `n` instances with three fields each and keeps them all alive,
+# then walks them reading fields. Reports memory per instance and the
+# time for both phases.
+#
+#     $ python -m benchmarks.instances [n]
+
+CREATE = """
+class Point {
+    init(x, y, next) {
+        this.x    = x;
+        this.y    = y;
+        this.next = next;
+    }
+}
+
+var head = nil;
+var i    = 0;
+while (i < {n}) {
+    head = Point(i, i + 1, head);
+    i    = i + 1;
+}
+"""
+
+WALK = """
+var sum = 0;
+var p   = head;
+while (p != nil) {
+    sum = sum + p.x + p.y;
+    p   = p.next;
+}
+print(sum);
+"""
+
+
+def main() -> None:
+    n     : int = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    create: str = CREATE.replace("{n}", str(n))
+
+    print(f"{n} instances with 3 fields")
+    print(f"    {'':<10}{'create':>9}{'walk':>9}{'bytes/instance':>16}")
+    for backend in BACKENDS:
+        # Every instance is still reachable through `head` when the script
+        # ends, so the peak is (mostly) what they take up.
+        gc.collect()
+        tracemalloc.start()
+        quietly(lambda: interpret(parse(scan(create)), backend))
+        peak: int = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        took_create: float = best_of(lambda: interpret(parse(scan(create)), backend))
+        took_both  : float = best_of(lambda: interpret(parse(scan(create + WALK)), backend))
+        print(f"    {backend:<10}{took_create:8.3f}s{took_both - took_create:8.3f}s{peak / n:16.1f}")
+
+
+if __name__ == "__main__":
+    main()
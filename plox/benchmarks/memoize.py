@@ -0,0 +1,38 @@
+from __future__ import annotations
+import sys
+
+from benchmarks.common import FIB, compare_backends
+
+# The exponential `fib` against the same function wrapped in `memoize`,
+# plus the cost of a cache hit: the same call over and over.
+#
+#     $ python -m benchmarks.memoize [n]
+
+MEMO_FIB = FIB.replace("print(fib(", "fib = memoize(fib);\nprint(fib(")
+
+HITS = """
+fun square(x) { return x * x; }
+var cached = memoize(square);
+var i = 0;
+while (i < 100000) {
+    cached(7);
+    i = i + 1;
+}
+"""
+
+PLAIN = HITS.replace("memoize(square)", "square")
+
+
+def main() -> None:
+    n: int = int(sys.argv[1]) if len(sys.argv) > 1 else 22
+
+    compare_backends({
+        f"fib({n})"         : FIB.replace("{n}", str(n)),
+        f"memoized fib({n})": MEMO_FIB.replace("{n}", str(n)),
+        "100k calls"        : PLAIN,
+        "100k cache hits"   : HITS,
+    })
+
+
+if __name__ == "__main__":
+    main()
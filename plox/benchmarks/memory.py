@@ -0,0 +1,48 @@
+from __future__ import annotations
+import dataclasses
+import sys
+import tracemalloc
+
+from scanner import scan
+from parser import parse
+from expr import Expr
+from stmt import Stmt
+from benchmarks.common import synthetic_program
+
+# Memory held by the token list and the AST of a large generated program.
+#
+#     $ python -m benchmarks.memory [lines]
+
+def count_nodes(node: object) -> int:
+    if isinstance(node, list):
+        return sum(count_nodes(n) for n in node)
+    if not isinstance(node, Expr | Stmt):
+        return 0
+    return 1 + sum(count_nodes(getattr(node, f.name))
+                   for f in dataclasses.fields(node))
+
+
+def main() -> None:
+    lines : int = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    source: str = synthetic_program(lines)
+
+    tracemalloc.start()
+
+    before: int = tracemalloc.get_traced_memory()[0]
+    tokens = scan(source)
+    after_scan: int = tracemalloc.get_traced_memory()[0]
+    stmts = parse(tokens)
+    after_parse: int = tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.stop()
+
+    nodes: int = count_nodes(stmts)
+    print(f"{lines} lines, {len(tokens)} tokens, {nodes} nodes")
+    print(f"    tokens: {(after_scan - before) / 2**20:8.2f} MiB  "
+          f"{(after_scan - before) / len(tokens):6.1f} bytes/token")
+    print(f"    ast   : {(after_parse - after_scan) / 2**20:8.2f} MiB  "
+          f"{(after_parse - after_scan) / nodes:6.1f} bytes/node")
+
+
+if __name__ == "__main__":
+    main()
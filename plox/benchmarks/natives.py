@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from benchmarks.common import compare_backends
+
+# The same work done one Lox operation at a time and handed to a native.
+#
+#     $ python -m benchmarks.natives
+
+N = 100_000
+
+LOX_SUM = f"""
+var i   = 0;
+var sum = 0;
+while (i < {N}) {{
+    sum = sum + i;
+    i   = i + 1;
+}}
+print(sum);
+"""
+
+NATIVE_SUM = f"print(sum(range({N})));"
+
+# Building a 10k item comma separated string.
+LOX_JOIN = """
+var i   = 0;
+var out = "";
+while (i < 10000) {
+    if (i > 0) out = out + ",";
+    out = out + i;
+    i   = i + 1;
+}
+print(len(out));
+"""
+
+NATIVE_JOIN = """
+var items = list();
+var i = 0;
+while (i < 10000) {
+    push(items, i);
+    i = i + 1;
+}
+print(len(join(items, ",")));
+"""
+
+BULK_JOIN = 'print(len(join(range(10000), ",")));'
+
+
+def main() -> None:
+    compare_backends({
+        "sum, while loop"    : LOX_SUM,
+        "sum(range(n))"      : NATIVE_SUM,
+        "join, concatenation": LOX_JOIN,
+        "join, push + join"  : NATIVE_JOIN,
+        "join(range(n))"     : BULK_JOIN,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+from __future__ import annotations
+import sys
+
+from scanner import scan
+from parser import parse
+import environment
+import interpreter
+from interpreter import BACKENDS, interpret
+from benchmarks.common import best_of
+
+# A method call loop on one instance: time, and how many environments and
+# function objects each backend allocates per iteration.
+#
+#     $ python -m benchmarks.oop [iterations]
+
+METHOD_LOOP = """
+class Counter {
+    init() {
+        this.count = 0;
+    }
+    inc(by) {
+        this.count = this.count + by;
+    }
+    get() {
+        return this.count;
+    }
+}
+
+var counter = Counter();
+var i = 0;
+while (i < {n}) {
+    counter.inc(1);
+    i = i + counter.get() - i;
+}
+print(counter.get());
+"""
+
+
+# Counts every object created from `classes` while `fn` runs. Dataclass
+# subclasses get their own `__init__`, so they have to be listed too.
+def count_allocations(fn, classes: list[type]) -> int:
+    count: int = 0
+    originals = [cls.__init__ for cls in classes]
+
+    def counting(original):
+        def __init__(self, *args, **kwargs):
+            nonlocal count
+            count += 1
+            original(self, *args, **kwargs)
+        return __init__
+
+    for cls, original in zip(classes, originals):
+        cls.__init__ = counting(original)
+    try:
+        fn()
+    finally:
+        for cls, original in zip(classes, originals):
+            cls.__init__ = original
+
+    return count
+
+
+def main() -> None:
+    n     : int = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    source: str = METHOD_LOOP.replace("{n}", str(n))
+    tracked: list[type] = [environment.Environment, interpreter.LoxFunction]
+
+    print(f"method call loop, {n} iterations, 2 calls each")
+    print(f"    {'':<10}{'time':>9}{'envs + functions / iter':>26}")
+    for backend in BACKENDS:
+        classes: list[type] = tracked
+        if backend == "closure":
+            import closures
+            classes = tracked + [closures.CompiledFunction]
+        if backend == "vm":
+            import vm
+            classes = tracked + [vm.VMFunction]
+
+        took : float = best_of(lambda: interpret(parse(scan(source)), backend))
+        count: int   = count_allocations(
+            lambda: best_of(lambda: interpret(parse(scan(source)), backend), 1), classes)
+        print(f"    {backend:<10}{took:8.3f}s{count / n:26.2f}")
+
+
+if __name__ == "__main__":
+    main()
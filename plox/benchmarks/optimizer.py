@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from scanner import scan
+from parser import parse
+from interpreter import BACKENDS, interpret
+from benchmarks.common import best_of, report
+
+# Every backend with and without the optimizer, on a loop full of the
+# constant subexpressions and guards our generated scripts have.
+#
+#     $ python -m benchmarks.optimizer
+
+GUARDED_LOOP = """
+var i   = 0;
+var sum = 0;
+while (i < 100000) {
+    if (true) {
+        sum = sum + (2 * 3 + 4) / (1 + 1) - -(8 / 4);
+    }
+    if (false or nil) {
+        print("debug: " + i);
+    }
+    {
+        {
+            i = i + 1;
+        }
+    }
+}
+print(sum);
+"""
+
+
+def main() -> None:
+    rows: list[tuple[str, float, float]] = []
+
+    for backend in BACKENDS:
+        before: float = best_of(lambda: interpret(parse(scan(GUARDED_LOOP)), backend, optimize=False))
+        after : float = best_of(lambda: interpret(parse(scan(GUARDED_LOOP)), backend, optimize=True))
+        rows.append((backend, before, after))
+
+    report("guarded loop, 100k iter", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+from __future__ import annotations
+import sys
+
+from scanner import scan
+from parser import parse
+from interpreter import BACKENDS, interpret
+from benchmarks.common import FIB, best_of
+
+# Recursive call throughput: every call to `fib` ends in a `return`.
+#
+#     $ python -m benchmarks.returns [n]
+
+def fib_calls(n: int) -> int:
+    a, b = 1, 1
+    for _ in range(n):
+        a, b = b, a + b + 1
+    return a
+
+
+def main() -> None:
+    n     : int = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    calls : int = fib_calls(n)
+    source: str = FIB.replace("{n}", str(n))
+
+    print(f"fib({n}), {calls} calls")
+    for backend in BACKENDS:
+        took: float = best_of(lambda: interpret(parse(scan(source)), backend))
+        print(f"    {backend:<10}{took:8.3f}s {calls / took:12,.0f} calls/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+from __future__ import annotations
+import sys
+
+from benchmarks.common import compare_backends
+
+# Building a string by appending to it in a loop, the way a report or a
+# generated file gets written in Lox.
+#
+#     $ python -m benchmarks.ropes [kilobytes]
+
+APPEND = """
+var line = "{chunk}";
+var out  = "";
+var i    = 0;
+while (i < {count}) {{
+    out = out + line;
+    i   = i + 1;
+}}
+print(len(out));
+"""
+
+# Appending single characters and numbers, not just whole lines.
+SMALL_PIECES = """
+var out = "";
+var i   = 0;
+while (i < {count}) {{
+    out = out + i + ",";
+    i   = i + 1;
+}}
+print(len(out));
+"""
+
+
+def main() -> None:
+    kilobytes: int = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+
+    # Most of the numbers are "nnnnnn.0," so about 9 bytes a piece.
+    compare_backends({
+        f"{kilobytes} KB in 64 B lines": APPEND.format(chunk="x" * 64, count=kilobytes * 16),
+        f"{kilobytes} KB in numbers"   : SMALL_PIECES.format(count=kilobytes * 1024 // 9),
+    }, repeat=1)
+
+
+if __name__ == "__main__":
+    main()
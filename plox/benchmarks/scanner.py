@@ -0,0 +1,32 @@
+from __future__ import annotations
+import sys
+import time
+
+from scanner import scan, scanFast
+from benchmarks.common import synthetic_program
+
+# Scanner throughput in MB/s, `scan` against the regex based `scanFast`.
+#
+#     $ python -m benchmarks.scanner [lines]
+
+def main() -> None:
+    lines : int = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    source: str = synthetic_program(lines)
+    size  : float = len(source.encode()) / 1e6
+
+    print(f"{size:.1f} MB of source, {lines} lines")
+
+    results: dict[str, list] = {}
+    for name, fn in [("scan", scan), ("scanFast", scanFast)]:
+        start : float = time.perf_counter()
+        tokens = fn(source)
+        took  : float = time.perf_counter() - start
+
+        results[name] = tokens
+        print(f"    {name:<10}{took:8.2f}s {size / took:8.2f} MB/s")
+
+    assert results["scan"] == results["scanFast"], "token streams differ"
+
+
+if __name__ == "__main__":
+    main()
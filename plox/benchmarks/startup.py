@@ -0,0 +1,41 @@
+from __future__ import annotations
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks.common import synthetic_program, best_of
+
+# Startup time of a large script that declares a lot and runs little:
+# scanning, parsing, optimizing and resolving it every time against
+# loading the resolved program from `__ploxcache__`.
+#
+#     $ python -m benchmarks.startup [lines]
+
+def main() -> None:
+    import astcache
+    from interpreter import interpretFile
+
+    lines    : int = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    directory: str = tempfile.mkdtemp()
+    path     : str = os.path.join(directory, "library.lox")
+
+    with open(path, "w") as f:
+        f.write(synthetic_program(lines))
+
+    def cold() -> None:
+        shutil.rmtree(os.path.join(directory, astcache.CACHE_DIR), ignore_errors=True)
+        interpretFile(path)
+
+    try:
+        print(f"{lines} lines, {os.path.getsize(path) / 1e6:.1f} MB of source")
+        print(f"    {'no cache':<24}{best_of(lambda: interpretFile(path, cache=False)):8.3f}s")
+        print(f"    {'cold (parse + write)':<24}{best_of(cold):8.3f}s")
+        print(f"    {'warm (load)':<24}{best_of(lambda: interpretFile(path)):8.3f}s")
+        print(f"    {'cache file':<24}{os.path.getsize(astcache.cachePath(path)) / 1e6:8.1f} MB")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
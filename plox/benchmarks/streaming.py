@@ -0,0 +1,58 @@
+from __future__ import annotations
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import synthetic_program
+
+# Peak RSS of scanning + parsing a big generated script, materializing the
+# whole token list (`scanFast` + `parse`) against streaming it
+# (`scanIter` + `parseIter`, discarding each statement once parsed).
+#
+# Every mode runs in its own child process so the peak RSS is its own.
+#
+#     $ python -m benchmarks.streaming [megabytes]
+
+def run_mode(mode: str, path: str) -> None:
+    from scanner import scanFast, scanIter
+    from parser import parse, parseIter
+
+    source: str = open(path).read()
+    start : float = time.perf_counter()
+
+    if mode == "list":
+        count: int = len(parse(scanFast(source)))
+    else:
+        count: int = sum(1 for _ in parseIter(scanIter(source)))
+
+    took : float = time.perf_counter() - start
+    peak : int   = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"    {mode:<10}{count:>10} stmts {took:8.2f}s {peak / 1024:10.1f} MiB peak RSS")
+
+
+def main() -> None:
+    megabytes: float = float(sys.argv[1]) if len(sys.argv) > 1 else 100
+    # synthetic_program produces roughly 34 bytes per line.
+    lines    : int   = int(megabytes * 1e6 / 34)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".lox", delete=False) as f:
+        f.write(synthetic_program(lines))
+        path: str = f.name
+
+    try:
+        print(f"{os.path.getsize(path) / 1e6:.1f} MB of source")
+        for mode in ["list", "stream"]:
+            subprocess.run([sys.executable, "-m", "benchmarks.streaming", "--child", mode, path],
+                           check=True)
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        run_mode(sys.argv[2], sys.argv[3])
+    else:
+        main()
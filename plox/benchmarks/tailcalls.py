@@ -0,0 +1,67 @@
+from __future__ import annotations
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.common import quietly
+
+# A million iterations written as tail recursion against the same loop as
+# a `while`. Without tail calls the recursive version dies at python's
+# recursion limit (tree, closure) or keeps a million frames (vm).
+#
+# Every run gets its own child process so the peak RSS is its own.
+#
+#     $ python -m benchmarks.tailcalls [iterations]
+
+SCRIPTS: dict[str, str] = {
+    "tail recursion": """
+fun loop(n, acc) {
+    if (n == 0) return acc;
+    return loop(n - 1, acc + 1);
+}
+print(loop({n}, 0));
+""",
+    "while loop": """
+var n   = {n};
+var acc = 0;
+while (n > 0) {
+    acc = acc + 1;
+    n   = n - 1;
+}
+print(acc);
+""",
+}
+
+
+def run_child(backend: str, name: str, n: int) -> None:
+    from scanner import scan
+    from parser import parse
+    from interpreter import interpret
+
+    source: str   = SCRIPTS[name].replace("{n}", str(n))
+    start : float = time.perf_counter()
+    out   : str   = quietly(lambda: interpret(parse(scan(source)), backend))
+    took  : float = time.perf_counter() - start
+    peak  : int   = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    assert float(out) == n, out
+    print(f"    {backend:<10}{name:<18}{took:8.2f}s {peak / 1024:8.1f} MiB peak RSS")
+
+
+def main() -> None:
+    from interpreter import BACKENDS
+
+    n: int = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"{n} iterations")
+    for backend in BACKENDS:
+        for name in SCRIPTS:
+            subprocess.run([sys.executable, "-m", "benchmarks.tailcalls",
+                            "--child", backend, name, str(n)], check=True)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        run_child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
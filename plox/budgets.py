@@ -0,0 +1,165 @@
+from __future__ import annotations
+import gc
+import sys
+import time
+import weakref
+from dataclasses import dataclass
+
+from errors import LoxError
+
+# Limits for running scripts you don't trust.
+#
+#     interpret(stmts, budget=Budget(maxNodes=1_000_000, seconds=0.5))
+#
+# Going over any of them raises `BudgetExceeded` out of `interpret`, on
+# every backend, and leaves the `Interp` fit to run something else.
+#
+# Counting nodes as they are evaluated would cost every node, and the
+# closure and VM backends don't evaluate nodes one at a time anyway.
+# Instead the resolver counts the nodes in each loop and function body
+# (`While.cost`, `ForIn.cost`, `Function.cost`) and every iteration or call
+# is charged that much up front: an upper bound on what runs, since both
+# branches of an `if` are charged. Top-level code outside of loops is free,
+# it can't run for longer than the program is long.
+#
+# The charges come out of `interp.fuel`. Only when that runs out does
+# `refuel` add up what was spent, look at the clock and hand out at most
+# `CHECK_INTERVAL` more, so a loop iteration or call pays a subtraction and
+# a compare, budget or not.
+#
+# Calls keep `interp.depth` up to date, but only `refuel` compares it with
+# `interp.maxDepth`. It never hands out more fuel than there are calls left
+# before `maxDepth`, and every call costs at least one, so the call that
+# goes too deep is always one that runs out of fuel. A call at `maxDepth`
+# has none left to hand out, so it is stopped as soon as it loops or calls
+# rather than refuelling on every step.
+#
+# Live instances are counted by the `Meter` of the `Interp` that made
+# them: `LoxClass.call` and the VM hand each new instance to `allocated`,
+# which keeps a weak reference to it until it dies. Instances made before
+# the budget started don't count. Over the limit, garbage cycles are
+# collected before giving up, the whole heap at most once every
+# `CHECK_INTERVAL` instances, so a program sitting at its limit can go
+# over by that many before the next collection stops it.
+#
+# A single call to a native isn't interrupted, so `range(1e9)` still takes
+# as long as it takes.
+
+# Nodes between two looks at the clock, roughly a millisecond of running
+# with the tree-walker. Without a budget `refuel` hands out the same, as
+# subtracting from a small int is quicker than from something like
+# `sys.maxsize`.
+CHECK_INTERVAL: int = 1000
+
+@dataclass
+class Budget:
+    # None for no limit.
+    maxNodes    : int   = None
+    seconds     : float = None
+    maxInstances: int   = None
+    maxDepth    : int   = None
+
+class BudgetExceeded(LoxError):
+    tag = "budget-error"
+    # Which limit it was: "nodes", "seconds", "instances" or "depth".
+    limit: str
+
+    def __init__(self, limit: str, message: str):
+        super().__init__(message)
+        self.limit = limit
+
+# What a running budget has used up, kept in `interp.budget`.
+class Meter:
+    __slots__ = ("budget", "spent", "granted", "deadline", "depth", "live", "collectIn")
+
+    budget   : Budget
+    spent    : int
+    # What `interp.fuel` was last set to.
+    granted  : int
+    deadline : float
+    # `interp.depth` when the budget started.
+    depth    : int
+    # Weak references to the instances made under a budget with
+    # `maxInstances`, each dropping out of the set when its instance dies.
+    live     : set[weakref.ref]
+    # Instances over the limit still to be let through before the whole heap
+    # may be collected again.
+    collectIn: int
+
+    def __init__(self, budget: Budget, depth: int):
+        self.budget    = budget
+        self.spent     = 0
+        self.granted   = 0
+        self.deadline  = None if budget.seconds is None else time.monotonic() + budget.seconds
+        self.depth     = depth
+        self.live      = None if budget.maxInstances is None else set()
+        self.collectIn = 0
+
+
+def start(interp, budget: Budget) -> None:
+    meter: Meter = Meter(budget, interp.depth)
+    interp.budget   = meter
+    interp.maxDepth = sys.maxsize if budget.maxDepth is None else interp.depth + budget.maxDepth
+    # Nothing spent or granted yet, the first charge refuels.
+    interp.fuel = 0
+
+def stop(interp) -> None:
+    meter: Meter = interp.budget
+    if meter is None:
+        return
+
+    if meter.live is not None:
+        meter.live.clear()
+    # An exceeded budget leaves the calls it stopped in behind.
+    interp.depth    = meter.depth
+    interp.maxDepth = sys.maxsize
+    interp.budget   = None
+    interp.fuel     = CHECK_INTERVAL
+
+# Called once `interp.fuel` has gone below zero.
+def refuel(interp) -> None:
+    meter: Meter = interp.budget
+    if meter is None:
+        interp.fuel = CHECK_INTERVAL
+        return
+
+    budget: Budget = meter.budget
+    meter.spent += meter.granted - interp.fuel
+
+    if budget.maxNodes is not None and meter.spent > budget.maxNodes:
+        raise BudgetExceeded("nodes", f"evaluated more than {budget.maxNodes} nodes")
+    if meter.deadline is not None and time.monotonic() > meter.deadline:
+        raise BudgetExceeded("seconds", f"ran for more than {budget.seconds} seconds")
+    if interp.depth >= interp.maxDepth:
+        raise BudgetExceeded("depth", f"calls nested {budget.maxDepth} deep")
+
+    grant: int = CHECK_INTERVAL
+    if budget.maxNodes is not None:
+        grant = min(grant, budget.maxNodes - meter.spent)
+    if budget.maxDepth is not None:
+        grant = min(grant, interp.maxDepth - interp.depth)
+    interp.fuel = meter.granted = grant
+
+# Called with each instance made while `interp.budget` is set.
+def allocated(interp, instance: object) -> None:
+    meter: Meter = interp.budget
+    live : set[weakref.ref] = meter.live
+    if live is None:
+        return
+
+    live.add(weakref.ref(instance, live.discard))
+    limit: int = meter.budget.maxInstances
+    if len(live) > limit:
+        # Instances only kept alive by cycles don't count. Those are nearly
+        # always young, so the whole heap is only collected when collecting
+        # the young generation didn't free enough.
+        gc.collect(0)
+        if len(live) <= limit:
+            return
+        if meter.collectIn > 0:
+            meter.collectIn -= 1
+            return
+        gc.collect()
+        meter.collectIn = CHECK_INTERVAL
+        if len(live) > limit:
+            raise BudgetExceeded("instances", f"more than {limit} live instances")
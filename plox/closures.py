@@ -0,0 +1,613 @@
+from __future__ import annotations
+import operator
+from dataclasses import dataclass
+from typing import Callable
+
+from environment import Environment
+from errors import LoxError, LoxRuntimeError
+from expr import *
+from stmt import *
+from tokens import Token, TokenType
+from containers import LoxList, LoxMap
+import budgets
+import operators
+from interpreter import (Interp, LoxClass, LoxFunction, LoxInstance,
+                         RETURNING, arityError, callOf, findFieldCached,
+                         findMethodCached, getIndex, isTruthy, iterate,
+                         setFieldCached, setIndex)
+
+# Closure compilation.
+#
+# `evaluate` has to walk its `isinstance` ladder every time it visits a
+# node. Here we walk the tree exactly once, up front, and turn every node
+# into a Python closure that already knows what kind of node it is and
+# holds its children's closures. Running the program is then just calling
+# those closures, e.g. a `Binary` MINUS node becomes
+#
+#     lambda interp: operators.subtract(left(interp), right(interp))
+#
+# The semantics are meant to match `evaluate` exactly, quirks included,
+# so the tree-walker can keep serving as the reference implementation.
+
+Code = Callable[[Interp], object]
+
+
+def compile_program(stmts: list[Stmt]) -> list[Code]:
+    return [compile_node(stmt) for stmt in stmts]
+
+def run(interp: Interp, code: list[Code]) -> None:
+    for c in code:
+        c(interp)
+
+def compile_node(node: Stmt | Expr) -> Code:
+    compiler = COMPILERS.get(type(node))
+
+    if compiler is None:
+        raise LoxError(f"unimplemented expression: `{node}`", "compiler-error")
+
+    return compiler(node)
+
+
+# ------------- Functions
+
+@dataclass
+class CompiledFunction(LoxFunction):
+    code: list[Code]
+
+    # Loops for tail calls like `LoxFunction.callIn`, see `compile_tail_call`.
+    def callIn(self, interp: Interp, closure: Environment, arguments: list[object]) -> object:
+        function: CompiledFunction = self
+
+        while True:
+            declaration: Function = function.declaration
+            if len(arguments) != len(declaration.params):
+                raise arityError(len(declaration.params), len(arguments))
+
+            frame: list[object] = [None] * declaration.frameSize
+            frame[:len(arguments)] = arguments
+
+            environment: Environment = closure
+            if declaration.scopeSize:
+                environment = Environment(closure, declaration.scopeSize)
+                for i, slot in declaration.capturedParams:
+                    environment.slots[slot] = arguments[i]
+
+            previous: list[object] = interp.frame
+            interp.depth += 1
+            try:
+                interp.fuel -= declaration.cost
+                if interp.fuel < 0:
+                    budgets.refuel(interp)
+                interp.frame = frame
+                returned: bool = run_block(interp, function.code, environment) is RETURNING
+            finally:
+                interp.frame = previous
+                interp.depth -= 1
+
+            if function.isInitializer:
+                return closure.slots[0]
+
+            if not returned:
+                return None
+            if interp.tailCall is None:
+                return interp.returnValue
+
+            function, closure, arguments = interp.tailCall
+            interp.tailCall = None
+
+    def bind(self, instance: LoxInstance) -> CompiledFunction:
+        environment: Environment = Environment(self.closure, 1)
+        environment.slots[0] = instance
+        return CompiledFunction(self.declaration, environment,
+                                self.isInitializer, self.code)
+
+
+# Statements follow the same protocol as in the tree-walker: they return
+# `RETURNING` after a `return` ran, and that has to be passed up.
+def run_block(interp: Interp, code: list[Code], environment: Environment) -> object:
+    previous: Environment = interp.environment
+
+    try:
+        interp.environment = environment
+
+        for c in code:
+            if c(interp) is RETURNING:
+                return RETURNING
+        return None
+    finally:
+        interp.environment = previous
+
+
+# ------------- Statements
+
+def compile_expr_stmt(stmt: Expression) -> Code:
+    expression: Code = compile_node(stmt.expression)
+
+    def run_expr_stmt(interp: Interp) -> None:
+        expression(interp)
+    return run_expr_stmt
+
+# Returns a function storing a declared value: in the frame or its
+# environment slot for locals, by name for globals.
+def compile_declare(stmt: Var | Function | Class) -> Callable[[Interp, object], None]:
+    name     : str = stmt.name.lexeme
+    slot     : int = stmt.slot
+    frameSlot: int = stmt.frameSlot
+
+    if frameSlot is not None:
+        def declare_frame(interp: Interp, value: object) -> None:
+            interp.frame[frameSlot] = value
+        return declare_frame
+
+    if slot is None:
+        def declare_global(interp: Interp, value: object) -> None:
+            interp.globals.define(name, value)
+        return declare_global
+
+    def declare_local(interp: Interp, value: object) -> None:
+        interp.environment.slots[slot] = value
+    return declare_local
+
+def compile_var_stmt(stmt: Var) -> Code:
+    declare = compile_declare(stmt)
+
+    if stmt.initializer is None:
+        def run_var_stmt(interp: Interp) -> None:
+            declare(interp, None)
+        return run_var_stmt
+
+    initializer: Code = compile_node(stmt.initializer)
+
+    def run_var_init_stmt(interp: Interp) -> None:
+        declare(interp, initializer(interp))
+    return run_var_init_stmt
+
+def compile_block_stmt(stmt: Block) -> Code:
+    code: list[Code] = [compile_node(s) for s in stmt.statements]
+    size: int = stmt.scopeSize
+
+    if size == 0:
+        def run_unscoped_block_stmt(interp: Interp) -> object:
+            for statement in code:
+                if statement(interp) is RETURNING:
+                    return RETURNING
+            return None
+        return run_unscoped_block_stmt
+
+    def run_block_stmt(interp: Interp) -> object:
+        return run_block(interp, code, Environment(interp.environment, size))
+    return run_block_stmt
+
+def compile_if_stmt(stmt: If) -> Code:
+    condition : Code = compile_node(stmt.condition)
+    thenBranch: Code = compile_node(stmt.thenBranch)
+
+    if stmt.elseBranch is None:
+        def run_if_stmt(interp: Interp) -> object:
+            if isTruthy(condition(interp)):
+                return thenBranch(interp)
+            return None
+        return run_if_stmt
+
+    elseBranch: Code = compile_node(stmt.elseBranch)
+
+    def run_if_else_stmt(interp: Interp) -> object:
+        if isTruthy(condition(interp)):
+            return thenBranch(interp)
+        return elseBranch(interp)
+    return run_if_else_stmt
+
+def compile_while_stmt(stmt: While) -> Code:
+    condition: Code = compile_node(stmt.condition)
+    body     : Code = compile_node(stmt.body)
+    cost     : int  = stmt.cost
+
+    def run_while_stmt(interp: Interp) -> object:
+        while isTruthy(condition(interp)):
+            interp.fuel -= cost
+            if interp.fuel < 0:
+                budgets.refuel(interp)
+            if body(interp) is RETURNING:
+                return RETURNING
+        return None
+    return run_while_stmt
+
+def compile_forin_stmt(stmt: ForIn) -> Code:
+    iterable: Code = compile_node(stmt.iterable)
+    body    : Code = compile_node(stmt.body)
+    slot    : int  = stmt.slot
+    size    : int  = stmt.scopeSize
+    cost    : int  = stmt.cost
+
+    if size == 0:
+        frameSlot: int = stmt.frameSlot
+
+        def run_forin_frame_stmt(interp: Interp) -> object:
+            frame: list[object] = interp.frame
+            for value in iterate(iterable(interp)):
+                interp.fuel -= cost
+                if interp.fuel < 0:
+                    budgets.refuel(interp)
+                frame[frameSlot] = value
+                if body(interp) is RETURNING:
+                    return RETURNING
+            return None
+        return run_forin_frame_stmt
+
+    def run_forin_stmt(interp: Interp) -> object:
+        values     = iterate(iterable(interp))
+        environment: Environment = Environment(interp.environment, size)
+        previous   : Environment = interp.environment
+
+        try:
+            interp.environment = environment
+            for value in values:
+                interp.fuel -= cost
+                if interp.fuel < 0:
+                    budgets.refuel(interp)
+                environment.slots[slot] = value
+                if body(interp) is RETURNING:
+                    return RETURNING
+            return None
+        finally:
+            interp.environment = previous
+    return run_forin_stmt
+
+def compile_return_stmt(stmt: Return) -> Code:
+    if stmt.value is None:
+        def run_return_stmt(interp: Interp) -> object:
+            interp.returnValue = None
+            return RETURNING
+        return run_return_stmt
+
+    if stmt.tailCall:
+        return compile_tail_call(stmt.value)
+
+    value: Code = compile_node(stmt.value)
+
+    def run_return_value_stmt(interp: Interp) -> object:
+        interp.returnValue = value(interp)
+        return RETURNING
+    return run_return_value_stmt
+
+# Same as `eval_tail_call`.
+def compile_tail_call(expr: Call) -> Code:
+    arguments: list[Code] = [compile_node(a) for a in expr.arguments]
+
+    def tail_call(interp: Interp, callee: object, this: Environment) -> object:
+        args: list[object] = [a(interp) for a in arguments]
+
+        if callee.__class__ is CompiledFunction and not callee.isInitializer:
+            interp.tailCall = (callee, this if this is not None else callee.closure, args)
+        elif this is not None:
+            interp.returnValue = callee.callIn(interp, this, args)
+        else:
+            interp.returnValue = callOf(callee)(interp, args)
+        return RETURNING
+
+    if not isinstance(expr.callee, Get):
+        callee_: Code = compile_node(expr.callee)
+
+        def run_tail_call(interp: Interp) -> object:
+            return tail_call(interp, callee_(interp), None)
+        return run_tail_call
+
+    get    : Get  = expr.callee
+    object_: Code = compile_node(get.object)
+
+    def run_tail_invoke(interp: Interp) -> object:
+        obj: object = object_(interp)
+        if not isinstance(obj, LoxInstance):
+            raise LoxRuntimeError(f"only instances have properties: `{obj}`")
+
+        slot: int = findFieldCached(get, obj)
+        if slot is not None:
+            return tail_call(interp, obj.values[slot], None)
+
+        method: CompiledFunction = findMethodCached(get, obj)
+        this  : Environment      = Environment(method.closure, 1)
+        this.slots[0] = obj
+        return tail_call(interp, method, this)
+    return run_tail_invoke
+
+def compile_fun_stmt(stmt: Function) -> Code:
+    declare = compile_declare(stmt)
+    code: list[Code] = [compile_node(s) for s in stmt.body]
+
+    def run_fun_stmt(interp: Interp) -> None:
+        declare(interp, CompiledFunction(stmt, interp.environment, False, code))
+    return run_fun_stmt
+
+def compile_class_stmt(stmt: Class) -> Code:
+    name: str = stmt.name.lexeme
+    declare = compile_declare(stmt)
+    methods: list[tuple[Function, list[Code]]] = [
+        (method, [compile_node(s) for s in method.body])
+        for method in stmt.methods
+    ]
+
+    def run_class_stmt(interp: Interp) -> None:
+        funs: dict[str, LoxFunction] = {}
+        for method, code in methods:
+            funs[method.name.lexeme] = CompiledFunction(method,
+                                                        interp.environment,
+                                                        method.name.lexeme == "init",
+                                                        code)
+
+        declare(interp, LoxClass(name, funs))
+    return run_class_stmt
+
+
+# ------------- Expressions
+
+def compile_literal(expr: Literal) -> Code:
+    value: object = expr.value
+    return lambda interp: value
+
+def compile_grouping(expr: Grouping) -> Code:
+    return compile_node(expr.expression)
+
+def compile_variable(expr: Variable) -> Code:
+    if expr.frameSlot is not None:
+        frameSlot: int = expr.frameSlot
+        return lambda interp: interp.frame[frameSlot]
+    return compile_look_up(expr.name, expr)
+
+def compile_this_expr(expr: This) -> Code:
+    return compile_look_up(expr.keyword, expr)
+
+# The common depths get their own closures so they don't have to loop
+# through `ancestor`.
+def compile_look_up(name: Token, expr: Variable | This) -> Code:
+    depth: int = expr.depth
+    slot : int = expr.slot
+
+    match depth:
+        case None:
+            return lambda interp: interp.globals.get(name)
+        case 0:
+            return lambda interp: interp.environment.slots[slot]
+        case 1:
+            return lambda interp: interp.environment.enclosing.slots[slot]
+        case 2:
+            return lambda interp: interp.environment.enclosing.enclosing.slots[slot]
+        case _:
+            return lambda interp: interp.environment.ancestor(depth).slots[slot]
+
+def compile_assign(expr: Assign) -> Code:
+    name : Token = expr.name
+    value: Code  = compile_node(expr.value)
+    depth: int   = expr.depth
+    slot : int   = expr.slot
+
+    if expr.frameSlot is not None:
+        frameSlot: int = expr.frameSlot
+
+        def run_assign_frame(interp: Interp) -> object:
+            v: object = value(interp)
+            interp.frame[frameSlot] = v
+            return v
+        return run_assign_frame
+
+    if depth is None:
+        def run_assign_global(interp: Interp) -> object:
+            v: object = value(interp)
+            interp.globals.assign(name, v)
+            return v
+        return run_assign_global
+
+    def run_assign(interp: Interp) -> object:
+        v: object = value(interp)
+        interp.environment.ancestor(depth).slots[slot] = v
+        return v
+    return run_assign
+
+def compile_logical(expr: Logical) -> Code:
+    left : Code = compile_node(expr.left)
+    right: Code = compile_node(expr.right)
+
+    if expr.operator.type == TokenType.OR:
+        def run_or(interp: Interp) -> object:
+            l: object = left(interp)
+            if isTruthy(l):
+                return l
+            return right(interp)
+        return run_or
+
+    def run_and(interp: Interp) -> object:
+        l: object = left(interp)
+        if not isTruthy(l):
+            return l
+        return right(interp)
+    return run_and
+
+def compile_unary(expr: Unary) -> Code:
+    right: Code = compile_node(expr.expr)
+
+    match expr.operator.type:
+        case TokenType.MINUS:
+            return lambda interp: operators.negate(right(interp))
+        case TokenType.BANG:
+            return lambda interp: not isTruthy(right(interp))
+        case _:
+            raise LoxRuntimeError(f"unknown unary operator: `{expr.operator.lexeme}`")
+
+# Arithmetic and comparisons check for floats right in the node's closure
+# and only call into operators.py for anything else. When the right operand
+# is a number literal (`n - 1`, `i < 10`) only the left one needs checking.
+FLOAT_OPS: dict[TokenType, Callable[[float, float], object]] = {
+    TokenType.PLUS         : operator.add,
+    TokenType.MINUS        : operator.sub,
+    TokenType.STAR         : operator.mul,
+    TokenType.SLASH        : operators.divide,
+    TokenType.GREATER      : operator.gt,
+    TokenType.GREATER_EQUAL: operator.ge,
+    TokenType.LESS         : operator.lt,
+    TokenType.LESS_EQUAL   : operator.le,
+}
+
+def compile_binary(expr: Binary) -> Code:
+    left : Code = compile_node(expr.left)
+    right: Code = compile_node(expr.right)
+    op   : BinaryOp = expr.op
+
+    if op is None:
+        lexeme: str = expr.operator.lexeme
+        def run_unknown_binary(interp: Interp) -> object:
+            left(interp)
+            right(interp)
+            raise LoxRuntimeError(f"unknown binary operator: `{lexeme}`")
+        return run_unknown_binary
+
+    fast = FLOAT_OPS.get(expr.operator.type)
+    if fast is not None and isinstance(expr.right, Literal) and \
+            expr.right.value.__class__ is float:
+        constant: float = expr.right.value
+
+        def run_binary_constant(interp: Interp) -> object:
+            l: object = left(interp)
+            if l.__class__ is float:
+                return fast(l, constant)
+            return op(l, constant)
+        return run_binary_constant
+
+    if fast is not None:
+        def run_binary_float(interp: Interp) -> object:
+            l: object = left(interp)
+            r: object = right(interp)
+            if l.__class__ is float and r.__class__ is float:
+                return fast(l, r)
+            return op(l, r)
+        return run_binary_float
+
+    return lambda interp: op(left(interp), right(interp))
+
+def compile_call_expr(expr: Call) -> Code:
+    if isinstance(expr.callee, Get):
+        return compile_invoke_expr(expr, expr.callee)
+
+    callee   : Code       = compile_node(expr.callee)
+    arguments: list[Code] = [compile_node(a) for a in expr.arguments]
+
+    def run_call_expr(interp: Interp) -> object:
+        fun: object = callee(interp)
+        return callOf(fun)(interp, [a(interp) for a in arguments])
+    return run_call_expr
+
+# Same inline caches and `invoke` path as the tree-walker, see
+# `findFieldCached`, `findMethodCached` and `eval_invoke_expr`.
+def compile_invoke_expr(expr: Call, get: Get) -> Code:
+    object_  : Code       = compile_node(get.object)
+    arguments: list[Code] = [compile_node(a) for a in expr.arguments]
+
+    def run_invoke_expr(interp: Interp) -> object:
+        obj: object = object_(interp)
+        if not isinstance(obj, LoxInstance):
+            raise LoxRuntimeError(f"only instances have properties: `{obj}`")
+
+        slot: int = findFieldCached(get, obj)
+        if slot is not None:
+            return callOf(obj.values[slot])(interp, [a(interp) for a in arguments])
+
+        method: CompiledFunction = findMethodCached(get, obj)
+        return method.invoke(interp, obj, [a(interp) for a in arguments])
+    return run_invoke_expr
+
+def compile_get_expr(expr: Get) -> Code:
+    object_: Code = compile_node(expr.object)
+
+    def run_get_expr(interp: Interp) -> object:
+        obj: object = object_(interp)
+        if not isinstance(obj, LoxInstance):
+            raise LoxRuntimeError(f"only instances have properties: `{obj}`")
+
+        slot: int = findFieldCached(expr, obj)
+        if slot is not None:
+            return obj.values[slot]
+        return findMethodCached(expr, obj).bind(obj)
+    return run_get_expr
+
+def compile_set_expr(expr: Set) -> Code:
+    object_: Code = compile_node(expr.object)
+    value  : Code = compile_node(expr.value)
+
+    def run_set_expr(interp: Interp) -> object:
+        obj: object = object_(interp)
+        if not isinstance(obj, LoxInstance):
+            raise LoxRuntimeError("Only instances have fields.")
+
+        v: object = value(interp)
+        setFieldCached(expr, obj, v)
+        return v
+    return run_set_expr
+
+
+def compile_list_literal(expr: ListLiteral) -> Code:
+    elements: list[Code] = [compile_node(e) for e in expr.elements]
+
+    def run_list_literal(interp: Interp) -> object:
+        return LoxList([e(interp) for e in elements])
+    return run_list_literal
+
+def compile_map_literal(expr: MapLiteral) -> Code:
+    entries: list[tuple[Code, Code]] = [(compile_node(k), compile_node(v))
+                                        for k, v in zip(expr.keys, expr.values)]
+
+    def run_map_literal(interp: Interp) -> object:
+        result = LoxMap()
+        for key, value in entries:
+            setIndex(result, key(interp), value(interp))
+        return result
+    return run_map_literal
+
+def compile_index_expr(expr: Index) -> Code:
+    object_: Code = compile_node(expr.object)
+    index  : Code = compile_node(expr.index)
+
+    def run_index_expr(interp: Interp) -> object:
+        obj: object = object_(interp)
+        return getIndex(obj, index(interp))
+    return run_index_expr
+
+def compile_set_index_expr(expr: SetIndex) -> Code:
+    object_: Code = compile_node(expr.object)
+    index  : Code = compile_node(expr.index)
+    value  : Code = compile_node(expr.value)
+
+    def run_set_index_expr(interp: Interp) -> object:
+        obj: object = object_(interp)
+        key: object = index(interp)
+        val: object = value(interp)
+        setIndex(obj, key, val)
+        return val
+    return run_set_index_expr
+
+
+COMPILERS: dict[type, Callable[[Stmt | Expr], Code]] = {
+    Expression: compile_expr_stmt,
+    Var       : compile_var_stmt,
+    Block     : compile_block_stmt,
+    If        : compile_if_stmt,
+    While     : compile_while_stmt,
+    ForIn     : compile_forin_stmt,
+    Return    : compile_return_stmt,
+    Function  : compile_fun_stmt,
+    Class     : compile_class_stmt,
+
+    Literal   : compile_literal,
+    Grouping  : compile_grouping,
+    Variable  : compile_variable,
+    Assign    : compile_assign,
+    This      : compile_this_expr,
+    Logical   : compile_logical,
+    Unary     : compile_unary,
+    Binary    : compile_binary,
+    Call      : compile_call_expr,
+    Get       : compile_get_expr,
+    Set       : compile_set_expr,
+    Index     : compile_index_expr,
+    SetIndex  : compile_set_index_expr,
+
+    ListLiteral: compile_list_literal,
+    MapLiteral : compile_map_literal,
+}
@@ -0,0 +1,505 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from enum import IntEnum, auto
+
+from errors import LoxError
+from expr import *
+from stmt import *
+from tokens import Token, TokenType
+
+# Bytecode compiler.
+#
+# Turns the resolved AST (the output of `parse`, annotated by the `Resolver`)
+# into a flat list of ints, each instruction being an opcode followed by its
+# operands, plus a constant pool. vm.py runs the result.
+#
+# Variables keep the same scoping model as the tree-walker. Locals that no
+# inner function refers to live in the call's frame, which is kept on the
+# VM's value stack right above the callee. Scopes with captured locals get
+# an `Environment`, read from `depth` environments up, and anything else is
+# a global.
+
+class OpCode(IntEnum):
+    CONSTANT      = auto()  # [k]            push constants[k]
+    NIL           = auto()
+    TRUE          = auto()
+    FALSE         = auto()
+    POP           = auto()
+
+    DEFINE_GLOBAL = auto()  # [k]            globals[constants[k]] = pop
+    GET_GLOBAL    = auto()  # [k]            push globals[constants[k].lexeme]
+    SET_GLOBAL    = auto()  # [k]            globals[constants[k].lexeme] = peek
+    DEFINE_LOCAL  = auto()  # [slot]         env.slots[slot] = pop
+    GET_LOCAL     = auto()  # [depth, slot]  push ancestor(depth).slots[slot]
+    SET_LOCAL     = auto()  # [depth, slot]  ancestor(depth).slots[slot] = peek
+    DEFINE_FRAME  = auto()  # [slot]         frame[slot] = pop
+    GET_FRAME     = auto()  # [slot]         push frame[slot]
+    SET_FRAME     = auto()  # [slot]         frame[slot] = peek
+    GET_PROPERTY  = auto()  # [k]            push pop.get(constants[k])
+    SET_PROPERTY  = auto()  # [k]            value = pop, pop.set(constants[k], value)
+    GET_INDEX     = auto()  #                index = pop, push pop[index]
+    SET_INDEX     = auto()  #                value = pop, index = pop, pop[index] = value, push value
+    BUILD_LIST    = auto()  # [n]            push a list of the top n values
+    BUILD_MAP     = auto()  # [n]            push a map of the top n key, value pairs
+
+    EQUAL         = auto()
+    NOT_EQUAL     = auto()
+    GREATER       = auto()
+    GREATER_EQUAL = auto()
+    LESS          = auto()
+    LESS_EQUAL    = auto()
+    ADD           = auto()
+    SUBTRACT      = auto()
+    MULTIPLY      = auto()
+    DIVIDE        = auto()
+    NOT           = auto()
+    NEGATE        = auto()
+
+    JUMP          = auto()  # [target]
+    JUMP_IF_FALSE = auto()  # [target]       jumps if peek is falsey, no pop
+    JUMP_IF_TRUE  = auto()  # [target]       jumps if peek is truthy, no pop
+    LOOP          = auto()  # [target, cost] jump back to target, charging cost to the budget
+    ITERATE       = auto()  #                replace peek with an iterator over it
+    FOR_ITER      = auto()  # [target]       push the iterator's next value, or jump once it's done
+
+    PUSH_SCOPE    = auto()  # [size]
+    POP_SCOPE     = auto()
+
+    CALL          = auto()  # [argc]
+    INVOKE        = auto()  # [k, argc]      call the method constants[k] of the receiver below the arguments
+    CLOSURE       = auto()  # [k]            push a function for constants[k]
+    CLASS         = auto()  # [k]            push an empty class named constants[k]
+    METHOD        = auto()  # [k]            fun = pop, peek.methods[constants[k]] = fun
+    RETURN        = auto()
+
+# Number of operands following each opcode.
+OPERANDS: dict[OpCode, int] = {op: 0 for op in OpCode} | {
+    OpCode.CONSTANT     : 1,
+    OpCode.DEFINE_GLOBAL: 1,
+    OpCode.GET_GLOBAL   : 1,
+    OpCode.SET_GLOBAL   : 1,
+    OpCode.DEFINE_LOCAL : 1,
+    OpCode.GET_LOCAL    : 2,
+    OpCode.SET_LOCAL    : 2,
+    OpCode.DEFINE_FRAME : 1,
+    OpCode.GET_FRAME    : 1,
+    OpCode.SET_FRAME    : 1,
+    OpCode.GET_PROPERTY : 1,
+    OpCode.SET_PROPERTY : 1,
+    OpCode.BUILD_LIST   : 1,
+    OpCode.BUILD_MAP    : 1,
+    OpCode.JUMP         : 1,
+    OpCode.JUMP_IF_FALSE: 1,
+    OpCode.JUMP_IF_TRUE : 1,
+    OpCode.LOOP         : 2,
+    OpCode.FOR_ITER     : 1,
+    OpCode.PUSH_SCOPE   : 1,
+    OpCode.CALL         : 1,
+    OpCode.INVOKE       : 2,
+    OpCode.CLOSURE      : 1,
+    OpCode.CLASS        : 1,
+    OpCode.METHOD       : 1,
+}
+
+BINARY_OPCODES: dict[TokenType, OpCode] = {
+    TokenType.EQUAL_EQUAL  : OpCode.EQUAL,
+    TokenType.BANG_EQUAL   : OpCode.NOT_EQUAL,
+    TokenType.GREATER      : OpCode.GREATER,
+    TokenType.GREATER_EQUAL: OpCode.GREATER_EQUAL,
+    TokenType.LESS         : OpCode.LESS,
+    TokenType.LESS_EQUAL   : OpCode.LESS_EQUAL,
+    TokenType.PLUS         : OpCode.ADD,
+    TokenType.MINUS        : OpCode.SUBTRACT,
+    TokenType.STAR         : OpCode.MULTIPLY,
+    TokenType.SLASH        : OpCode.DIVIDE,
+}
+
+
+@dataclass
+class Chunk:
+    code     : list[int]    = field(default_factory=list)
+    constants: list[object] = field(default_factory=list)
+
+@dataclass
+class FunctionProto:
+    name          : str
+    params        : list[str]
+    chunk         : Chunk
+    isInitializer : bool = False
+    # Slots the call's environment needs, 0 for none.
+    scopeSize     : int  = 0
+    # See `Function`.
+    frameSize     : int  = 0
+    capturedParams: list[tuple[int, int]] = field(default_factory=list)
+    cost          : int  = 0
+
+    def __repr__(self):
+        return f"<fn `{self.name}`>"
+
+
+class CompilerState:
+    chunk   : Chunk
+    interned: dict[tuple[type, object], int]
+
+    def __init__(self, chunk: Chunk):
+        self.chunk    = chunk
+        self.interned = {}
+
+
+# With a `result` the script returns its value, instead of nil, once the
+# statements have run.
+def compile_program(stmts: list[Stmt], result: Expr = None) -> FunctionProto:
+    compiler = CompilerState(Chunk())
+
+    for stmt in stmts:
+        compile_node(compiler, stmt)
+
+    if result is not None:
+        compile_node(compiler, result)
+    else:
+        emit(compiler, OpCode.NIL)
+    emit(compiler, OpCode.RETURN)
+    return FunctionProto("script", [], compiler.chunk)
+
+def compile_node(compiler: CompilerState, node: Stmt | Expr) -> None:
+    if isinstance(node, Expression):
+        compile_node(compiler, node.expression)
+        emit(compiler, OpCode.POP)
+    elif isinstance(node, Var):
+        compile_var_stmt(compiler, node)
+    elif isinstance(node, Block):
+        compile_block_stmt(compiler, node)
+    elif isinstance(node, If):
+        compile_if_stmt(compiler, node)
+    elif isinstance(node, While):
+        compile_while_stmt(compiler, node)
+    elif isinstance(node, Return):
+        compile_return_stmt(compiler, node)
+    elif isinstance(node, ForIn):
+        compile_forin_stmt(compiler, node)
+    elif isinstance(node, Function):
+        compile_fun_stmt(compiler, node)
+    elif isinstance(node, Class):
+        compile_class_stmt(compiler, node)
+
+    elif isinstance(node, Literal):
+        compile_literal(compiler, node)
+    elif isinstance(node, Grouping):
+        compile_node(compiler, node.expression)
+    elif isinstance(node, Variable):
+        compile_get_variable(compiler, node, node.name)
+    elif isinstance(node, This):
+        compile_get_variable(compiler, node, node.keyword)
+    elif isinstance(node, Assign):
+        compile_node(compiler, node.value)
+        compile_set_variable(compiler, node, node.name)
+    elif isinstance(node, Logical):
+        compile_logical(compiler, node)
+    elif isinstance(node, Unary):
+        compile_unary(compiler, node)
+    elif isinstance(node, Binary):
+        compile_binary(compiler, node)
+    elif isinstance(node, Call):
+        compile_call_expr(compiler, node)
+    elif isinstance(node, Get):
+        compile_node(compiler, node.object)
+        emit(compiler, OpCode.GET_PROPERTY, constant(compiler, node.name))
+    elif isinstance(node, Set):
+        compile_node(compiler, node.object)
+        compile_node(compiler, node.value)
+        emit(compiler, OpCode.SET_PROPERTY, constant(compiler, node.name))
+    elif isinstance(node, Index):
+        compile_node(compiler, node.object)
+        compile_node(compiler, node.index)
+        emit(compiler, OpCode.GET_INDEX)
+    elif isinstance(node, SetIndex):
+        compile_node(compiler, node.object)
+        compile_node(compiler, node.index)
+        compile_node(compiler, node.value)
+        emit(compiler, OpCode.SET_INDEX)
+    elif isinstance(node, ListLiteral):
+        for element in node.elements:
+            compile_node(compiler, element)
+        emit(compiler, OpCode.BUILD_LIST, len(node.elements))
+    elif isinstance(node, MapLiteral):
+        for key, value in zip(node.keys, node.values):
+            compile_node(compiler, key)
+            compile_node(compiler, value)
+        emit(compiler, OpCode.BUILD_MAP, len(node.keys))
+    else:
+        raise LoxError(f"unimplemented expression: `{node}`", "compiler-error")
+
+
+# ------------- Statements
+
+def compile_var_stmt(compiler: CompilerState, stmt: Var) -> None:
+    if stmt.initializer is not None:
+        compile_node(compiler, stmt.initializer)
+    else:
+        emit(compiler, OpCode.NIL)
+
+    compile_define(compiler, stmt)
+
+def compile_block_stmt(compiler: CompilerState, stmt: Block) -> None:
+    if stmt.scopeSize == 0:
+        for s in stmt.statements:
+            compile_node(compiler, s)
+        return
+
+    emit(compiler, OpCode.PUSH_SCOPE, stmt.scopeSize)
+
+    for s in stmt.statements:
+        compile_node(compiler, s)
+
+    emit(compiler, OpCode.POP_SCOPE)
+
+def compile_if_stmt(compiler: CompilerState, stmt: If) -> None:
+    compile_node(compiler, stmt.condition)
+    thenJump: int = emit_jump(compiler, OpCode.JUMP_IF_FALSE)
+    emit(compiler, OpCode.POP)
+    compile_node(compiler, stmt.thenBranch)
+
+    elseJump: int = emit_jump(compiler, OpCode.JUMP)
+    patch_jump(compiler, thenJump)
+    emit(compiler, OpCode.POP)
+
+    if stmt.elseBranch is not None:
+        compile_node(compiler, stmt.elseBranch)
+    patch_jump(compiler, elseJump)
+
+def compile_while_stmt(compiler: CompilerState, stmt: While) -> None:
+    loopStart: int = len(compiler.chunk.code)
+
+    compile_node(compiler, stmt.condition)
+    exitJump: int = emit_jump(compiler, OpCode.JUMP_IF_FALSE)
+    emit(compiler, OpCode.POP)
+    compile_node(compiler, stmt.body)
+    emit(compiler, OpCode.LOOP, loopStart, stmt.cost)
+
+    patch_jump(compiler, exitJump)
+    emit(compiler, OpCode.POP)
+
+# The iterator stays on the stack for the whole loop, the loop variable
+# lives in the frame or in a scope of its own around the body.
+def compile_forin_stmt(compiler: CompilerState, stmt: ForIn) -> None:
+    compile_node(compiler, stmt.iterable)
+    emit(compiler, OpCode.ITERATE)
+    if stmt.scopeSize:
+        emit(compiler, OpCode.PUSH_SCOPE, stmt.scopeSize)
+
+    loopStart: int = len(compiler.chunk.code)
+    exitJump : int = emit_jump(compiler, OpCode.FOR_ITER)
+    compile_define(compiler, stmt)
+    compile_node(compiler, stmt.body)
+    emit(compiler, OpCode.LOOP, loopStart, stmt.cost)
+
+    patch_jump(compiler, exitJump)
+    if stmt.scopeSize:
+        emit(compiler, OpCode.POP_SCOPE)
+    emit(compiler, OpCode.POP)
+
+def compile_return_stmt(compiler: CompilerState, stmt: Return) -> None:
+    if stmt.value is not None:
+        compile_node(compiler, stmt.value)
+    else:
+        emit(compiler, OpCode.NIL)
+    emit(compiler, OpCode.RETURN)
+
+def compile_function(compiler: CompilerState, fun: Function,
+                     isInitializer: bool) -> FunctionProto:
+    inner = CompilerState(Chunk())
+
+    for stmt in fun.body:
+        compile_node(inner, stmt)
+
+    emit(inner, OpCode.NIL)
+    emit(inner, OpCode.RETURN)
+
+    return FunctionProto(fun.name.lexeme,
+                         [param.lexeme for param in fun.params],
+                         inner.chunk,
+                         isInitializer,
+                         fun.scopeSize,
+                         fun.frameSize,
+                         fun.capturedParams,
+                         fun.cost)
+
+def compile_fun_stmt(compiler: CompilerState, stmt: Function) -> None:
+    proto: FunctionProto = compile_function(compiler, stmt, False)
+    emit(compiler, OpCode.CLOSURE, constant(compiler, proto))
+    compile_define(compiler, stmt)
+
+def compile_class_stmt(compiler: CompilerState, stmt: Class) -> None:
+    emit(compiler, OpCode.CLASS, constant(compiler, stmt.name.lexeme))
+
+    for method in stmt.methods:
+        proto: FunctionProto = compile_function(compiler, method,
+                                                method.name.lexeme == "init")
+
+        emit(compiler, OpCode.CLOSURE, constant(compiler, proto))
+        emit(compiler, OpCode.METHOD, constant(compiler, method.name.lexeme))
+
+    compile_define(compiler, stmt)
+
+
+# ------------- Expressions
+
+def compile_literal(compiler: CompilerState, expr: Literal) -> None:
+    if expr.value is None:
+        emit(compiler, OpCode.NIL)
+    elif expr.value is True:
+        emit(compiler, OpCode.TRUE)
+    elif expr.value is False:
+        emit(compiler, OpCode.FALSE)
+    else:
+        emit(compiler, OpCode.CONSTANT, constant(compiler, expr.value))
+
+def compile_get_variable(compiler: CompilerState, expr: Variable | This, name: Token) -> None:
+    if isinstance(expr, Variable) and expr.frameSlot is not None:
+        emit(compiler, OpCode.GET_FRAME, expr.frameSlot)
+    elif expr.depth is None:
+        emit(compiler, OpCode.GET_GLOBAL, constant(compiler, name))
+    else:
+        emit(compiler, OpCode.GET_LOCAL, expr.depth, expr.slot)
+
+def compile_set_variable(compiler: CompilerState, expr: Assign, name: Token) -> None:
+    if expr.frameSlot is not None:
+        emit(compiler, OpCode.SET_FRAME, expr.frameSlot)
+    elif expr.depth is None:
+        emit(compiler, OpCode.SET_GLOBAL, constant(compiler, name))
+    else:
+        emit(compiler, OpCode.SET_LOCAL, expr.depth, expr.slot)
+
+# Neither slot set means the declaration was made at the top level.
+def compile_define(compiler: CompilerState, stmt: Var | Function | Class | ForIn) -> None:
+    if stmt.frameSlot is not None:
+        emit(compiler, OpCode.DEFINE_FRAME, stmt.frameSlot)
+    elif stmt.slot is None:
+        emit(compiler, OpCode.DEFINE_GLOBAL, constant(compiler, stmt.name.lexeme))
+    else:
+        emit(compiler, OpCode.DEFINE_LOCAL, stmt.slot)
+
+def compile_logical(compiler: CompilerState, expr: Logical) -> None:
+    compile_node(compiler, expr.left)
+
+    if expr.operator.type == TokenType.OR:
+        endJump: int = emit_jump(compiler, OpCode.JUMP_IF_TRUE)
+    else:
+        endJump: int = emit_jump(compiler, OpCode.JUMP_IF_FALSE)
+
+    emit(compiler, OpCode.POP)
+    compile_node(compiler, expr.right)
+    patch_jump(compiler, endJump)
+
+def compile_unary(compiler: CompilerState, expr: Unary) -> None:
+    compile_node(compiler, expr.expr)
+
+    match expr.operator.type:
+        case TokenType.MINUS:
+            emit(compiler, OpCode.NEGATE)
+        case TokenType.BANG:
+            emit(compiler, OpCode.NOT)
+        case _:
+            raise LoxError(f"unknown unary operator: `{expr.operator.lexeme}`", "compiler-error")
+
+def compile_binary(compiler: CompilerState, expr: Binary) -> None:
+    compile_node(compiler, expr.left)
+    compile_node(compiler, expr.right)
+
+    op: OpCode = BINARY_OPCODES.get(expr.operator.type)
+    if op is None:
+        raise LoxError(f"unknown token type for binary expressions: `{expr.operator.lexeme}`", "compiler-error")
+
+    emit(compiler, op)
+
+# `obj.name(...)` becomes a single INVOKE, so the VM can call the method
+# without making a bound function first.
+def compile_call_expr(compiler: CompilerState, expr: Call) -> None:
+    if isinstance(expr.callee, Get):
+        compile_node(compiler, expr.callee.object)
+    else:
+        compile_node(compiler, expr.callee)
+
+    for argument in expr.arguments:
+        compile_node(compiler, argument)
+
+    if isinstance(expr.callee, Get):
+        emit(compiler, OpCode.INVOKE, constant(compiler, expr.callee.name), len(expr.arguments))
+    else:
+        emit(compiler, OpCode.CALL, len(expr.arguments))
+
+
+# ----------- HELPERS
+
+def emit(compiler: CompilerState, op: OpCode, *operands: int) -> None:
+    compiler.chunk.code.append(int(op))
+    compiler.chunk.code.extend(operands)
+
+def emit_jump(compiler: CompilerState, op: OpCode) -> int:
+    emit(compiler, op, -1)
+    return len(compiler.chunk.code) - 1
+
+def patch_jump(compiler: CompilerState, offset: int) -> None:
+    compiler.chunk.code[offset] = len(compiler.chunk.code)
+
+def constant(compiler: CompilerState, value: object) -> int:
+    constants: list[object] = compiler.chunk.constants
+
+    # Only share entries for plain values, everything else (tokens,
+    # function protos) gets its own slot.
+    key: tuple[type, object] = (type(value), value)
+    if isinstance(value, float | str):
+        if key in compiler.interned:
+            return compiler.interned[key]
+        compiler.interned[key] = len(constants)
+
+    constants.append(value)
+    return len(constants) - 1
+
+def disassemble(chunk: Chunk, name: str = "script") -> None:
+    print(f"== {name} ==")
+
+    protos: list[FunctionProto] = []
+    i = 0
+    while i < len(chunk.code):
+        op: OpCode = OpCode(chunk.code[i])
+        operands: list[int] = chunk.code[i + 1: i + 1 + OPERANDS[op]]
+
+        text: str = f"{i:04} {op.name:<14}" + " ".join(str(o) for o in operands)
+        if op in (OpCode.CONSTANT, OpCode.DEFINE_GLOBAL, OpCode.GET_GLOBAL,
+                  OpCode.SET_GLOBAL, OpCode.GET_PROPERTY, OpCode.SET_PROPERTY,
+                  OpCode.CLOSURE, OpCode.CLASS, OpCode.METHOD, OpCode.INVOKE):
+            value: object = chunk.constants[operands[0]]
+            if isinstance(value, Token):
+                value = value.lexeme
+            if isinstance(value, FunctionProto):
+                protos.append(value)
+            text += f"  ({value!r})"
+        print(text)
+
+        i += 1 + OPERANDS[op]
+
+    for proto in protos:
+        print()
+        disassemble(proto.chunk, proto.name)
+
+
+if __name__ == "__main__":
+    import sys
+    from scanner import scan
+    from parser import parse
+    from resolver import Resolver, resolveStatements
+
+    def readFile(path: str) -> str:
+        f = open(path)
+        c = f.read()
+        f.close()
+        return c
+
+    path: str = sys.argv[1] if len(sys.argv) > 1 else "tests/test-script.txt"
+    stmts: list[Stmt] = parse(scan(readFile(path)))
+
+    resolver = Resolver()
+    resolveStatements(resolver, stmts)
+
+    disassemble(compile_program(stmts).chunk)
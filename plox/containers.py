@@ -0,0 +1,57 @@
+from __future__ import annotations
+from reprlib import recursive_repr
+
+from ropes import Rope
+
+# The list and map values the native library hands out.
+#
+# They are the python `list` and `dict` themselves, so natives work on them
+# at native speed, but like instances they are values with an identity:
+# `==` compares identity, and lists and maps can be used as map keys.
+#
+# A map doesn't hold its keys as they are: python takes `true`, `1` and
+# `1.0` for the same key, so booleans are kept tagged with their type,
+# the way `libffi.Memoized` tags its arguments. Keys go in through
+# `mapKey` and come back out through `loxKey`.
+
+class LoxList(list):
+    __eq__   = object.__eq__
+    __ne__   = object.__ne__
+    __hash__ = object.__hash__
+
+    @recursive_repr("[...]")
+    def __repr__(self):
+        return "[" + ", ".join(show(item) for item in self) + "]"
+
+    __str__ = __repr__
+
+class LoxMap(dict):
+    __eq__   = object.__eq__
+    __ne__   = object.__ne__
+    __hash__ = object.__hash__
+
+    @recursive_repr("{...}")
+    def __repr__(self):
+        return "{" + ", ".join(f"{show(loxKey(k))}: {show(v)}" for k, v in self.items()) + "}"
+
+    __str__ = __repr__
+
+# Elements print the way `print` prints them, except that strings are
+# quoted so `["a, b"]` and `["a", "b"]` can be told apart.
+def show(value: object) -> str:
+    if isinstance(value, str | Rope):
+        return f'"{value}"'
+    return str(value)
+
+# What a map stores for `key`: booleans tagged with their type, ropes as the
+# strings they stand for, anything else as it is.
+def mapKey(key: object) -> object:
+    if key.__class__ is bool:
+        return (bool, key)
+    if key.__class__ is Rope:
+        return str(key)
+    return key
+
+# The Lox value a stored key stands for.
+def loxKey(key: object) -> object:
+    return key[1] if key.__class__ is tuple else key
@@ -1,54 +1,55 @@
 from typing import Self
+from errors import LoxRuntimeError
 from tokens import Token
 
+# Locals live in `slots`, a fixed-size list indexed by the slot number the
+# resolver handed out, and are reached with `ancestor(depth).slots[slot]`.
+# Only the global environment (the one without an `enclosing`) keeps
+# variables by name in `values`, so the name based methods below are only
+# ever called on it.
 class Environment:
     values   : dict[str, object]
+    slots    : list[object]
     enclosing: Self
 
-    def __init__(self, enclosing: Self):
-        self.values = {}
+    def __init__(self, enclosing: Self, size: int = 0):
+        self.values = {} if enclosing is None else None
+        self.slots = [None] * size
         self.enclosing = enclosing
 
 
+    def ancestor(self, depth: int) -> Self:
+        environment: Environment = self
+        for _ in range(depth):
+            environment = environment.enclosing
+        return environment
+
     def define(self, name: str, value: object) -> None:
         self.values[name] = value
 
-    def assign(self, name: Token, value: object) -> bool:
+    def assign(self, name: Token, value: object) -> None:
         assert isinstance(name, Token)
-        if name.lexeme in self.values.keys():
-            self.values[name.lexeme] =  value
-            return
-
-        if self.enclosing:
-            self.enclosing.assign(name, value)
+        if name.lexeme in self.values:
+            self.values[name.lexeme] = value
             return
 
-        print(f"[environment-error] undefined variable: '{name.lexeme}'")
-        exit(1)
+        raise LoxRuntimeError(f"undefined variable: '{name.lexeme}'", "environment-error")
 
 
     # quick fix
     def gets(self, name: str) -> object:
         assert isinstance(name, str)
 
-        if name in self.values.keys():
-            return self.values.get(name)
-
-        if self.enclosing is not None:
-            return self.enclosing.gets(name)
+        if name in self.values:
+            return self.values[name]
 
-        print(f"[environment-error] undefined variable: `{name}`")
-        exit(1)
+        raise LoxRuntimeError(f"undefined variable: `{name}`", "environment-error")
 
     def get(self, name: Token) -> object:
         assert isinstance(name, Token)
 
-        if name.lexeme in self.values.keys():
-            return self.values.get(name.lexeme)
+        if name.lexeme in self.values:
+            return self.values[name.lexeme]
 
-        if self.enclosing is not None:
-            return self.enclosing.get(name)
+        raise LoxRuntimeError(f"undefined variable: `{name.lexeme}`", "environment-error")
 
-        print(f"[environment-error] undefined variable: `{name.lexeme}`")
-        exit(1)
-        
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+# What goes wrong in a Lox program, raised instead of printed so that a
+# host running many programs in one process (see program.py) can catch it
+# and carry on. The command line prints them as `[tag] message` and exits
+# with 1, the way every error used to be reported.
+#
+# Which class tells the embedder which stage failed; `tag` only keeps the
+# command line's output what it always was.
+
+class LoxError(Exception):
+    # What the command line prints in brackets before the message.
+    tag: str = "error"
+
+    def __init__(self, message: str, tag: str = None):
+        super().__init__(message)
+        if tag is not None:
+            self.tag = tag
+
+    # "[parser-error] Expect ';' after expression"
+    def report(self) -> str:
+        return f"[{self.tag}] {self}"
+
+class ScanError(LoxError):
+    tag = "scanner-error"
+
+class ParseError(LoxError):
+    tag = "parser-error"
+
+class ResolveError(LoxError):
+    tag = "resolver-error"
+
+# Anything that stops a program once it is running: undefined variables,
+# bad operands, errors from natives (`libffi.NativeError`).
+class LoxRuntimeError(LoxError):
+    tag = "interpreter-error"
@@ -1,90 +1,124 @@
 
 from tokens import Token, TokenType
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from operators import BinaryOp
+import operators
 
+# Every node is a slotted dataclass, so nodes carry no per-instance
+# `__dict__`. The base classes need empty `__slots__` for that to hold.
 class Expr:
-    pass
+    __slots__ = ()
 
-@dataclass
+@dataclass(slots=True)
 class This(Expr):
     keyword: Token
+    depth  : int = None
+    slot   : int = None
 
-    def __hash__(self):
-        return hash(f"__builtin_this{self.keyword.line}")
-
-@dataclass
+# `cachedField` is the interpreter's inline cache for the last instance
+# shape this node saw: (shape, the slot `name` is stored in, the shape to
+# move to when setting it adds a new field).
+@dataclass(slots=True)
 class Set(Expr):
-    object: object
-    name  : Token
-    value : Expr
-
-@dataclass
+    object     : object
+    name       : Token
+    value      : Expr
+    cachedField: tuple = (None, None, None)
+
+# Inline caches: (shape, the slot `name` is stored in on instances of that
+# shape, None if it's not a field), and the method it resolved to the last
+# time this node saw an instance of some class, as weak references
+# (class, method).
+@dataclass(slots=True)
 class Get(Expr):
-    object: object
-    name  : Token
+    object      : object
+    name        : Token
+    cachedField : tuple = (None, None)
+    cachedMethod: tuple = None
 
-@dataclass
+@dataclass(slots=True)
 class Call(Expr):
     callee: Expr
     paren    : Token
     arguments: list[Expr]
 
-    def __hash__(self):
-        return hash(f"__builtin_call.{self.paren.line}")
-
-@dataclass
+@dataclass(slots=True)
 class Logical(Expr):
     left: Expr
     operator: Token
     right: Expr
 
-    def __hash__(self):
-        return hash(f"__builtin_logical.{self.operator.line}")
-
-@dataclass
+@dataclass(slots=True)
 class Assign(Expr):
     name: Token
     value: Expr
-
-    def __hash__(self):
-        return hash(f"__builtin_assign.{self.name.line}")
-
-@dataclass
+    depth    : int = None
+    slot     : int = None
+    frameSlot: int = None
+
+# Filled in by the resolver. Locals of a function that no inner function
+# refers to live in the call's frame at `frameSlot`, every other local at
+# `slot` of the environment `depth` levels up. With neither set the
+# variable is a global.
+@dataclass(slots=True)
 class Variable(Expr):
-    name: Token
+    name     : Token
+    depth    : int = None
+    slot     : int = None
+    frameSlot: int = None
 
     def __repr__(self):
         return f"Variable({self.name.lexeme})"
 
-    def __hash__(self):
-        return hash(f"__builtin_variable.{self.name.line}")
-
-@dataclass
+# `op` is the function from operators.py for `operator`, looked up once
+# here rather than every time the node is evaluated.
+@dataclass(slots=True)
 class Binary(Expr):
     left: Expr
     operator: Token
     right: Expr
+    op   : BinaryOp = field(default=None, repr=False, compare=False)
 
-    def __hash__(self):
-        return hash(f"__builtin_binary.{self.operator.line}")
+    def __post_init__(self):
+        if self.op is None:
+            self.op = operators.BINARY.get(self.operator.type)
 
-@dataclass
+@dataclass(slots=True)
 class Grouping(Expr):
     expression: Expr
 
-    def __hash__(self):
-        # NOTE(tyler): Probably doesn't pass mustard
-        return hash(f"__builtin_grouping")
-
-@dataclass
+@dataclass(slots=True)
 class Literal(Expr):
     value: object
 
-    def __hash__(self):
-        # NOTE(tyler): Probably doesn't pass mustard
-        return hash(f"__builtin_literal.{self.value}")
-
-@dataclass
+@dataclass(slots=True)
 class Unary(Expr):
     operator: Token
-    expr: Expr
\ No newline at end of file
+    expr: Expr
+# `[a, b, c]`
+@dataclass(slots=True)
+class ListLiteral(Expr):
+    bracket : Token
+    elements: list[Expr]
+
+# `{key: value, ...}`, `keys[i]` goes with `values[i]`.
+@dataclass(slots=True)
+class MapLiteral(Expr):
+    brace : Token
+    keys  : list[Expr]
+    values: list[Expr]
+
+# `object[index]`
+@dataclass(slots=True)
+class Index(Expr):
+    object : Expr
+    bracket: Token
+    index  : Expr
+
+# `object[index] = value`
+@dataclass(slots=True)
+class SetIndex(Expr):
+    object : Expr
+    bracket: Token
+    index  : Expr
+    value  : Expr
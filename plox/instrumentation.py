@@ -0,0 +1,186 @@
+from __future__ import annotations
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+from environment import Environment
+from errors import LoxError
+from stmt import Stmt
+
+# Tracing hooks and counters for an embedded interpreter.
+#
+#     counters = instrument(interp, Hooks(callEnter=...))
+#     ...                       # run code with `interp`
+#     print(counters.nodesEvaluated)
+#     uninstrument(interp)
+#
+# The counters and hooks live in `interp.instrumentation`, so any number of
+# interpreters can be instrumented at once and each only counts its own
+# work.
+#
+# Like profiler.py this works by swapping things in the interpreter module
+# for counting versions: while any `Interp` of the module is instrumented,
+# its `evaluate`, `LoxFunction.callIn` and `LoxClass.call`, and the name
+# `Environment` it makes environments with. They hand the work of
+# uninstrumented interpreters straight to the originals. An environment
+# doesn't know its interpreter, so the counting `evaluate` notes on the
+# thread which one is running. Once the last one is uninstrumented the
+# originals go back, so the interpreter itself never checks whether it is
+# instrumented, and a process that never instruments anything runs
+# exactly the code it always did.
+#
+# Node and call hooks see what the tree-walker does, except that tail calls
+# run inside the call they return from and aren't reported as calls of
+# their own. The closure and VM backends would skip them, so an
+# instrumented `Interp` refuses to run on anything but the tree-walker
+# (see `interpreter.runBackend`).
+
+@dataclass
+class Counters:
+    nodesEvaluated     : int = 0
+    calls              : int = 0
+    environmentsCreated: int = 0
+    instancesCreated   : int = 0
+    # Python exceptions unwinding through `evaluate`, e.g. an
+    # `errors.LoxRuntimeError`. Each one is counted once, however far it goes.
+    exceptionsRaised   : int = 0
+
+@dataclass
+class Hooks:
+    callEnter : Callable[[object, list[object]], None] = None  # (function, arguments)
+    callExit  : Callable[[object, object], None]       = None  # (function, result)
+    statement : Callable[[Stmt], None]                 = None  # before it runs
+    allocation: Callable[[object], None]               = None  # new LoxInstance or Environment
+
+# What `interp.instrumentation` holds while instrumented.
+class Instrumentation:
+    __slots__ = ("counters", "hooks", "lastRaised")
+
+    counters  : Counters
+    hooks     : Hooks
+    # The exception last counted in `exceptionsRaised`.
+    lastRaised: BaseException
+
+    def __init__(self, counters: Counters, hooks: Hooks):
+        self.counters   = counters
+        self.hooks      = hooks
+        self.lastRaised = None
+
+# Interpreter module name -> [instrumented interpreters, restore], see
+# `patch`.
+patched: dict[str, list] = {}
+
+
+def instrument(interp, hooks: Hooks = None) -> Counters:
+    if interp.instrumentation is not None:
+        raise LoxError("interpreter is already instrumented.", "instrumentation-error")
+
+    counters: Counters = Counters()
+    interp.instrumentation = Instrumentation(counters, hooks if hooks is not None else Hooks())
+
+    # The module `interp` came from, which is `__main__` when running
+    # interpreter.py as a script.
+    name: str = type(interp).__module__
+    if name not in patched:
+        patched[name] = [0, patch(sys.modules[name])]
+    patched[name][0] += 1
+    return counters
+
+def uninstrument(interp) -> Counters:
+    if interp.instrumentation is None:
+        return None
+
+    counters: Counters = interp.instrumentation.counters
+    interp.instrumentation = None
+
+    name: str = type(interp).__module__
+    patched[name][0] -= 1
+    if patched[name][0] == 0:
+        patched.pop(name)[1]()
+    return counters
+
+# Counts a new environment or instance of an instrumented `interp`.
+def allocated(interp, allocation: object) -> None:
+    instrumentation: Instrumentation = interp.instrumentation
+    if isinstance(allocation, Environment):
+        instrumentation.counters.environmentsCreated += 1
+    else:
+        instrumentation.counters.instancesCreated += 1
+    if instrumentation.hooks.allocation is not None:
+        instrumentation.hooks.allocation(allocation)
+
+# Swaps `module`'s `evaluate`, `LoxFunction.callIn`, `LoxClass.call` and
+# `Environment` for counting versions, returning what puts the originals
+# back.
+def patch(module) -> Callable[[], None]:
+    evaluate    = module.evaluate
+    callIn      = module.LoxFunction.callIn
+    classCall   = module.LoxClass.call
+    environment = module.Environment
+    # `running.interp`: the `Interp` evaluating on this thread.
+    running     = threading.local()
+
+    def instrumented_evaluate(interp, node: object) -> object:
+        previous = getattr(running, "interp", None)
+        running.interp = interp
+        try:
+            instrumentation: Instrumentation = interp.instrumentation
+            if instrumentation is None:
+                return evaluate(interp, node)
+
+            instrumentation.counters.nodesEvaluated += 1
+            if instrumentation.hooks.statement is not None and isinstance(node, Stmt):
+                instrumentation.hooks.statement(node)
+
+            try:
+                return evaluate(interp, node)
+            except BaseException as e:
+                if e is not instrumentation.lastRaised:
+                    instrumentation.lastRaised = e
+                    instrumentation.counters.exceptionsRaised += 1
+                raise
+        finally:
+            running.interp = previous
+
+    def instrumented_callIn(function, interp, closure, arguments: list[object]) -> object:
+        instrumentation: Instrumentation = interp.instrumentation
+        if instrumentation is None:
+            return callIn(function, interp, closure, arguments)
+
+        hooks: Hooks = instrumentation.hooks
+        instrumentation.counters.calls += 1
+        if hooks.callEnter is not None:
+            hooks.callEnter(function, arguments)
+
+        result: object = callIn(function, interp, closure, arguments)
+
+        if hooks.callExit is not None:
+            hooks.callExit(function, result)
+        return result
+
+    # The instance is only counted once its initializer is done.
+    def instrumented_class_call(klass, interp, arguments: list[object]) -> object:
+        instance: object = classCall(klass, interp, arguments)
+        if interp.instrumentation is not None:
+            allocated(interp, instance)
+        return instance
+
+    def counting_environment(enclosing: Environment, size: int = 0) -> Environment:
+        made  : Environment = environment(enclosing, size)
+        interp: object      = getattr(running, "interp", None)
+        if interp is not None and interp.instrumentation is not None:
+            allocated(interp, made)
+        return made
+
+    module.evaluate           = instrumented_evaluate
+    module.LoxFunction.callIn = instrumented_callIn
+    module.LoxClass.call      = instrumented_class_call
+    module.Environment        = counting_environment
+
+    def restore() -> None:
+        module.evaluate           = evaluate
+        module.LoxFunction.callIn = callIn
+        module.LoxClass.call      = classCall
+        module.Environment        = environment
+    return restore
@@ -1,22 +1,60 @@
 from __future__ import annotations
-from pprint import pprint
+import sys
+import weakref
+from typing import Callable, Iterable, Iterator
 
+from containers import LoxList, LoxMap, loxKey, mapKey
 from environment import Environment
+from errors import LoxError, LoxRuntimeError, ScanError
 from expr import *
 from stmt import *
 from tokens import Token, TokenType
-from resolver import resolveStatements, Resolver
+from resolver import resolve, resolveIncremental, resolveStatements, Resolver
+from ropes import Rope
+import budgets
+import instrumentation
 import libffi
+import operators
+import optimizer
 
 class Interp:
     globals    : Environment
     environment: Environment
-    # From resolver
-    locals     : dict[Expr, int]
+    # Kept on the interpreter so programs fed in a piece at a time (see
+    # `interpretIncremental`) keep resolving against the same state.
+    resolver   : Resolver
+    # Set by a `return` statement, see `RETURNING`.
+    returnValue: object
+    # Set instead of `returnValue` by a `return f(...)` that left the call
+    # to `LoxFunction.callIn`: (function, closure, arguments).
+    tailCall   : tuple
+    # Set while instrumented, see instrumentation.py.
+    instrumentation: instrumentation.Instrumentation
+    # The running call's frame, holding the locals no closure can see (see
+    # resolver.py). None outside of functions.
+    frame          : list[object]
+    # Nodes that may still run before `budgets.refuel` has to be called, and
+    # the running budget if there is one, see budgets.py.
+    fuel           : int
+    budget         : budgets.Meter
+    # Calls in progress, and how many there may be.
+    depth          : int
+    maxDepth       : int
 
     def __init__(self):
-        self.environment = Environment(None)
-        self.globals     = self.environment
+        self.environment     = Environment(None)
+        self.globals         = self.environment
+        self.frame           = None
+        self.resolver        = Resolver()
+        self.returnValue     = None
+        self.tailCall        = None
+        self.instrumentation = None
+        self.fuel            = budgets.CHECK_INTERVAL
+        self.budget          = None
+        self.depth           = 0
+        self.maxDepth        = sys.maxsize
+        for name, function in libffi.NATIVES.items():
+            self.globals.define(name, function)
 
 class LoxCallable:
     def arity(self) -> int:
@@ -24,44 +62,93 @@ class LoxCallable:
     def call(self, interp: Interp, arguments: list[object]) -> object:
         pass
 
+# `callee.call`, or a `LoxRuntimeError` for anything that can't be called.
+# The natives in libffi are lox_callable.py's `LoxCallable`s, not this
+# module's, so this goes by the method rather than by `isinstance`.
+def callOf(callee: object) -> Callable[[Interp, list[object]], object]:
+    try:
+        return callee.call
+    except AttributeError:
+        raise LoxRuntimeError("Can only call functions and classes.") from None
+
+def arityError(expected: int, got: int) -> LoxRuntimeError:
+    return LoxRuntimeError(f"Expected {expected} arguments but got {got}.")
+
+
+# Statements evaluate to None, or to `RETURNING` once a `return` has run
+# somewhere inside them. Every statement holding other statements passes
+# it straight up, until `LoxFunction.call` picks the value up from
+# `interp.returnValue`. This way returning never raises an exception.
+RETURNING: object = object()
+
+
+# Instances don't keep a dict of their own fields. Each one points at a
+# `Shape` mapping field names to indexes into its `values` list, and every
+# instance that had the same fields set in the same order shares the same
+# shape. Setting a new field follows (or adds) the shape's transition for
+# that name, so the shapes form a tree rooted at the `emptyShape` of the
+# instance's class. The tree goes away with the class, and so with the run
+# that made it, instead of growing for as long as the process lives.
+class Shape:
+    __slots__ = ("slots", "transitions")
+
+    slots      : dict[str, int]
+    transitions: dict[str, Shape]
 
-class LoxReturn(RuntimeError):
-    value: object
+    def __init__(self, slots: dict[str, int]):
+        self.slots       = slots
+        self.transitions = {}
 
-    def __init__(self, value: object):
-        self.value = value
+    def withField(self, name: str) -> Shape:
+        shape: Shape = self.transitions.get(name)
+        if shape is None:
+            shape = Shape({**self.slots, name: len(self.slots)})
+            self.transitions[name] = shape
+        return shape
 
 
 class LoxInstance:
-    klass: LoxClass
-    fields: dict[str, object]
+    # `__weakref__` for counting live instances under a budget.
+    __slots__ = ("klass", "shape", "values", "__weakref__")
+
+    klass : LoxClass
+    shape : Shape
+    values: list[object]
 
     def __init__(self, klass: LoxClass):
         self.klass  = klass
-        self.fields = {}
+        self.shape  = klass.emptyShape
+        self.values = []
 
     def __repr__(self):
         return f"<{self.klass.name} instance>"
 
     def get(self, name: Token) -> object:
-        if name.lexeme in self.fields:
-            return self.fields.get(name.lexeme)
+        slot: int = self.shape.slots.get(name.lexeme)
+        if slot is not None:
+            return self.values[slot]
         
         method: LoxFunction = self.klass.findMethod(name.lexeme)
         if method: 
             return method.bind(self)
 
-        print(f"[interpreter-error] Undefined property `{name.lexeme}`")
-        exit(1)
+        raise LoxRuntimeError(f"Undefined property `{name.lexeme}`")
 
     def set(self, name: Token, value: object) -> None:
-        self.fields[name.lexeme] = value
+        slot: int = self.shape.slots.get(name.lexeme)
+        if slot is not None:
+            self.values[slot] = value
+        else:
+            self.shape = self.shape.withField(name.lexeme)
+            self.values.append(value)
 
 
 @dataclass
 class LoxClass(LoxCallable):
     name: str
     methods: dict[str, LoxFunction]
+    # Where the shapes of its instances start, see `Shape`.
+    emptyShape: Shape = field(default_factory=lambda: Shape({}), repr=False, compare=False)
 
     def __repr__(self):
         return f"<class `{self.name}`>"
@@ -74,32 +161,181 @@ class LoxClass(LoxCallable):
 
     def call(self, interp: Interp, arguments: list[object]) -> object:
         instance: LoxInstance = LoxInstance(self)
+        if interp.budget is not None:
+            budgets.allocated(interp, instance)
 
         initializer: LoxFunction = self.findMethod("init")
         if initializer:
-            initializer.bind(instance).call(interp, arguments)
+            initializer.invoke(interp, instance, arguments)
+        elif arguments:
+            raise arityError(0, len(arguments))
         return instance
 
     def findMethod(self, name: str) -> LoxFunction:
-        if name in self.methods.keys():
-            return self.methods[name]
+        return self.methods.get(name)
+
+# backend:
+#   "tree"   : walk the AST with `evaluate` (the reference implementation).
+#   "closure": compile the AST to python closures first, see closures.py.
+#   "vm"     : compile to bytecode and run it on the stack VM, see vm.py.
+# optimize: run optimizer.py over the program first.
+# interp: run in this interpreter instead of a fresh one, e.g. an
+#         instrumented one.
+# With a `budget`, raises `budgets.BudgetExceeded` once the program goes
+# over it.
+def interpret(stmts: list[Stmt], backend: str = "tree", optimize: bool = True,
+              interp: Interp = None, budget: budgets.Budget = None) -> None:
+    interp = interp if interp is not None else Interp()
+    runResolved(interp, prepare(interp, stmts, optimize), backend, budget)
+
+# Runs a script file. With `cache` the optimized, resolved program is kept
+# in `__ploxcache__` next to the script and reused until the source
+# changes, see astcache.py.
+def interpretFile(path: str, backend: str = "tree", optimize: bool = True,
+                  interp: Interp = None, cache: bool = True, fastScan: bool = False,
+                  budget: budgets.Budget = None) -> None:
+    import astcache
+    from scanner import scan, scanIter
+    from parser import parse
 
-        return None
+    interp = interp if interp is not None else Interp()
+    with open(path) as f:
+        source: str = f.read()
+
+    key  : str        = astcache.programKey(source, optimize) if cache else None
+    stmts: list[Stmt] = astcache.load(path, key) if cache else None
+
+    if stmts is None:
+        # The regex scanner is streamed straight into the parser, so the token
+        # list never has to exist.
+        tokens  : Iterable[Token] = scanIter(source) if fastScan else scan(source)
+        warnings: int             = len(interp.resolver.warnings)
+        stmts = prepare(interp, parse(tokens), optimize)
+        # A cached program would skip the resolver, and its warnings with it.
+        if cache and len(interp.resolver.warnings) == warnings:
+            astcache.store(path, key, stmts)
+
+    runResolved(interp, stmts, backend, budget)
+
+# Optimizes and resolves `stmts`, after which any backend can run them.
+def prepare(interp: Interp, stmts: list[Stmt], optimize: bool = True) -> list[Stmt]:
+    if optimize:
+        stmts = optimizer.optimize(stmts)
+
+    resolveStatements(interp.resolver, stmts)
+    return stmts
+
+def runResolved(interp: Interp, stmts: list[Stmt], backend: str = "tree",
+                budget: budgets.Budget = None) -> None:
+    runGuarded(interp, budget, lambda: runBackend(interp, stmts, backend))
+
+# Calls `run` under `budget`, if there is one.
+def runGuarded(interp: Interp, budget: budgets.Budget, run: Callable[[], object]) -> object:
+    if budget is not None:
+        budgets.start(interp, budget)
+    try:
+        return run()
+    except RecursionError:
+        # The tree-walker and closure backends recurse in python for every
+        # Lox call, and python's stack gave out (before `maxDepth` did).
+        if budget is not None:
+            raise budgets.BudgetExceeded("depth", "calls nested too deep") from None
+        raise LoxRuntimeError("calls nested too deep") from None
+    finally:
+        if budget is not None:
+            budgets.stop(interp)
 
-def interpret(stmts: list[Stmt]) -> None:
-    interp = Interp()
-    interp.globals.define("print", libffi.LoxPrint())
+def runBackend(interp: Interp, stmts: list[Stmt], backend: str) -> None:
+    checkInstrumented(interp, backend)
 
+    if backend == "closure":
+        import closures
+        closures.run(interp, closures.compile_program(stmts))
+        return
 
-    resolver = Resolver()
+    if backend == "vm":
+        import compiler, vm
+        vm.interpret(interp, compiler.compile_program(stmts))
+        return
 
-    resolveStatements(resolver, stmts)
+    for stmt in stmts:
+        evaluate(interp, stmt)
 
-    interp.locals = resolver.resolutions.copy()
-    pprint(interp.locals)
+# Resolves and runs each top-level declaration before pulling the next one
+# out of `stmts`, so with `parseIter(scanIter(source))` the first output
+# comes out right away and the program's AST is never held all at once.
+def interpretIncremental(interp: Interp, stmts: Iterable[Stmt], backend: str = "tree",
+                         optimize: bool = True) -> None:
+    checkInstrumented(interp, backend)
+    execute: Callable[[Interp, Stmt], object] = statementRunner(backend)
 
     for stmt in stmts:
-        evaluate(interp, stmt)
+        # A block that declares nothing comes back as its statements.
+        for stmt in optimizer.optimize([stmt]) if optimize else [stmt]:
+            resolveIncremental(interp.resolver, stmt)
+            execute(interp, stmt)
+
+# The instrumentation hooks only see the tree-walker, see instrumentation.py.
+def checkInstrumented(interp: Interp, backend: str) -> None:
+    if interp.instrumentation is not None and backend != "tree":
+        raise LoxError("instrumentation only works with the tree backend.",
+                       "instrumentation-error")
+
+def statementRunner(backend: str) -> Callable[[Interp, Stmt], object]:
+    if backend == "closure":
+        import closures
+        return lambda interp, stmt: closures.compile_node(stmt)(interp)
+
+    if backend == "vm":
+        import compiler, vm
+        return lambda interp, stmt: vm.interpret(interp, compiler.compile_program([stmt]))
+
+    return evaluate
+
+def repl(backend: str = "tree") -> None:
+    import sys
+    from scanner import scanIter
+    from parser import parseIter
+
+    interp = Interp()
+    interp.resolver.onWarning = lambda warning: print(warning.report())
+
+    def readLine(prompt: str) -> str:
+        print(prompt, end="", flush=True)
+        line: str = sys.stdin.readline()
+        if line == "":
+            raise EOFError
+        return line
+
+    # Counted on tokens, so braces in strings and comments don't count.
+    # Source that doesn't scan is complete, its error is reported below.
+    def openBraces(source: str) -> bool:
+        depth: int = 0
+        try:
+            for token in scanIter(source):
+                if token.type == TokenType.LEFT_BRACE:
+                    depth += 1
+                elif token.type == TokenType.RIGHT_BRACE:
+                    depth -= 1
+        except ScanError:
+            return False
+        return depth > 0
+
+    while True:
+        try:
+            source: str = readLine("> ")
+            # Keep reading until the braces balance so functions and classes
+            # can be typed over several lines.
+            while openBraces(source):
+                source += readLine(". ")
+        except EOFError:
+            print()
+            return
+
+        try:
+            interpretIncremental(interp, parseIter(scanIter(source)), backend)
+        except LoxError as e:
+            print(e.report())
 
 def evaluate(interp: Interp, stmt: Stmt) -> object:
     if isinstance(stmt, Literal):
@@ -142,33 +378,113 @@ def evaluate(interp: Interp, stmt: Stmt) -> object:
         return eval_set_expr(interp, stmt)
     elif isinstance(stmt, This):
         return eval_this_expr(interp, stmt)
+    elif isinstance(stmt, Index):
+        return eval_index_expr(interp, stmt)
+    elif isinstance(stmt, SetIndex):
+        return eval_set_index_expr(interp, stmt)
+    elif isinstance(stmt, ListLiteral):
+        return eval_list_literal(interp, stmt)
+    elif isinstance(stmt, MapLiteral):
+        return eval_map_literal(interp, stmt)
+    elif isinstance(stmt, ForIn):
+        return eval_forin_stmt(interp, stmt)
     
     else:
-        pprint(f"[interpreter-error] unimplemented expression:`{stmt}`")
-        exit(1)
+        raise LoxRuntimeError(f"unimplemented expression:`{stmt}`")
+
+
+def eval_list_literal(interp: Interp, expr: ListLiteral) -> object:
+    return LoxList([evaluate(interp, element) for element in expr.elements])
 
+def eval_map_literal(interp: Interp, expr: MapLiteral) -> object:
+    entries = LoxMap()
+    for key, value in zip(expr.keys, expr.values):
+        setIndex(entries, evaluate(interp, key), evaluate(interp, value))
+    return entries
+
+def eval_index_expr(interp: Interp, expr: Index) -> object:
+    object: object = evaluate(interp, expr.object)
+    return getIndex(object, evaluate(interp, expr.index))
+
+def eval_set_index_expr(interp: Interp, expr: SetIndex) -> object:
+    object: object = evaluate(interp, expr.object)
+    index : object = evaluate(interp, expr.index)
+    value : object = evaluate(interp, expr.value)
+    setIndex(object, index, value)
+    return value
 
 def eval_set_expr(interp: Interp, stmt: Set) -> object:
     object: object = evaluate(interp, stmt.object)
     if not isinstance(object, LoxInstance):
-        print("[interpreter-error] Only instances have fields.")
-        exit(1)
+        raise LoxRuntimeError("Only instances have fields.")
 
     value: object = evaluate(interp, stmt.value)
-    object.set(stmt.name, value)
+    setFieldCached(stmt, object, value)
     return value
 
+# The inline caches are written as one tuple, never a field at a time: the
+# AST is shared by every run of a compiled program (see program.py), and a
+# run on another thread must not pair one run's shape with another's slot.
+def setFieldCached(expr: Set, instance: LoxInstance, value: object) -> None:
+    shape: Shape = instance.shape
+    cache: tuple = expr.cachedField
+
+    if cache[0] is not shape:
+        slot : int = shape.slots.get(expr.name.lexeme)
+        cache = (shape, slot, None if slot is not None else shape.withField(expr.name.lexeme))
+        expr.cachedField = cache
+
+    if cache[2] is None:
+        instance.values[cache[1]] = value
+    else:
+        instance.shape = cache[2]
+        instance.values.append(value)
+
 def eval_get_expr(interp: Interp, stmt: Get) -> object:
     object: object = evaluate(interp, stmt.object)
-    if isinstance(object, LoxInstance):
-        return object.get(stmt.name)
+    if not isinstance(object, LoxInstance):
+        raise LoxRuntimeError(f"only instances have properties: `{object}`")
 
-    print(f"[interpreter-error] only instances have properties: `{object}`")
-    exit(1)
+    slot: int = findFieldCached(stmt, object)
+    if slot is not None:
+        return object.values[slot]
 
-def eval_class_stmt(interp: Interp, stmt: Class) -> object:
-    interp.environment.define(stmt.name.lexeme, None)
+    return findMethodCached(stmt, object).bind(object)
+
+# The slot `expr.name` is stored in on `instance`, None if it has no such
+# field.
+def findFieldCached(expr: Get, instance: LoxInstance) -> int:
+    cache: tuple = expr.cachedField
+
+    if cache[0] is not instance.shape:
+        cache = (instance.shape, instance.shape.slots.get(expr.name.lexeme))
+        expr.cachedField = cache
+
+    return cache[1]
+
+# Methods can't change once a class exists, so whatever `name` resolved to
+# for an instance of the same class last time is still right.
+#
+# The AST outlives a run (see program.py), so the cache only holds weak
+# references: a class and its method would keep the globals of the run
+# that made them alive. The method lives as long as its class, which
+# `instance` keeps alive. Both are written as one tuple, so a run on
+# another thread never sees one run's class with another's method.
+def findMethodCached(expr: Get, instance: LoxInstance) -> LoxFunction:
+    klass: LoxClass = instance.klass
+    cache: tuple    = expr.cachedMethod
+
+    if cache is not None and cache[0]() is klass:
+        return cache[1]()
+
+    method: LoxFunction = klass.findMethod(expr.name.lexeme)
+    if method is None:
+        raise LoxRuntimeError(f"Undefined property `{expr.name.lexeme}`")
 
+    expr.cachedMethod = (weakref.ref(klass), weakref.ref(method))
+    return method
+
+def eval_class_stmt(interp: Interp, stmt: Class) -> object:
     methods: dict[str, LoxFunction] = {}
     for method in stmt.methods:
         fun: LoxFunction = LoxFunction(method, 
@@ -177,67 +493,158 @@ def eval_class_stmt(interp: Interp, stmt: Class) -> object:
         methods[method.name.lexeme] = fun
 
     klass: LoxClass = LoxClass(stmt.name.lexeme, methods)
-    interp.environment.assign(stmt.name, klass)
+    declare(interp, stmt, klass)
     return None
 
 def eval_this_expr(interp: Interp, expr: This)  -> object:
-    return interp.environment.get(expr.keyword)
+    return lookUpVariable(interp, expr.keyword, expr)
 
 def eval_call_expr(interp: Interp, expr: Call) -> object:
+    if isinstance(expr.callee, Get):
+        return eval_invoke_expr(interp, expr, expr.callee)
+
     callee: object = evaluate(interp, expr.callee)
 
     arguments: list[object] = []
     for argument in expr.arguments:
         arguments.append(evaluate(interp, argument))
 
-    # NOTE(tyler): Python's `isinstance` is not working for ffis
-    # so I'm removing the fucker. Not great for production code,
-    # but this isn't production and I hate python, soo...
+    return callOf(callee)(interp, arguments)
 
-    # if not isinstance(callee, LoxCallable):
-    #     print("[interpreter-error] Can only call functions. type: ", type(callee))
-    #     exit(1)
+# `obj.name(...)`: calls the method straight away, without making the
+# bound method `eval_get_expr` would return.
+def eval_invoke_expr(interp: Interp, expr: Call, get: Get) -> object:
+    object: object = evaluate(interp, get.object)
+    if not isinstance(object, LoxInstance):
+        raise LoxRuntimeError(f"only instances have properties: `{object}`")
+
+    slot: int = findFieldCached(get, object)
+    if slot is not None:
+        callee: object = object.values[slot]
+        return callOf(callee)(interp, [evaluate(interp, a) for a in expr.arguments])
 
-    return callee.call(interp, arguments)
+    method: LoxFunction = findMethodCached(get, object)
+    return method.invoke(interp, object, [evaluate(interp, a) for a in expr.arguments])
 
 def eval_fun_stmt(interp: Interp, stmt: Function) -> None:
     fun: LoxFunction = LoxFunction(stmt, 
                                    interp.environment, 
                                    False)
-    interp.environment.define(stmt.name.lexeme, fun)
+    declare(interp, stmt, fun)
     return None
 
-def eval_return_stmt(interp: Interp, stmt: Return) -> None:
+def eval_return_stmt(interp: Interp, stmt: Return) -> object:
+    if stmt.tailCall:
+        return eval_tail_call(interp, stmt.value)
+
     value: object = None
     if stmt.value is not None:
         value = evaluate(interp, stmt.value)
 
-    raise LoxReturn(value)
+    interp.returnValue = value
+    return RETURNING
+
+# `return f(...)`: when `f` is a Lox function, the call isn't made here but
+# by the `callIn` loop of the function we are returning from, so tail
+# recursion runs in constant python stack. Anything else, e.g. a class or
+# a builtin, is just called.
+def eval_tail_call(interp: Interp, expr: Call) -> object:
+    # The environment holding `this` when calling a method.
+    this: Environment = None
+
+    if isinstance(expr.callee, Get):
+        get   : Get    = expr.callee
+        object: object = evaluate(interp, get.object)
+        if not isinstance(object, LoxInstance):
+            raise LoxRuntimeError(f"only instances have properties: `{object}`")
+
+        slot: int = findFieldCached(get, object)
+        if slot is not None:
+            callee: object = object.values[slot]
+        else:
+            callee: object = findMethodCached(get, object)
+            this = Environment(callee.closure, 1)
+            this.slots[0] = object
+    else:
+        callee: object = evaluate(interp, expr.callee)
+
+    arguments: list[object] = [evaluate(interp, a) for a in expr.arguments]
 
-def eval_while_stmt(interp: Interp, stmt: While) -> None:
+    if callee.__class__ is LoxFunction and not callee.isInitializer:
+        interp.tailCall = (callee, this if this is not None else callee.closure, arguments)
+    elif this is not None:
+        interp.returnValue = callee.callIn(interp, this, arguments)
+    else:
+        interp.returnValue = callOf(callee)(interp, arguments)
+    return RETURNING
+
+# Walks the list or map itself, not a copy of it.
+def eval_forin_stmt(interp: Interp, stmt: ForIn) -> object:
+    values     : Iterator[object] = iterate(evaluate(interp, stmt.iterable))
+
+    if stmt.scopeSize == 0:
+        frame: list[object] = interp.frame
+        for value in values:
+            interp.fuel -= stmt.cost
+            if interp.fuel < 0:
+                budgets.refuel(interp)
+            frame[stmt.frameSlot] = value
+            if evaluate(interp, stmt.body) is RETURNING:
+                return RETURNING
+        return None
+
+    environment: Environment      = Environment(interp.environment, stmt.scopeSize)
+    previous   : Environment      = interp.environment
+
+    try:
+        interp.environment = environment
+        for value in values:
+            interp.fuel -= stmt.cost
+            if interp.fuel < 0:
+                budgets.refuel(interp)
+            environment.slots[stmt.slot] = value
+            if evaluate(interp, stmt.body) is RETURNING:
+                return RETURNING
+        return None
+    finally:
+        interp.environment = previous
+
+def eval_while_stmt(interp: Interp, stmt: While) -> object:
     while isTruthy(evaluate(interp, stmt.condition)):
-        evaluate(interp, stmt.body)
+        interp.fuel -= stmt.cost
+        if interp.fuel < 0:
+            budgets.refuel(interp)
+        if evaluate(interp, stmt.body) is RETURNING:
+            return RETURNING
     return None
 
-def eval_if_stmt(interp: Interp, stmt: If) -> None:
+def eval_if_stmt(interp: Interp, stmt: If) -> object:
     if isTruthy(evaluate(interp, stmt.condition)):
-        evaluate(interp, stmt.thenBranch)
+        return evaluate(interp, stmt.thenBranch)
     elif stmt.elseBranch is not None:
-        evaluate(interp, stmt.elseBranch)
+        return evaluate(interp, stmt.elseBranch)
     return None
 
-def eval_block_stmt(interp: Interp, stmt: Block) -> None:
-    execute_block(interp, stmt.statements, Environment(interp.environment))
-    return None
+def eval_block_stmt(interp: Interp, stmt: Block) -> object:
+    if stmt.scopeSize == 0:
+        for statement in stmt.statements:
+            if evaluate(interp, statement) is RETURNING:
+                return RETURNING
+        return None
+
+    return execute_block(interp, stmt.statements,
+                         Environment(interp.environment, stmt.scopeSize))
 
-def execute_block(interp: Interp, statements: list[Stmt], environment: Environment) -> None:
+def execute_block(interp: Interp, statements: list[Stmt], environment: Environment) -> object:
     previous: Environment = interp.environment
 
     try:
         interp.environment = environment
 
         for statement in statements:
-            evaluate(interp, statement)
+            if evaluate(interp, statement) is RETURNING:
+                return RETURNING
+        return None
     finally:
         interp.environment = previous
 
@@ -246,15 +653,25 @@ def eval_var_stmt(interp: Interp, stmt: Var) -> None:
     if stmt.initializer is not None:
         value = evaluate(interp, stmt.initializer)
 
-    interp.environment.define(stmt.name.lexeme, value)
+    declare(interp, stmt, value)
     return None
 
+# Locals go where the resolver put them, neither slot set means the
+# declaration was made at the top level.
+def declare(interp: Interp, stmt: Var | Function | Class, value: object) -> None:
+    if stmt.frameSlot is not None:
+        interp.frame[stmt.frameSlot] = value
+    elif stmt.slot is None:
+        interp.globals.define(stmt.name.lexeme, value)
+    else:
+        interp.environment.slots[stmt.slot] = value
+
 def eval_expr_stmt(interp: Interp, stmt: Expression) -> None:
     evaluate(interp, stmt.expression)
     return None
 
 def eval_logical(interp: Interp, expr: Logical) -> object:
-    left: object = evaluate(expr.left)
+    left: object = evaluate(interp, expr.left)
 
     if expr.operator.type == TokenType.OR:
         if isTruthy(left):
@@ -267,12 +684,26 @@ def eval_logical(interp: Interp, expr: Logical) -> object:
 
 def eval_assign(interp: Interp, expr: Assign) -> object:
     value: object = evaluate(interp, expr.value)
-    interp.environment.assign(expr.name, value)
+
+    if expr.frameSlot is not None:
+        interp.frame[expr.frameSlot] = value
+    elif expr.depth is None:
+        interp.globals.assign(expr.name, value)
+    else:
+        interp.environment.ancestor(expr.depth).slots[expr.slot] = value
+
     return value
 
 def eval_variable(interp: Interp, expr: Variable) -> object:
-    # Try to find in the environment stack
-    return interp.environment.get(expr.name)
+    if expr.frameSlot is not None:
+        return interp.frame[expr.frameSlot]
+    return lookUpVariable(interp, expr.name, expr)
+
+def lookUpVariable(interp: Interp, name: Token, expr: Variable | This) -> object:
+    if expr.depth is None:
+        return interp.globals.get(name)
+
+    return interp.environment.ancestor(expr.depth).slots[expr.slot]
 
 
 def eval_grouping(interp: Interp, expr: Grouping) -> object:
@@ -282,44 +713,21 @@ def eval_binary(interp: Interp, expr: Binary) -> object:
     left : object = evaluate(interp, expr.left)
     right: object = evaluate(interp, expr.right)
 
-    match expr.operator.type:
-        case TokenType.GREATER:
-            return float(left) > float(right)
-        case TokenType.GREATER_EQUAL:
-            return float(left) >= float(right)
-        case TokenType.LESS:
-            return float(left) < float(right)
-        case TokenType.LESS_EQUAL:
-            return float(left) <= float(right)
-        case TokenType.EQUAL_EQUAL:
-            return left == right
-        case TokenType.BANG_EQUAL:
-            return float(left) != float(right)
-        case TokenType.MINUS:
-            return float(left) - float(right)
-        case TokenType.SLASH:
-            return float(left) / float(right)
-        case TokenType.STAR:
-            return float(left) * float(right)
-        case TokenType.PLUS:
-            if isinstance(left, float) and isinstance(right, float):
-                return float(left) + float(right)
-            if isinstance(left, str) or isinstance(right, str):
-                return str(left) + str(right)
-        case _:
-            print(f"[interpreter-error] unknown token type for binary expressions: `{expr.operator.lexeme}`")
+    if expr.op is None:
+        raise LoxRuntimeError(f"unknown binary operator: `{expr.operator.lexeme}`")
+
+    return expr.op(left, right)
 
 def eval_unary(interp: Interp, expr: Unary) -> object:
     right: object = evaluate(interp, expr.expr)
 
     match expr.operator.type:
         case TokenType.MINUS:
-            return -float(right)
+            return operators.negate(right)
         case TokenType.BANG:
             return not isTruthy(right)
         case _:
-            print(f"[interpret-error] unknown unary operator: `{expr.operator.lexeme}`")
-            exit(1)
+            raise LoxRuntimeError(f"unknown unary operator: `{expr.operator.lexeme}`")
 
 def eval_literal(interp: Interp, expr: Literal) -> object:
     return expr.value
@@ -336,37 +744,132 @@ class LoxFunction(LoxCallable):
         return len(self.declaration.params)
 
     def call(self, interp: Interp, arguments: list[object]) -> object:
-        environment = Environment(self.closure)
-
-        for i, param in enumerate(self.declaration.params):
-            environment.define(self.declaration.params[i].lexeme,
-                               arguments[i])
-
-        try:
-            execute_block(interp, 
-                          self.declaration.body,
-                          environment)
-        except LoxReturn as rv:
-            if self.isInitializer:
-                return self.closure.gets("this")
-            return rv.value
-
-        # If the function name is "init", return
-        # the class instance it refers to.
-        if self.isInitializer:
-            return self.closure.gets("this")
-
-        return None
+        return self.callIn(interp, self.closure, arguments)
+
+    # Calls the method as if it had been bound to `instance`, without
+    # making the bound function.
+    def invoke(self, interp: Interp, instance: LoxInstance, arguments: list[object]) -> object:
+        this: Environment = Environment(self.closure, 1)
+        this.slots[0] = instance
+        return self.callIn(interp, this, arguments)
+
+    # `closure` is what the call's environment encloses: `self.closure`, or
+    # the environment holding `this` for an `invoke`.
+    def callIn(self, interp: Interp, closure: Environment, arguments: list[object]) -> object:
+        function: LoxFunction = self
+
+        # Runs once per call, plus once for every tail call made from it,
+        # see `eval_tail_call`.
+        while True:
+            declaration: Function = function.declaration
+            if len(arguments) != len(declaration.params):
+                raise arityError(len(declaration.params), len(arguments))
+
+            frame: list[object] = [None] * declaration.frameSize
+            frame[:len(arguments)] = arguments
+
+            # Without captured variables the call needs no environment of
+            # its own.
+            environment: Environment = closure
+            if declaration.scopeSize:
+                environment = Environment(closure, declaration.scopeSize)
+                for i, slot in declaration.capturedParams:
+                    environment.slots[slot] = arguments[i]
+
+            previous: list[object] = interp.frame
+            interp.depth += 1
+            try:
+                # Also where `maxDepth` is checked, see budgets.py.
+                interp.fuel -= declaration.cost
+                if interp.fuel < 0:
+                    budgets.refuel(interp)
+                interp.frame = frame
+                returned: bool = execute_block(interp, declaration.body,
+                                               environment) is RETURNING
+            finally:
+                interp.frame = previous
+                interp.depth -= 1
+
+            # If the function name is "init", return
+            # the class instance it refers to, which is
+            # the only slot of the environment `bind`
+            # or `invoke` made.
+            if function.isInitializer:
+                return closure.slots[0]
+
+            if not returned:
+                return None
+            if interp.tailCall is None:
+                return interp.returnValue
+
+            function, closure, arguments = interp.tailCall
+            interp.tailCall = None
 
     def bind(self, instance: LoxInstance) -> LoxFunction:
-        environment: Environment = Environment(self.closure)
-        environment.define("this", instance)
+        environment: Environment = Environment(self.closure, 1)
+        environment.slots[0] = instance
         return LoxFunction(self.declaration, environment,
                            self.isInitializer)
         
 
 # ------------- Helpers
 
+# Indexing, shared by every backend. Lists take whole numbers in range,
+# maps any key (missing ones read as nil), strings give one character.
+def getIndex(object: object, index: object) -> object:
+    if object.__class__ is LoxList:
+        return object[listIndex(object, index)]
+    if object.__class__ is LoxMap:
+        try:
+            return object.get(mapKey(index))
+        except TypeError:
+            raise LoxRuntimeError(f"can't use `{index}` as a map key.")
+    if isinstance(object, str | Rope):
+        text: str = str(object)
+        return text[listIndex(text, index)]
+
+    raise LoxRuntimeError(f"can only index lists, maps and strings: `{object}`")
+
+def setIndex(object: object, index: object, value: object) -> None:
+    if object.__class__ is LoxList:
+        object[listIndex(object, index)] = value
+    elif object.__class__ is LoxMap:
+        try:
+            object[mapKey(index)] = value
+        except TypeError:
+            raise LoxRuntimeError(f"can't use `{index}` as a map key.")
+    else:
+        raise LoxRuntimeError(f"can only assign into lists and maps: `{object}`")
+
+def listIndex(items: LoxList | str, index: object) -> int:
+    if index.__class__ is not float or not index.is_integer():
+        raise LoxRuntimeError(f"index must be a whole number, got `{index}`.")
+
+    i: int = int(index)
+    if not 0 <= i < len(items):
+        raise LoxRuntimeError(f"index {i} out of range for length {len(items)}.")
+    return i
+
+# What a `for` loop walks: the elements of a list, the keys of a map or
+# the characters of a string, without copying any of them.
+def iterate(object: object) -> Iterator[object]:
+    if object.__class__ is LoxList or isinstance(object, str):
+        return iter(object)
+    if object.__class__ is Rope:
+        return iter(str(object))
+    if object.__class__ is LoxMap:
+        return iterateMap(object)
+
+    raise LoxRuntimeError(f"can only loop over lists, maps and strings: `{object}`")
+
+def iterateMap(entries: LoxMap) -> Iterator[object]:
+    try:
+        for key in entries:
+            yield loxKey(key)
+    except RuntimeError:
+        raise LoxRuntimeError("map changed size while looping over it.")
+
+
 def stringify(obj: object) -> str:
     if obj is None:
         return "nil"
@@ -395,17 +898,97 @@ def isTruthy(obj: object) -> bool:
     return True
 
 
+BACKENDS: list[str] = ["tree", "closure", "vm"]
+
 if __name__ == "__main__":
-    from scanner import scan
-    from parser import parse
+    import argparse
+    from scanner import scanIter
+    from parser import parseIter
 
     def readFile(path: str) -> str:
         f = open(path)
         c = f.read()
         f.close()
         return c
-    
-    source: str = readFile("tests/test-script.txt")
-    tokens: list[Token] = scan(source)
-    stmts: list[Stmt]   = parse(tokens)
-    interpret(stmts)
\ No newline at end of file
+
+    args = argparse.ArgumentParser(description="Run a plox script.")
+    args.add_argument("path", nargs="?", default="tests/test-script.txt")
+    args.add_argument("--backend", choices=BACKENDS, default="tree")
+    args.add_argument("--fast-scan", action="store_true",
+                      help="tokenize with the regex based scanner")
+    args.add_argument("--incremental", action="store_true",
+                      help="scan, parse, resolve and run one declaration at a time")
+    args.add_argument("--repl", action="store_true")
+    args.add_argument("--no-optimize", action="store_true",
+                      help="skip constant folding and dead branch elimination")
+    args.add_argument("--profile", action="store_true",
+                      help="print per function and per line hot spots to stderr at exit")
+    args.add_argument("--profile-out", metavar="PATH",
+                      help="also write collapsed stacks for flamegraph tools to PATH")
+    args.add_argument("--no-cache", action="store_true",
+                      help="don't read or write the parsed program in __ploxcache__")
+    args.add_argument("--stats", action="store_true",
+                      help="print nodes evaluated, calls and allocations to stderr at exit")
+    args.add_argument("--max-nodes", type=int, metavar="N",
+                      help="stop after evaluating about N nodes")
+    args.add_argument("--timeout", type=float, metavar="SECONDS",
+                      help="stop after running for SECONDS")
+    args.add_argument("--max-instances", type=int, metavar="N",
+                      help="stop once more than N instances are alive")
+    args.add_argument("--max-depth", type=int, metavar="N",
+                      help="stop once calls nest deeper than N")
+    args = args.parse_args()
+
+    if args.repl:
+        repl(args.backend)
+        exit(0)
+
+    profile = None
+    if args.profile or args.profile_out:
+        import sys
+        import profiler
+
+        if args.backend != "tree":
+            print("[profile-error] profiling only works with the tree backend.")
+            exit(1)
+        # This file runs as `__main__`, which is the module to instrument.
+        profile = profiler.start(sys.modules[__name__])
+
+    interp = Interp()
+    interp.resolver.onWarning = lambda warning: print(warning.report())
+    if args.stats:
+        if args.backend != "tree":
+            print("[instrumentation-error] --stats only works with the tree backend.")
+            exit(1)
+        instrumentation.instrument(interp)
+
+    budget = None
+    if any(limit is not None for limit in (args.max_nodes, args.timeout,
+                                           args.max_instances, args.max_depth)):
+        budget = budgets.Budget(args.max_nodes, args.timeout, args.max_instances,
+                                args.max_depth)
+        if args.incremental:
+            print("[budget-error] budgets don't work with --incremental.")
+            exit(1)
+
+    try:
+        if args.incremental:
+            interpretIncremental(interp, parseIter(scanIter(readFile(args.path))), args.backend,
+                                 not args.no_optimize)
+        else:
+            interpretFile(args.path, args.backend, not args.no_optimize, interp,
+                          cache=not args.no_cache, fastScan=args.fast_scan, budget=budget)
+    except LoxError as e:
+        print(e.report())
+        exit(1)
+    finally:
+        if args.stats:
+            import sys
+            counters = instrumentation.uninstrument(interp)
+            for name, value in vars(counters).items():
+                print(f"{value:>12}  {name}", file=sys.stderr)
+        if profile is not None:
+            profiler.stop(profile)
+            profiler.report(profile, sys.stderr)
+            if args.profile_out:
+                profiler.writeCollapsed(profile, args.profile_out)
@@ -1,14 +1,26 @@
+from __future__ import annotations
+import inspect
+import time
+from collections import OrderedDict
+from typing import Callable
 
+import errors
 import interpreter
+from containers import LoxList, LoxMap, loxKey, mapKey
 from lox_callable import LoxCallable
+from ropes import Rope, flatten
 
 
 
+# The builtins written as classes say how many arguments they take the way
+# `NativeFunction` does: `minArgs` up to `maxArgs` (None for any number),
+# with `arity()` the most.
 class LoxPrint(LoxCallable):
+    minArgs: int = 0
+    maxArgs: int = None
 
-    @property
     def arity(self) -> int:
-        return 1
+        return self.maxArgs
 
     def call(self, interp: interpreter.Interp,
              arguments: list[object]) -> object:
@@ -24,5 +36,424 @@ class LoxPrint(LoxCallable):
         return "<builtin fn: 'print'>"
 
 
+# `memoize(fn)`, `memoize(fn, capacity)`, `memoize(fn, capacity, policy)`
+#
+# Wraps a pure function in a bounded cache of its results. Rebinding the
+# name makes recursive calls go through the cache too:
+#
+#     fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+#     fib = memoize(fib);
+#
+# Only calls whose arguments are all numbers, strings, nil or booleans are
+# cached, anything else goes straight to the function. `capacity` nil
+# means unbounded. When full, "lru" (the default) evicts the entry used
+# longest ago and "fifo" the one added first.
+class LoxMemoize(LoxCallable):
+    minArgs: int = 1
+    maxArgs: int = 3
 
+    def arity(self) -> int:
+        return self.maxArgs
+
+    def call(self, interp: interpreter.Interp,
+             arguments: list[object]) -> object:
+
+        checkArguments("memoize", self.minArgs, self.maxArgs, arguments)
+        if not hasattr(arguments[0], "call"):
+            raise NativeError(f"memoize: expected a function, got `{arguments[0]}`.")
+
+        capacity: object = arguments[1] if len(arguments) > 1 else DEFAULT_CAPACITY
+        policy  : object = arguments[2] if len(arguments) > 2 else "lru"
+
+        if capacity is not None and not (isinstance(capacity, float) and capacity >= 1
+                                         and capacity.is_integer()):
+            raise NativeError(f"memoize: capacity must be a positive whole number or nil, got `{capacity}`.")
+        if policy not in EVICTION_POLICIES:
+            raise NativeError(f"memoize: unknown eviction policy `{policy}`, "
+                              f"expected one of {', '.join(EVICTION_POLICIES)}.")
+
+        return Memoized(arguments[0], None if capacity is None else int(capacity), policy)
+
+    def __repr__(self):
+        return "<builtin fn: 'memoize'>"
+
+# `memoStats(fn)`: "hits: 10, misses: 5, evictions: 0, size: 5" for a
+# function returned by `memoize`.
+class LoxMemoStats(LoxCallable):
+    minArgs: int = 1
+    maxArgs: int = 1
+
+    def arity(self) -> int:
+        return self.maxArgs
+
+    def call(self, interp: interpreter.Interp,
+             arguments: list[object]) -> object:
+
+        checkArguments("memoStats", self.minArgs, self.maxArgs, arguments)
+        memoized: object = arguments[0]
+        if not isinstance(memoized, Memoized):
+            raise NativeError(f"memoStats: expected a memoized function, got `{memoized}`.")
+
+        return (f"hits: {memoized.hits}, misses: {memoized.misses}, "
+                f"evictions: {memoized.evictions}, size: {len(memoized.results)}")
+
+    def __repr__(self):
+        return "<builtin fn: 'memoStats'>"
+
+
+DEFAULT_CAPACITY : float     = 1024.0
+EVICTION_POLICIES: list[str] = ["lru", "fifo"]
+
+# Argument types that can be part of a cache key. Lox numbers are always
+# floats, ropes hash and compare like the string they stand for.
+KEYABLE: tuple[type, ...] = (float, str, Rope, bool, type(None))
+
+class Memoized(LoxCallable):
+    function : object
+    # None for unbounded.
+    capacity : int
+    policy   : str
+    # Oldest (or least recently used) first.
+    results  : OrderedDict[tuple, object]
+    hits     : int
+    misses   : int
+    evictions: int
+
+    def __init__(self, function: object, capacity: int, policy: str):
+        self.function  = function
+        self.capacity  = capacity
+        self.policy    = policy
+        self.results   = OrderedDict()
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+    def arity(self) -> int:
+        return self.function.arity()
+
+    def call(self, interp: interpreter.Interp,
+             arguments: list[object]) -> object:
+
+        key: tuple = tuple(arguments)
+        for argument in arguments:
+            if argument.__class__ is bool:
+                # `true == 1` in python, so booleans keep their type in the key.
+                key = tuple((a.__class__, a) for a in arguments)
+            elif not isinstance(argument, KEYABLE):
+                return self.function.call(interp, arguments)
+
+        results: OrderedDict[tuple, object] = self.results
+        if key in results:
+            self.hits += 1
+            if self.policy == "lru":
+                results.move_to_end(key)
+            return results[key]
+
+        self.misses += 1
+        result: object = self.function.call(interp, arguments)
+        results[key] = result
+
+        if self.capacity is not None and len(results) > self.capacity:
+            results.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def __repr__(self):
+        return f"<memoized {self.function}>"
+
+
+# ------------- Natives
+#
+# Builtins written as plain python functions taking the call's arguments.
+# Embedders add their own the same way, before making an `Interp`:
+#
+#     libffi.register("hostname", socket.gethostname)
+#
+# or to a single interpreter with `libffi.define(interp, ...)`. How many
+# arguments a native takes comes from its signature: parameters with a
+# default are optional, `*args` takes any number. Pass `arity` for
+# functions python can't tell the signature of.
+#
+# A native rejects bad arguments by raising `NativeError`, which is
+# reported like every other runtime error. Strings built with `+` arrive
+# as plain `str`s, never as ropes.
+
+class NativeError(errors.LoxRuntimeError):
+    tag = "ffi-error"
+
+class NativeFunction(LoxCallable):
+    name    : str
+    function: Callable[..., object]
+    minArgs : int
+    # None for any number of arguments.
+    maxArgs : int
+
+    def __init__(self, name: str, function: Callable[..., object], arity: int = None):
+        self.name     = name
+        self.function = function
+        self.minArgs, self.maxArgs = parameterRange(function) if arity is None else (arity, arity)
+
+    def arity(self) -> int:
+        return self.maxArgs
+
+    def call(self, interp: interpreter.Interp,
+             arguments: list[object]) -> object:
+
+        checkArguments(self.name, self.minArgs, self.maxArgs, arguments)
+        try:
+            return self.function(*[flatten(argument) for argument in arguments])
+        except NativeError as e:
+            raise NativeError(f"{self.name}: {e}") from None
+
+    def __repr__(self):
+        return f"<builtin fn: '{self.name}'>"
+
+def parameterRange(function: Callable[..., object]) -> tuple[int, int]:
+    try:
+        parameters = inspect.signature(function).parameters.values()
+    except (TypeError, ValueError):
+        return 0, None
+
+    positional: list[inspect.Parameter] = [
+        p for p in parameters
+        if p.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+    ]
+    required: int = sum(1 for p in positional if p.default is inspect.Parameter.empty)
+
+    if any(p.kind == inspect.Parameter.VAR_POSITIONAL for p in parameters):
+        return required, None
+    return required, len(positional)
+
+def checkArguments(name: str, minArgs: int, maxArgs: int, arguments: list[object]) -> None:
+    if not (minArgs <= len(arguments) and (maxArgs is None or len(arguments) <= maxArgs)):
+        raise NativeError(f"{name}: expected {describeRange(minArgs, maxArgs)} "
+                          f"but got {len(arguments)}.")
+
+def describeRange(minArgs: int, maxArgs: int) -> str:
+    if maxArgs is None:
+        return f"at least {minArgs} arguments"
+    if minArgs == maxArgs:
+        return f"{minArgs} arguments"
+    return f"{minArgs} to {maxArgs} arguments"
+
+
+# Every new `Interp` starts with these defined as globals.
+NATIVES: dict[str, LoxCallable] = {
+    "print"    : LoxPrint(),
+    "memoize"  : LoxMemoize(),
+    "memoStats": LoxMemoStats(),
+}
+
+def register(name: str, function: Callable[..., object], arity: int = None) -> None:
+    NATIVES[name] = NativeFunction(name, function, arity)
+
+def define(interp: interpreter.Interp, name: str, function: Callable[..., object],
+           arity: int = None) -> None:
+    interp.globals.define(name, NativeFunction(name, function, arity))
+
+def native(name: str) -> Callable:
+    def decorator(function: Callable[..., object]) -> Callable[..., object]:
+        register(name, function)
+        return function
+    return decorator
+
+
+# Lox numbers are floats, so indexes have to be checked for being whole
+# numbers before python will use them.
+def index(value: object, length: int, inclusive: bool = False) -> int:
+    if not isinstance(value, float) or not value.is_integer():
+        raise NativeError(f"index must be a whole number, got `{value}`.")
+
+    i: int = int(value)
+    if i < 0 or i > length or (i == length and not inclusive):
+        raise NativeError(f"index {i} out of range for length {length}.")
+    return i
+
+def wholeNumber(value: object) -> int:
+    if not isinstance(value, float) or not value.is_integer():
+        raise NativeError(f"expected a whole number, got `{value}`.")
+    return int(value)
+
+def expect(value: object, kind: type | tuple[type, ...], what: str) -> None:
+    if not isinstance(value, kind):
+        raise NativeError(f"expected {what}, got `{value}`.")
+
+
+# Seconds, for timing code.
+@native("clock")
+def native_clock() -> float:
+    return time.perf_counter()
+
+@native("len")
+def native_len(value: object) -> float:
+    expect(value, (str, LoxList, LoxMap), "a string, list or map")
+    return float(len(value))
+
+# `formatNumber(x)` drops the ".0" of whole numbers,
+# `formatNumber(x, digits)` rounds to that many decimals.
+@native("formatNumber")
+def native_format_number(number: object, digits: object = None) -> str:
+    expect(number, float, "a number")
+    if digits is None:
+        return interpreter.stringify(number)
+
+    expect(digits, float, "a number of digits")
+    return f"{number:.{index(digits, 100, True)}f}"
+
+# nil when `text` isn't a number.
+@native("parseNumber")
+def native_parse_number(text: object) -> float:
+    expect(text, str, "a string")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+# ------------- Strings
+
+@native("join")
+def native_join(items: object, separator: object) -> str:
+    expect(items, LoxList, "a list")
+    expect(separator, str, "a string separator")
+    return separator.join([item if isinstance(item, str) else str(item) for item in items])
+
+@native("split")
+def native_split(text: object, separator: object) -> LoxList:
+    expect(text, str, "a string")
+    expect(separator, str, "a string separator")
+    if separator == "":
+        return LoxList(text)
+    return LoxList(text.split(separator))
+
+# `substr(text, start)` or `substr(text, start, end)`, end exclusive.
+@native("substr")
+def native_substr(text: object, start: object, end: object = None) -> str:
+    expect(text, str, "a string")
+    first: int = index(start, len(text), True)
+    last : int = len(text) if end is None else index(end, len(text), True)
+    return text[first:last]
+
+
+# ------------- Lists and maps
+
+@native("list")
+def native_list(*items: object) -> LoxList:
+    return LoxList(items)
+
+@native("map")
+def native_map() -> LoxMap:
+    return LoxMap()
+
+@native("push")
+def native_push(items: object, value: object) -> None:
+    expect(items, LoxList, "a list")
+    items.append(value)
+
+@native("pop")
+def native_pop(items: object) -> object:
+    expect(items, LoxList, "a list")
+    if not items:
+        raise NativeError("pop from an empty list.")
+    return items.pop()
+
+# Lists by index, maps by key (nil when missing).
+@native("get")
+def native_get(collection: object, key: object) -> object:
+    if isinstance(collection, LoxList):
+        return collection[index(key, len(collection))]
+    expect(collection, LoxMap, "a list or map")
+    return collection.get(mapKey(key))
+
+@native("set")
+def native_set(collection: object, key: object, value: object) -> object:
+    if isinstance(collection, LoxList):
+        collection[index(key, len(collection))] = value
+        return value
+    expect(collection, LoxMap, "a list or map")
+    collection[mapKey(key)] = value
+    return value
+
+# Whether a list holds a value, a map a key or a string a substring.
+@native("contains")
+def native_contains(collection: object, value: object) -> bool:
+    expect(collection, (LoxList, LoxMap, str), "a list, map or string")
+    if isinstance(collection, str):
+        expect(value, str, "a string")
+    if isinstance(collection, LoxMap):
+        return mapKey(value) in collection
+    return value in collection
+
+# Returns the removed value, nil when the key wasn't there.
+@native("remove")
+def native_remove(entries: object, key: object) -> object:
+    expect(entries, LoxMap, "a map")
+    return entries.pop(mapKey(key), None)
+
+@native("keys")
+def native_keys(entries: object) -> LoxList:
+    expect(entries, LoxMap, "a map")
+    return LoxList(loxKey(key) for key in entries)
+
+@native("values")
+def native_values(entries: object) -> LoxList:
+    expect(entries, LoxMap, "a map")
+    return LoxList(entries.values())
+
+# `range(end)` or `range(start, end)`: the whole numbers from start up to,
+# not including, end.
+@native("range")
+def native_range(start: object, end: object = None) -> LoxList:
+    if end is None:
+        start, end = 0.0, start
+    return LoxList(map(float, range(wholeNumber(start), wholeNumber(end))))
+
+@native("sum")
+def native_sum(items: object) -> float:
+    expect(items, LoxList, "a list")
+    # Booleans are python ints, so they'd add up without this.
+    for item in items:
+        if type(item) is not float:
+            raise NativeError("can only sum numbers.")
+    return float(sum(items))
+
+@native("slice")
+def native_slice(items: object, start: object, end: object = None) -> LoxList:
+    expect(items, LoxList, "a list")
+    first: int = index(start, len(items), True)
+    last : int = len(items) if end is None else index(end, len(items), True)
+    return LoxList(items[first:last])
+
+@native("concat")
+def native_concat(left: object, right: object) -> LoxList:
+    expect(left, LoxList, "a list")
+    expect(right, LoxList, "a list")
+    return LoxList(left + right)
+
+# -1 when the value isn't there.
+@native("indexOf")
+def native_index_of(items: object, value: object) -> float:
+    expect(items, (LoxList, str), "a list or string")
+    if isinstance(items, str):
+        expect(value, str, "a string")
+        return float(items.find(value))
+    for i, item in enumerate(items):
+        if item is value or item == value:
+            return float(i)
+    return -1.0
+
+# Sorts in place and returns the list. Numbers or strings, not both.
+@native("sort")
+def native_sort(items: object) -> LoxList:
+    expect(items, LoxList, "a list")
+    try:
+        items.sort()
+    except TypeError:
+        raise NativeError("can only sort a list of all numbers or all strings.")
+    return items
 
+@native("reverse")
+def native_reverse(items: object) -> LoxList:
+    expect(items, LoxList, "a list")
+    items.reverse()
+    return items
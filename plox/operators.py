@@ -0,0 +1,93 @@
+from typing import Callable
+from errors import LoxRuntimeError
+from ropes import Rope, concat
+from tokens import TokenType
+
+# One function per binary operator, picked once per `Binary` node when it
+# is made instead of on every evaluation.
+#
+# Numbers are always floats by the time they get here, so each operator
+# first checks for two floats and does the plain python operation. Anything
+# else takes the slow path, which keeps the `float(...)` conversions (and
+# their quirks, e.g. `true < 2`) the interpreter always had, raising a
+# `LoxRuntimeError` for whatever `float` won't take. Adding to a string can
+# make a rope (see ropes.py).
+
+BinaryOp = Callable[[object, object], object]
+
+# The slow path's `float(value)`.
+def number(value: object) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise LoxRuntimeError("Operands must be numbers.") from None
+
+def negate(value: object) -> float:
+    if value.__class__ is float:
+        return -value
+    return -number(value)
+
+def add(left: object, right: object) -> object:
+    if left.__class__ is float and right.__class__ is float:
+        return left + right
+    if isinstance(left, str | Rope) or isinstance(right, str | Rope):
+        return concat(left, right)
+    raise LoxRuntimeError("Operands must be two numbers or two strings.")
+
+def subtract(left: object, right: object) -> object:
+    if left.__class__ is float and right.__class__ is float:
+        return left - right
+    return number(left) - number(right)
+
+def multiply(left: object, right: object) -> object:
+    if left.__class__ is float and right.__class__ is float:
+        return left * right
+    return number(left) * number(right)
+
+def divide(left: object, right: object) -> object:
+    try:
+        if left.__class__ is float and right.__class__ is float:
+            return left / right
+        return number(left) / number(right)
+    except ZeroDivisionError:
+        raise LoxRuntimeError("Division by zero.") from None
+
+def greater(left: object, right: object) -> object:
+    if left.__class__ is float and right.__class__ is float:
+        return left > right
+    return number(left) > number(right)
+
+def greater_equal(left: object, right: object) -> object:
+    if left.__class__ is float and right.__class__ is float:
+        return left >= right
+    return number(left) >= number(right)
+
+def less(left: object, right: object) -> object:
+    if left.__class__ is float and right.__class__ is float:
+        return left < right
+    return number(left) < number(right)
+
+def less_equal(left: object, right: object) -> object:
+    if left.__class__ is float and right.__class__ is float:
+        return left <= right
+    return number(left) <= number(right)
+
+def equal(left: object, right: object) -> object:
+    return left == right
+
+def not_equal(left: object, right: object) -> object:
+    return left != right
+
+
+BINARY: dict[TokenType, BinaryOp] = {
+    TokenType.PLUS         : add,
+    TokenType.MINUS        : subtract,
+    TokenType.STAR         : multiply,
+    TokenType.SLASH        : divide,
+    TokenType.GREATER      : greater,
+    TokenType.GREATER_EQUAL: greater_equal,
+    TokenType.LESS         : less,
+    TokenType.LESS_EQUAL   : less_equal,
+    TokenType.EQUAL_EQUAL  : equal,
+    TokenType.BANG_EQUAL   : not_equal,
+}
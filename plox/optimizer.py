@@ -0,0 +1,225 @@
+from stmt import *
+from expr import *
+from tokens import Token, TokenType
+from errors import LoxRuntimeError
+from operators import BINARY, BinaryOp, negate
+from ropes import flatten
+
+# Optimization pass that runs between `parse` and the resolver.
+#
+#   - `Binary`, `Unary` and `Logical` nodes whose operands are literals are
+#     folded into a single `Literal`, `Grouping`s are dropped.
+#   - `If`s with a literal condition are replaced by the branch that would
+#     run, `while (<falsy literal>)` loops are removed.
+#   - `Block`s that declare nothing are spliced into the enclosing list of
+#     statements, they don't need a scope of their own.
+#
+# Folding has to give exactly the same result `eval_binary`/`eval_unary`
+# would, quirks included. Anything that would fail at runtime (e.g.
+# `1 / 0`, `"a" - 1`) is left alone so it still fails at runtime.
+#
+# This has to run before the resolver: removing scopes changes the
+# depths and slots it hands out.
+
+def optimize(stmts: list[Stmt]) -> list[Stmt]:
+    return optimizeStatements(stmts)
+
+def optimizeStatements(stmts: list[Stmt]) -> list[Stmt]:
+    out: list[Stmt] = []
+
+    for stmt in stmts:
+        stmt = optimizeStmt(stmt)
+
+        if stmt is None:
+            continue
+        if isinstance(stmt, Block) and not declaresAnything(stmt):
+            out.extend(stmt.statements)
+        else:
+            out.append(stmt)
+
+    return out
+
+# Returns None when the statement does nothing at all.
+def optimizeStmt(stmt: Stmt) -> Stmt:
+    if isinstance(stmt, Expression):
+        stmt.expression = optimizeExpr(stmt.expression)
+        if isinstance(stmt.expression, Literal):
+            return None
+        return stmt
+    elif isinstance(stmt, Var):
+        if stmt.initializer is not None:
+            stmt.initializer = optimizeExpr(stmt.initializer)
+        return stmt
+    elif isinstance(stmt, Block):
+        stmt.statements = optimizeStatements(stmt.statements)
+        return stmt
+    elif isinstance(stmt, If):
+        return optimizeIfStmt(stmt)
+    elif isinstance(stmt, While):
+        return optimizeWhileStmt(stmt)
+    elif isinstance(stmt, ForIn):
+        stmt.iterable = optimizeExpr(stmt.iterable)
+        stmt.body     = optimizeBranch(stmt.body)
+        return stmt
+    elif isinstance(stmt, Return):
+        if stmt.value is not None:
+            stmt.value = optimizeExpr(stmt.value)
+        return stmt
+    elif isinstance(stmt, Function):
+        stmt.body = optimizeStatements(stmt.body)
+        return stmt
+    elif isinstance(stmt, Class):
+        for method in stmt.methods:
+            optimizeStmt(method)
+        return stmt
+
+    return stmt
+
+def optimizeIfStmt(stmt: If) -> Stmt:
+    stmt.condition = optimizeExpr(stmt.condition)
+
+    if isinstance(stmt.condition, Literal):
+        branch: Stmt = stmt.thenBranch if isTruthy(stmt.condition.value) else stmt.elseBranch
+        if branch is None:
+            return None
+        return optimizeStmt(branch)
+
+    stmt.thenBranch = optimizeBranch(stmt.thenBranch)
+    if stmt.elseBranch is not None:
+        stmt.elseBranch = optimizeStmt(stmt.elseBranch)
+    return stmt
+
+def optimizeWhileStmt(stmt: While) -> Stmt:
+    stmt.condition = optimizeExpr(stmt.condition)
+
+    if isinstance(stmt.condition, Literal) and not isTruthy(stmt.condition.value):
+        return None
+
+    stmt.body = optimizeBranch(stmt.body)
+    return stmt
+
+# `If`, `While` and `ForIn` need *some* statement to run, even an empty one.
+def optimizeBranch(stmt: Stmt) -> Stmt:
+    stmt = optimizeStmt(stmt)
+    if stmt is None:
+        return Block([])
+    return stmt
+
+def declaresAnything(block: Block) -> bool:
+    return any(isinstance(stmt, Var | Function | Class) for stmt in block.statements)
+
+
+def optimizeExpr(expr: Expr) -> Expr:
+    if isinstance(expr, Binary):
+        return optimizeBinaryExpr(expr)
+    elif isinstance(expr, Unary):
+        return optimizeUnaryExpr(expr)
+    elif isinstance(expr, Grouping):
+        return optimizeExpr(expr.expression)
+    elif isinstance(expr, Logical):
+        return optimizeLogicalExpr(expr)
+    elif isinstance(expr, Assign):
+        expr.value = optimizeExpr(expr.value)
+    elif isinstance(expr, Call):
+        expr.callee    = optimizeExpr(expr.callee)
+        expr.arguments = [optimizeExpr(arg) for arg in expr.arguments]
+    elif isinstance(expr, Get):
+        expr.object = optimizeExpr(expr.object)
+    elif isinstance(expr, Set):
+        expr.object = optimizeExpr(expr.object)
+        expr.value  = optimizeExpr(expr.value)
+    elif isinstance(expr, ListLiteral):
+        expr.elements = [optimizeExpr(element) for element in expr.elements]
+    elif isinstance(expr, MapLiteral):
+        expr.keys   = [optimizeExpr(key) for key in expr.keys]
+        expr.values = [optimizeExpr(value) for value in expr.values]
+    elif isinstance(expr, Index):
+        expr.object = optimizeExpr(expr.object)
+        expr.index  = optimizeExpr(expr.index)
+    elif isinstance(expr, SetIndex):
+        expr.object = optimizeExpr(expr.object)
+        expr.index  = optimizeExpr(expr.index)
+        expr.value  = optimizeExpr(expr.value)
+
+    return expr
+
+def optimizeBinaryExpr(expr: Binary) -> Expr:
+    expr.left  = optimizeExpr(expr.left)
+    expr.right = optimizeExpr(expr.right)
+
+    if not (isinstance(expr.left, Literal) and isinstance(expr.right, Literal)):
+        return expr
+
+    try:
+        return Literal(foldBinary(expr.operator, expr.left.value, expr.right.value))
+    except (LoxRuntimeError, ValueError, OverflowError):
+        return expr
+
+def optimizeUnaryExpr(expr: Unary) -> Expr:
+    expr.expr = optimizeExpr(expr.expr)
+
+    if not isinstance(expr.expr, Literal):
+        return expr
+
+    try:
+        return Literal(foldUnary(expr.operator, expr.expr.value))
+    except (LoxRuntimeError, ValueError):
+        return expr
+
+def optimizeLogicalExpr(expr: Logical) -> Expr:
+    expr.left  = optimizeExpr(expr.left)
+    expr.right = optimizeExpr(expr.right)
+
+    if not isinstance(expr.left, Literal):
+        return expr
+
+    # The left operand decides on its own whether the right one is even
+    # looked at, so the right one doesn't have to be constant.
+    if expr.operator.type == TokenType.OR:
+        return expr.left if isTruthy(expr.left.value) else expr.right
+    return expr.right if isTruthy(expr.left.value) else expr.left
+
+
+# Same semantics as `eval_binary`/`eval_unary`. Raises for anything that
+# should be left to fail at runtime.
+def foldBinary(operator: Token, left: object, right: object) -> object:
+    op: BinaryOp = BINARY.get(operator.type)
+    if op is None:
+        raise ValueError(operator.lexeme)
+    # A folded string goes into the program as a literal, so it has to be a
+    # plain one.
+    return flatten(op(left, right))
+
+def foldUnary(operator: Token, right: object) -> object:
+    match operator.type:
+        case TokenType.MINUS:
+            return negate(right)
+        case TokenType.BANG:
+            return not isTruthy(right)
+
+    raise ValueError(operator.lexeme)
+
+def isTruthy(value: object) -> bool:
+    if value is None:
+        return False
+    if isinstance(value, bool):
+        return value
+    return True
+
+
+if __name__ == "__main__":
+    import sys
+    from pprint import pprint
+    from scanner import scan
+    from parser import parse
+
+    def readFile(path: str) -> str:
+        f = open(path)
+        c = f.read()
+        f.close()
+        return c
+
+    path: str = sys.argv[1] if len(sys.argv) > 1 else "tests/test-script.txt"
+    stmts: list[Stmt] = optimize(parse(scan(readFile(path))))
+
+    [pprint(x) for x in stmts]
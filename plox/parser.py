@@ -1,26 +1,33 @@
 
+from typing import Iterable, Iterator
+from errors import ParseError
 from tokens import Token, TokenType
 from expr import *
 from stmt import *
 
+# The parser never looks further ahead than the next token, so instead of
+# indexing into a token list it pulls tokens from any iterator, e.g. the
+# generator from `scanner.scanIter`, and only holds on to two of them.
 class ParseState:
-    tokens : list[Token]
-    current: int
+    tokens  : Iterator[Token]
+    current : Token
+    previous: Token
 
-    def __init__(self, tokens: list[Token]):
-        self.tokens  = tokens
-        self.current = 0
+    def __init__(self, tokens: Iterable[Token]):
+        self.tokens   = iter(tokens)
+        self.current  = next(self.tokens)
+        self.previous = None
 
 
-def parse(tokens: list[Token]) -> list[Stmt]:
-    parser = ParseState(tokens)
+def parse(tokens: Iterable[Token]) -> list[Stmt]:
+    return list(parseIter(tokens))
 
-    statements: list[Stmt] = []
+# Yields top-level declarations one at a time as they are parsed.
+def parseIter(tokens: Iterable[Token]) -> Iterator[Stmt]:
+    parser = ParseState(tokens)
 
     while not isAtEnd(parser):
-        statements.append(declaration(parser))
-
-    return statements
+        yield declaration(parser)
 
 
 # --------- Statements
@@ -44,6 +51,9 @@ def statement(parser: ParseState) -> Stmt:
     if matches(parser, TokenType.WHILE):
         return whileStatement(parser)
 
+    if matches(parser, TokenType.FOR):
+        return forInStatement(parser)
+
     if matches(parser, TokenType.RETURN):
         return returnStatement(parser)
 
@@ -123,6 +133,17 @@ def whileStatement(parser: ParseState) -> Expr:
     body: Stmt = statement(parser)
     return While(condition, body)
 
+def forInStatement(parser: ParseState) -> Stmt:
+    consume(parser, TokenType.LEFT_PAREN, "Expect '(' after 'for'.")
+    consume(parser, TokenType.VAR, "Expect 'var' after 'for ('.")
+    name: Token = consume(parser, TokenType.IDENTIFIER, "Expect loop variable name.")
+    consume(parser, TokenType.IN, "Expect 'in' after loop variable.")
+    iterable: Expr = expression(parser)
+    consume(parser, TokenType.RIGHT_PAREN, "Expect ')' after for clauses.")
+    body: Stmt = statement(parser)
+
+    return ForIn(name, iterable, body)
+
 def ifStatement(parser: ParseState) -> Expr:
     consume(parser, TokenType.LEFT_PAREN, "Expect '(' after 'if'.")
     cond: Expr = expression(parser)
@@ -159,9 +180,11 @@ def assignment(parser: ParseState) -> Expr:
         # class.field = value
         elif isinstance(expr, Get):
             return Set(expr.object, expr.name, value)
+        # list[index] = value
+        elif isinstance(expr, Index):
+            return SetIndex(expr.object, expr.bracket, expr.index, value)
 
-        print("[parser-error] invalid assignment target: `{expr}`")
-        exit(1)
+        raise ParseError(f"invalid assignment target: `{expr}`")
 
     return expr
 
@@ -171,7 +194,7 @@ def _or(parser: ParseState) -> Expr:
     while matches(parser, TokenType.OR):
         operator: Token = previous(parser)
         right: Expr = _and(parser)
-        expr = Binary(expr, operator, right)
+        expr = Logical(expr, operator, right)
 
     return expr
 
@@ -181,7 +204,7 @@ def _and(parser: ParseState) -> Expr:
     while matches(parser, TokenType.AND):
         operator: Token = previous(parser)
         right: Expr = equality(parser)
-        expr = Binary(expr, operator, right)
+        expr = Logical(expr, operator, right)
 
     return expr
 
@@ -264,6 +287,11 @@ def call(parser: ParseState) -> Expr:
             name: Token = consume(parser, TokenType.IDENTIFIER,
                                   "Expect property name after '.'.")
             expr = Get(expr, name)
+        elif matches(parser, TokenType.LEFT_BRACKET):
+            bracket: Token = previous(parser)
+            index  : Expr  = expression(parser)
+            consume(parser, TokenType.RIGHT_BRACKET, "Expect ']' after index.")
+            expr = Index(expr, bracket, index)
         else:
             break
 
@@ -288,16 +316,50 @@ def primary(parser: ParseState) -> Expr:
         consume(parser, TokenType.RIGHT_PAREN, "Expect ')' after expression")
         return Grouping(expr)
 
-    print(f"[parser-error] unimplemented primary token: `{peek(parser).lexeme}`")
-    exit(1)
+    if matches(parser, TokenType.LEFT_BRACKET):
+        return listLiteral(parser)
+
+    # Only reached where an expression is expected: a `{` starting a
+    # statement is a block.
+    if matches(parser, TokenType.LEFT_BRACE):
+        return mapLiteral(parser)
+
+    raise ParseError(f"unimplemented primary token: `{peek(parser).lexeme}`")
+
+def listLiteral(parser: ParseState) -> Expr:
+    bracket : Token      = previous(parser)
+    elements: list[Expr] = []
+
+    if not check(parser, TokenType.RIGHT_BRACKET):
+        elements.append(expression(parser))
+        while matches(parser, TokenType.COMMA):
+            elements.append(expression(parser))
+
+    consume(parser, TokenType.RIGHT_BRACKET, "Expect ']' after list elements.")
+    return ListLiteral(bracket, elements)
+
+def mapLiteral(parser: ParseState) -> Expr:
+    brace : Token      = previous(parser)
+    keys  : list[Expr] = []
+    values: list[Expr] = []
+
+    if not check(parser, TokenType.RIGHT_BRACE):
+        while True:
+            keys.append(expression(parser))
+            consume(parser, TokenType.COLON, "Expect ':' after map key.")
+            values.append(expression(parser))
+            if not matches(parser, TokenType.COMMA):
+                break
+
+    consume(parser, TokenType.RIGHT_BRACE, "Expect '}' after map entries.")
+    return MapLiteral(brace, keys, values)
 
 # ----------- HELPERS
 
 def consume(parser, type: TokenType, message: str) -> Token:
     if check(parser, type):
         return advance(parser)
-    print(f"[parser-error] {message}")
-    exit(1)
+    raise ParseError(f"{message}")
 
 def matches(parser, *types: TokenType) -> bool:
     for type in types:
@@ -312,19 +374,20 @@ def check(parser: ParseState, type: TokenType) -> bool:
 
     return peek(parser).type == type
     
-def advance(parser: ParseState) -> bool:
+def advance(parser: ParseState) -> Token:
     if not isAtEnd(parser):
-        parser.current+=1
-    return previous(parser)
+        parser.previous = parser.current
+        parser.current  = next(parser.tokens)
+    return parser.previous
 
 def isAtEnd(parser: ParseState) -> bool:
-    return peek(parser).type == TokenType.EOF
+    return parser.current.type == TokenType.EOF
 
 def peek(parser: ParseState) -> Token:
-    return parser.tokens[parser.current]
+    return parser.current
 
 def previous(parser: ParseState) -> Token:
-    return parser.tokens[parser.current - 1]
+    return parser.previous
 
 
 
@@ -0,0 +1,182 @@
+from __future__ import annotations
+import dataclasses
+import time
+from types import ModuleType
+from typing import TextIO
+
+from expr import Expr
+from stmt import Stmt
+from tokens import Token
+
+# Profiler for the tree-walker.
+#
+# Nothing in the interpreter checks whether profiling is on. `start`
+# swaps the interpreter module's global `evaluate` and
+# `LoxFunction.callIn` for counting versions and `stop` puts the
+# originals back, so when the profiler isn't running it costs nothing.
+#
+# It records:
+#   - calls, inclusive and exclusive wall time per Lox function,
+#   - how many statements ran on each source line,
+#   - exclusive time per call stack, for `writeCollapsed`.
+#
+# A tail call (`return f(...)`) is run by the `callIn` of the function it
+# returns from, so it is counted as part of that call.
+
+SCRIPT: str = "<script>"
+
+@dataclasses.dataclass
+class FunctionStats:
+    name     : str
+    line     : int
+    calls    : int   = 0
+    inclusive: float = 0.0
+    exclusive: float = 0.0
+
+class Profile:
+    interpreter: ModuleType
+    functions  : dict[tuple[str, int], FunctionStats]
+    lines      : dict[int, int]
+    # "<script>;outer;inner" -> exclusive seconds
+    stacks     : dict[str, float]
+    # One [stack, start, time spent in callees] per active call.
+    frames     : list[list]
+    # How many calls of each function are on the stack, so recursive calls
+    # only add to the inclusive time of the outermost one.
+    active     : dict[tuple[str, int], int]
+    nodeLines  : dict[int, int]
+    # The `evaluate` and `callIn` that `start` replaced.
+    originals  : tuple
+
+    def __init__(self, interpreter: ModuleType):
+        self.interpreter = interpreter
+        self.functions   = {}
+        self.lines       = {}
+        self.stacks      = {}
+        self.frames      = []
+        self.active      = {}
+        self.nodeLines   = {}
+        self.originals   = None
+
+
+def start(interpreter: ModuleType) -> Profile:
+    profile = Profile(interpreter)
+
+    evaluate = interpreter.evaluate
+    callIn   = interpreter.LoxFunction.callIn
+    lines    = profile.lines
+
+    def profiled_evaluate(interp, node: Stmt | Expr) -> object:
+        if isinstance(node, Stmt):
+            line: int = lineOf(profile, node)
+            lines[line] = lines.get(line, 0) + 1
+        return evaluate(interp, node)
+
+    def profiled_callIn(function, interp, closure, arguments: list[object]) -> object:
+        enter(profile, function.declaration.name)
+        try:
+            return callIn(function, interp, closure, arguments)
+        finally:
+            leave(profile, function.declaration.name)
+
+    profile.originals              = (evaluate, callIn)
+    interpreter.evaluate           = profiled_evaluate
+    interpreter.LoxFunction.callIn = profiled_callIn
+
+    profile.frames.append([SCRIPT, time.perf_counter(), 0.0])
+    return profile
+
+def stop(profile: Profile) -> None:
+    evaluate, callIn = profile.originals
+    profile.interpreter.evaluate           = evaluate
+    profile.interpreter.LoxFunction.callIn = callIn
+
+    # Close whatever was still running, e.g. when the script exited with
+    # an error in the middle of a call.
+    while profile.frames:
+        leave(profile, None)
+
+
+def enter(profile: Profile, name: Token) -> None:
+    key: tuple[str, int] = (name.lexeme, name.line)
+    profile.active[key] = profile.active.get(key, 0) + 1
+
+    stack: str = f"{profile.frames[-1][0]};{name.lexeme}"
+    profile.frames.append([stack, time.perf_counter(), 0.0])
+
+def leave(profile: Profile, name: Token) -> None:
+    stack, started, inCallees = profile.frames.pop()
+    inclusive: float = time.perf_counter() - started
+    exclusive: float = inclusive - inCallees
+
+    if profile.frames:
+        profile.frames[-1][2] += inclusive
+
+    profile.stacks[stack] = profile.stacks.get(stack, 0.0) + exclusive
+
+    if name is None:
+        return
+
+    key  : tuple[str, int] = (name.lexeme, name.line)
+    stats: FunctionStats   = profile.functions.get(key)
+    if stats is None:
+        stats = FunctionStats(name.lexeme, name.line)
+        profile.functions[key] = stats
+
+    profile.active[key] -= 1
+    stats.calls     += 1
+    stats.exclusive += exclusive
+    if profile.active[key] == 0:
+        stats.inclusive += inclusive
+
+# Nodes don't store a line of their own, so use the first token found
+# inside them. Nodes live as long as the program does, so caching by `id`
+# is safe while profiling.
+def lineOf(profile: Profile, node: object) -> int:
+    line: int = profile.nodeLines.get(id(node))
+    if line is None:
+        token: Token = firstToken(node)
+        line = token.line if token is not None else 0
+        profile.nodeLines[id(node)] = line
+    return line
+
+def firstToken(node: object) -> Token:
+    if isinstance(node, Token):
+        return node
+    if isinstance(node, list):
+        for child in node:
+            token: Token = firstToken(child)
+            if token is not None:
+                return token
+        return None
+    if not isinstance(node, Stmt | Expr):
+        return None
+
+    for f in dataclasses.fields(node):
+        token: Token = firstToken(getattr(node, f.name))
+        if token is not None:
+            return token
+    return None
+
+
+def report(profile: Profile, out: TextIO, limit: int = 20) -> None:
+    functions: list[FunctionStats] = sorted(profile.functions.values(),
+                                            key=lambda s: s.exclusive, reverse=True)
+
+    print("== functions (by exclusive time) ==", file=out)
+    print(f"{'calls':>10}{'inclusive':>12}{'exclusive':>12}  function", file=out)
+    for stats in functions[:limit]:
+        print(f"{stats.calls:>10}{stats.inclusive:>11.3f}s{stats.exclusive:>11.3f}s"
+              f"  {stats.name} (line {stats.line})", file=out)
+
+    print("== lines (by statements executed) ==", file=out)
+    print(f"{'count':>10}  line", file=out)
+    for line, count in sorted(profile.lines.items(), key=lambda lc: lc[1], reverse=True)[:limit]:
+        print(f"{count:>10}  {line}", file=out)
+
+# One "<script>;caller;callee <microseconds>" line per call stack, the
+# collapsed format flamegraph.pl and speedscope read.
+def writeCollapsed(profile: Profile, path: str) -> None:
+    with open(path, "w") as f:
+        for stack, seconds in sorted(profile.stacks.items()):
+            f.write(f"{stack} {round(seconds * 1e6)}\n")
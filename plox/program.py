@@ -0,0 +1,126 @@
+from __future__ import annotations
+from typing import Callable
+
+import budgets
+import libffi
+import optimizer
+from containers import LoxList, LoxMap, mapKey
+from errors import ResolveError
+from expr import Expr
+from interpreter import Interp, evaluate, runGuarded
+from lox_callable import LoxCallable
+from parser import parse
+from resolver import Resolver, resolve, resolveStatements
+from ropes import flatten
+from scanner import scan
+from stmt import Expression, Stmt
+
+# Running Lox from inside a python program, many times over:
+#
+#     area = program.compile("width * height;")
+#     area.run({"width": 3, "height": 4})       # 12.0
+#
+# `compile` does the scanning, parsing, optimizing and resolving once, and
+# for the closure and VM backends the compiling too, so `run` only has to
+# execute. Every run gets an `Interp` of its own: globals one run defines
+# are gone by the next, and nothing is left to clean up after an error.
+#
+# Nothing calls `exit`. Any problem with the program is raised as an
+# `errors.LoxError`, telling by its class what went wrong:
+# `ScanError`, `ParseError`, `ResolveError` from `compile`,
+# `LoxRuntimeError` (including `libffi.NativeError`) and
+# `budgets.BudgetExceeded` from `run`. Problems that don't stop the
+# program, like a variable declared twice in the same scope, are left in
+# `Program.warnings` instead.
+#
+# What `print` prints still goes to `sys.stdout`.
+
+class Program:
+    backend: str
+    # What the backend runs, made once by `compile`: the statements for the
+    # tree-walker, a list of closures, or the VM's script.
+    code   : object
+    # The final expression statement, whose value `run` returns. None when
+    # the program doesn't end in one.
+    result : Expr
+    # `result` compiled for the closure backend.
+    resultCode: Callable[[Interp], object]
+    # What the resolver found wrong that doesn't stop the program.
+    warnings  : list[ResolveError]
+
+    def __init__(self, stmts: list[Stmt], result: Expr, backend: str,
+                 warnings: list[ResolveError] = None):
+        self.backend    = backend
+        self.result     = result
+        self.resultCode = None
+        self.warnings   = warnings if warnings is not None else []
+
+        if backend == "closure":
+            import closures
+            self.code = closures.compile_program(stmts)
+            if result is not None:
+                self.resultCode = closures.compile_node(result)
+        elif backend == "vm":
+            import compiler
+            self.code = compiler.compile_program(stmts, result)
+        else:
+            self.code = stmts
+
+    # Defines `globals` on top of the natives, runs the program and returns
+    # the value of its last statement, if that is an expression. Python
+    # ints, lists, tuples and dicts come in as Lox numbers, lists and maps,
+    # and functions as natives.
+    def run(self, globals: dict[str, object] = None,
+            budget: budgets.Budget = None) -> object:
+        interp = Interp()
+        for name, value in (globals or {}).items():
+            interp.globals.define(name, toLox(value, name))
+
+        return flatten(runGuarded(interp, budget, lambda: self.execute(interp)))
+
+    def execute(self, interp: Interp) -> object:
+        if self.backend == "closure":
+            import closures
+            closures.run(interp, self.code)
+            return self.resultCode(interp) if self.resultCode is not None else None
+
+        if self.backend == "vm":
+            import vm
+            return vm.interpret(interp, self.code)
+
+        for stmt in self.code:
+            evaluate(interp, stmt)
+        return evaluate(interp, self.result) if self.result is not None else None
+
+
+def compile(source: str, backend: str = "tree", optimize: bool = True) -> Program:
+    stmts : list[Stmt] = parse(scan(source))
+    # Taken off before optimizing, which drops expression statements that
+    # do nothing, like `1 + 2;`.
+    result: Expr       = stmts.pop().expression if stmts and isinstance(stmts[-1], Expression) \
+                         else None
+
+    if optimize:
+        stmts = optimizer.optimize(stmts)
+        if result is not None:
+            result = optimizer.optimizeExpr(result)
+
+    # Resolving only annotates the tree, the resolver isn't needed after.
+    resolver = Resolver()
+    resolveStatements(resolver, stmts)
+    if result is not None:
+        resolve(resolver, result)
+    return Program(stmts, result, backend, resolver.warnings)
+
+def toLox(value: object, name: str) -> object:
+    if value is None or isinstance(value, bool | float | str | LoxCallable | LoxList | LoxMap):
+        return value
+    if isinstance(value, int):
+        return float(value)
+    if isinstance(value, list | tuple):
+        return LoxList(toLox(item, name) for item in value)
+    if isinstance(value, dict):
+        return LoxMap((mapKey(toLox(k, name)), toLox(v, name)) for k, v in value.items())
+    if callable(value):
+        return libffi.NativeFunction(name, value)
+    return value
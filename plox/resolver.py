@@ -1,4 +1,7 @@
+from __future__ import annotations
 from enum import Enum, auto
+from typing import Callable
+from errors import ResolveError
 from stmt import *
 from expr import *
 from tokens import Token
@@ -13,23 +16,71 @@ class ClassType(Enum):
     NONE =auto()
     CLASS=auto()
 
+# Escape analysis: a local that an inner function refers to is
+# "captured" and lives in its scope's environment, where closures can keep
+# it alive. Every other local declared in a function lives in the call's
+# frame, a flat array nothing outlives the call with, and scopes left with
+# no captured variables get no environment at all. Top-level locals always
+# live in environments.
+#
+# Whether a variable is captured is only known once its whole scope has
+# been resolved, so until then the nodes that declare or refer to it are
+# collected here, and `endScope` tells them where to look.
+class Scope:
+    # How many functions deep the scope is, 0 at the top level.
+    function    : int
+    # Every name in declaration order, with the frame slot it would get.
+    frameSlots  : dict[str, int]
+    captured    : set[str]
+    declarations: list[tuple[Stmt, str]]
+    # The nodes referring to a variable, with the scopes between them and
+    # this one.
+    references  : list[tuple[Expr, str, list[Scope]]]
+    # Filled in by `endScope`: the environment slot of every captured name.
+    slots       : dict[str, int]
+
+    def __init__(self, function: int):
+        self.function     = function
+        self.frameSlots   = {}
+        self.captured     = set()
+        self.declarations = []
+        self.references   = []
+        self.slots        = {}
+
 class Resolver:
     scopes         : list[dict[str, bool]]
+    # Parallel to `scopes`: where their variables will live at runtime.
+    variables      : list[Scope]
+    # How many frame slots each function being resolved has handed out,
+    # starting with the top level.
+    frameSizes     : list[int]
     currentFunction: FunctionType
-    resolutions    : dict[Expr, int]
     currentClass   : ClassType
+    # Errors that don't stop the program from running, in the order they
+    # were found. Nothing prints them but the command line, which sets
+    # `onWarning` to see each one as it comes.
+    warnings       : list[ResolveError]
+    onWarning      : Callable[[ResolveError], None]
+    # Nodes resolved so far, not counting the bodies of functions, which
+    # are charged to their calls instead. Loops and functions take their
+    # `cost` from it.
+    nodes          : int
 
     def __init__(self):
         self.scopes          = []
+        self.variables       = []
+        self.frameSizes      = [0]
         self.currentFunction = FunctionType.NONE
-        self.resolutions     = {}
         self.currentClass    = ClassType.NONE
+        self.warnings        = []
+        self.onWarning       = None
+        self.nodes           = 0
     
 
 def resolve(resolver: Resolver, stmt: Stmt | Expr) -> None:
     assert isinstance(resolver, Resolver)
     assert isinstance(stmt, Stmt | Expr)
-
+    resolver.nodes += 1
 
     if isinstance(stmt, Var):
         resolveVarStmt(resolver, stmt)
@@ -69,20 +120,34 @@ def resolve(resolver: Resolver, stmt: Stmt | Expr) -> None:
         resolveSetExpr(resolver, stmt)
     elif isinstance(stmt, This):
         resolveThisExpr(resolver, stmt)
+    elif isinstance(stmt, ForIn):
+        resolveForInStmt(resolver, stmt)
+    elif isinstance(stmt, ListLiteral):
+        resolveListLiteralExpr(resolver, stmt)
+    elif isinstance(stmt, MapLiteral):
+        resolveMapLiteralExpr(resolver, stmt)
+    elif isinstance(stmt, Index):
+        resolveIndexExpr(resolver, stmt)
+    elif isinstance(stmt, SetIndex):
+        resolveSetIndexExpr(resolver, stmt)
     else:
-        print(f"[resolver-error] unimplemented expression: `{type(stmt)}`")
-        exit(1)
+        raise ResolveError(f"unimplemented expression: `{type(stmt)}`")
 
 
-def resolveLocal(resolver: Resolver, expr: Expr, name: Token) -> None:
+# Where the variable lives is stored on the node itself, once `endScope`
+# knows. Nodes that aren't found in any scope are left alone and are
+# looked up as globals.
+def resolveLocal(resolver: Resolver, expr: Variable | Assign | This, name: Token) -> None:
     i =  len(resolver.scopes) - 1
 
     while i >= 0:
         contains_name = name.lexeme in resolver.scopes[i].keys()
 
         if contains_name:
-            hops = len(resolver.scopes) -1 - i
-            resolver.resolutions[expr] = hops
+            scope: Scope = resolver.variables[i]
+            if scope.function != len(resolver.frameSizes) - 1:
+                scope.captured.add(name.lexeme)
+            scope.references.append((expr, name.lexeme, resolver.variables[i + 1:]))
             return
 
         i-=1
@@ -91,14 +156,25 @@ def resolveFunction(resolver: Resolver, fun: Function, type: FunctionType) -> No
     enclosingFunction: FunctionType = resolver.currentFunction
     resolver.currentFunction = type
 
+    resolver.frameSizes.append(0)
     beginScope(resolver)
+    nodes: int = resolver.nodes
 
     for param in fun.params:
         declare(resolver, param)
         define(resolver, param)
 
     resolveStatements(resolver, fun.body)
-    endScope(resolver)
+    scope: Scope = endScope(resolver)
+
+    # At least one, so endless recursion always runs out of budget.
+    fun.cost       = max(resolver.nodes - nodes, 1)
+    resolver.nodes = nodes
+
+    fun.scopeSize      = len(scope.slots)
+    fun.frameSize      = resolver.frameSizes.pop()
+    fun.capturedParams = [(i, scope.slots[param.lexeme]) for i, param in enumerate(fun.params)
+                          if param.lexeme in scope.slots]
 
     resolver.currentFunction = enclosingFunction
 
@@ -109,9 +185,31 @@ def resolveStatements(resolver: Resolver, statements: list[Stmt]) -> None:
     for stmt in statements:
         resolve(resolver, stmt)
 
+# For programs resolved a statement at a time, like the REPL's. A
+# `ResolveError` stops the resolver wherever it was, e.g. still inside a
+# method with the method's scopes open, which the next statement would be
+# resolved in. This puts it back the way it was before the statement.
+def resolveIncremental(resolver: Resolver, stmt: Stmt) -> None:
+    depth          : int          = len(resolver.scopes)
+    frameSizes     : list[int]    = list(resolver.frameSizes)
+    currentFunction: FunctionType = resolver.currentFunction
+    currentClass   : ClassType    = resolver.currentClass
+    nodes          : int          = resolver.nodes
+
+    try:
+        resolve(resolver, stmt)
+    except ResolveError:
+        del resolver.scopes[depth:]
+        del resolver.variables[depth:]
+        resolver.frameSizes      = frameSizes
+        resolver.currentFunction = currentFunction
+        resolver.currentClass    = currentClass
+        resolver.nodes           = nodes
+        raise
+
 
 def resolveVarStmt(resolver: Resolver, stmt: Var) -> None:
-    declare(resolver, stmt.name)
+    declare(resolver, stmt.name, stmt)
     if stmt.initializer:
         resolve(resolver, stmt.initializer)
 
@@ -126,8 +224,7 @@ def resolveVariableExpr(resolver: Resolver, expr: Variable) -> None:
         idk = resolver.scopes[-1].get(expr.name.lexeme)
 
     if resolver.scopes != [] and idk == False:
-        print(f"[resolver-error] Can't read local variable in it's own initializer: `{expr.name.lexeme}`.")
-        exit(1)
+        raise ResolveError(f"Can't read local variable in it's own initializer: `{expr.name.lexeme}`.")
 
     resolveLocal(resolver, expr, expr.name)
     return None
@@ -151,11 +248,15 @@ def resolveClassStmt(resolver: Resolver, stmt: Class) -> None:
     enclosingClass: ClassType = resolver.currentClass
     resolver.currentClass = ClassType.CLASS
 
-    declare(resolver, stmt.name)
+    declare(resolver, stmt.name, stmt)
     define(resolver, stmt.name)
 
+    # `bind` always makes the environment holding `this`, so it counts as
+    # captured even if no method uses it.
     beginScope(resolver)
     resolver.scopes[-1]["this"] = True
+    resolver.variables[-1].frameSlots["this"] = None
+    resolver.variables[-1].captured.add("this")
 
     for method in stmt.methods:
         declaration: FunctionType = FunctionType.METHOD
@@ -169,21 +270,38 @@ def resolveClassStmt(resolver: Resolver, stmt: Class) -> None:
 
 def resolveThisExpr(resolver: Resolver, expr: This) -> None:
     if resolver.currentClass == ClassType.NONE:
-        print("[resolver-error] Can't use 'this' outside of a class.")
-        exit(1)
+        raise ResolveError("Can't use 'this' outside of a class.")
     resolveLocal(resolver, expr, expr.keyword)
     
 def resolveFunctionStmt(resolver: Resolver, stmt: Function) -> None:
-    declare(resolver, stmt.name)
+    declare(resolver, stmt.name, stmt)
     define(resolver, stmt.name)
 
     resolveFunction(resolver, stmt, FunctionType.FUNCTION)
     return None
 
+# Blocks without declarations (most loop bodies) are resolved as part of
+# the enclosing scope, so no backend has to make an environment for them.
 def resolveBlockStmt(resolver: Resolver, stmt: Block) -> None:
+    if not any(isinstance(s, Var | Function | Class) for s in stmt.statements):
+        resolveStatements(resolver, stmt.statements)
+        stmt.scopeSize = 0
+        return
+
     beginScope(resolver)
     resolveStatements(resolver, stmt.statements)
-    endScope(resolver)
+    stmt.scopeSize = len(endScope(resolver).slots)
+
+def resolveForInStmt(resolver: Resolver, stmt: ForIn) -> None:
+    resolve(resolver, stmt.iterable)
+
+    beginScope(resolver)
+    declare(resolver, stmt.name, stmt)
+    define(resolver, stmt.name)
+    nodes: int = resolver.nodes
+    resolve(resolver, stmt.body)
+    stmt.scopeSize = len(endScope(resolver).slots)
+    stmt.cost      = resolver.nodes - nodes
 
 def resolveCallExpr(resolver: Resolver, expr: Call) -> None:
     resolve(resolver, expr.callee)
@@ -210,7 +328,7 @@ def resolveLiteralExpr(resolver, expr: Literal) -> None:
     return None
 
 def resolveUnaryExpr(resolver: Resolver, expr: Unary) -> None:
-    resolve(resolver, expr.right)
+    resolve(resolver, expr.expr)
     return None
 
 def resolveExpressionStmt(resolver: Resolver, stmt: Expression)  -> None:
@@ -225,25 +343,51 @@ def resolveIfStmt(resolver: Resolver, stmt: If) -> None:
     return None
 
 def resolveWhileStmt(resolver: Resolver, stmt: While) -> None:
+    nodes: int = resolver.nodes
     resolve(resolver, stmt.condition)
-    resolveStatements(resolver, stmt.body)
+    resolve(resolver, stmt.body)
+    stmt.cost = resolver.nodes - nodes
     return None
 
 def resolveReturnStmt(resolver: Resolver, stmt: Return) -> None:
     if resolver.currentFunction == FunctionType.NONE:
-        print("[resolver-error] Can't return from top-level code.")
-        exit(1)
+        raise ResolveError("Can't return from top-level code.")
 
     if stmt.value:
         if resolver.currentFunction == FunctionType.INITIALIZER:
-            print(f"[resolver-error: line {stmt.keyword.line}] Can't return a value from an initializer.")
+            warn(resolver, ResolveError("Can't return a value from an initializer.",
+                                        f"resolver-error: line {stmt.keyword.line}"))
         resolve(resolver, stmt.value)
 
+    # An initializer returns `this` whatever its `return` says, so there is
+    # nothing to hand over.
+    stmt.tailCall = isinstance(stmt.value, Call) and \
+                    resolver.currentFunction != FunctionType.INITIALIZER
     return None
 
+def resolveListLiteralExpr(resolver: Resolver, expr: ListLiteral) -> None:
+    for element in expr.elements:
+        resolve(resolver, element)
 
+def resolveMapLiteralExpr(resolver: Resolver, expr: MapLiteral) -> None:
+    for key, value in zip(expr.keys, expr.values):
+        resolve(resolver, key)
+        resolve(resolver, value)
 
+def resolveIndexExpr(resolver: Resolver, expr: Index) -> None:
+    resolve(resolver, expr.object)
+    resolve(resolver, expr.index)
 
+def resolveSetIndexExpr(resolver: Resolver, expr: SetIndex) -> None:
+    resolve(resolver, expr.object)
+    resolve(resolver, expr.index)
+    resolve(resolver, expr.value)
+
+
+def warn(resolver: Resolver, warning: ResolveError) -> None:
+    resolver.warnings.append(warning)
+    if resolver.onWarning is not None:
+        resolver.onWarning(warning)
 
 def define(resolver: Resolver, name: Token) -> None:
     if resolver.scopes == []:
@@ -251,19 +395,50 @@ def define(resolver: Resolver, name: Token) -> None:
 
     resolver.scopes[-1][name.lexeme] = True
 
-def declare(resolver: Resolver, name: Token) -> None:
+# `node` is the statement that gets told where `name` lives, if any.
+def declare(resolver: Resolver, name: Token, node: Stmt = None) -> None:
     if resolver.scopes == []:
         return
 
-    scope: dict[str, bool] = resolver.scopes[-1]
+    scope    : dict[str, bool] = resolver.scopes[-1]
+    variables: Scope           = resolver.variables[-1]
 
     if name.lexeme in scope:
-        print("[resolver-error] Already a variable with this name.")
+        warn(resolver, ResolveError("Already a variable with this name."))
+    else:
+        variables.frameSlots[name.lexeme] = resolver.frameSizes[-1]
+        resolver.frameSizes[-1] += 1
 
+    if node is not None:
+        variables.declarations.append((node, name.lexeme))
     resolver.scopes[-1][name.lexeme] = False
 
 def beginScope(resolver: Resolver) -> None:
     resolver.scopes.append({})
-
-def endScope(resolver: Resolver) -> None:
-    resolver.scopes.pop()
\ No newline at end of file
+    resolver.variables.append(Scope(len(resolver.frameSizes) - 1))
+
+# Decides where each of the scope's variables lives and tells every node
+# that declared or referred to one.
+def endScope(resolver: Resolver) -> Scope:
+    resolver.scopes.pop()
+    scope: Scope = resolver.variables.pop()
+
+    for name in scope.frameSlots:
+        if scope.function == 0 or name in scope.captured:
+            scope.slots[name] = len(scope.slots)
+
+    for node, name in scope.declarations:
+        if name in scope.slots:
+            node.slot, node.frameSlot = scope.slots[name], None
+        else:
+            node.slot, node.frameSlot = None, scope.frameSlots[name]
+
+    for node, name, between in scope.references:
+        if name in scope.slots:
+            # Only scopes that have an environment are counted.
+            node.depth = sum(1 for s in between if s.slots)
+            node.slot  = scope.slots[name]
+        else:
+            node.frameSlot = scope.frameSlots[name]
+
+    return scope
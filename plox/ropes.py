@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+# Lazily joined strings, so building a long string with `+` in a loop is
+# linear instead of copying everything built so far on every step.
+#
+# `+` on strings only makes a `Rope` once the result is long enough for
+# copying to matter; below that it's a plain python `str`. A rope remembers
+# its pieces and joins them the first time it is printed, compared, hashed,
+# indexed or passed to a native, then keeps the joined text.
+#
+# Appending to a rope puts the new piece at the end of a list shared with
+# the rope it came from, so `out = out + piece` costs one list append.
+# Each rope only looks at the first `count` pieces of that list. When a
+# rope that isn't the newest one gets appended to (`a = s + "x"; b = s +
+# "y";`) the list can't be shared any more, and the new rope starts over
+# from the joined text. Prepending (`piece + out`) always joins.
+
+# Shorter results are just concatenated.
+ROPE_MIN_LENGTH: int = 256
+
+class Builder:
+    __slots__ = ("parts", "joinedCount", "joined")
+
+    parts      : list[str]
+    # The longest prefix of `parts` joined so far, so joining a later rope
+    # only has to add the pieces after it.
+    joinedCount: int
+    joined     : str
+
+    def __init__(self, parts: list[str]):
+        self.parts       = parts
+        self.joinedCount = 0
+        self.joined      = ""
+
+class Rope:
+    __slots__ = ("builder", "count", "length", "text")
+
+    builder: Builder
+    count  : int
+    length : int
+    # None until the rope is first needed as a string.
+    text   : str
+
+    def __init__(self, builder: Builder, count: int, length: int):
+        self.builder = builder
+        self.count   = count
+        self.length  = length
+        self.text    = None
+
+    def append(self, piece: str) -> Rope:
+        builder: Builder = self.builder
+        if len(builder.parts) != self.count:
+            builder = Builder([str(self)])
+        builder.parts.append(piece)
+        return Rope(builder, len(builder.parts), self.length + len(piece))
+
+    def __str__(self) -> str:
+        text: str = self.text
+        if text is None:
+            builder: Builder = self.builder
+            if builder.joinedCount <= self.count:
+                text = builder.joined + "".join(builder.parts[builder.joinedCount:self.count])
+                builder.joinedCount, builder.joined = self.count, text
+            else:
+                text = "".join(builder.parts[:self.count])
+            self.text = text
+        return text
+
+    __repr__ = __str__
+
+    # Equal to, and hashing like, the string it stands for, so ropes work
+    # as map keys and memoized arguments.
+    def __eq__(self, other: object) -> bool:
+        return str(self) == (str(other) if other.__class__ is Rope else other)
+
+    def __ne__(self, other: object) -> bool:
+        return not self == other
+
+    def __lt__(self, other: object) -> bool:
+        return str(self) < (str(other) if other.__class__ is Rope else other)
+
+    def __gt__(self, other: object) -> bool:
+        return str(self) > (str(other) if other.__class__ is Rope else other)
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+    def __float__(self) -> float:
+        return float(str(self))
+
+
+# The slow path of `+` once either side is a string: same result as
+# `str(left) + str(right)`.
+def concat(left: object, right: object) -> str | Rope:
+    if left.__class__ is Rope:
+        return left.append(str(right))
+
+    leftText : str = str(left)
+    rightText: str = str(right)
+    length   : int = len(leftText) + len(rightText)
+    if length < ROPE_MIN_LENGTH:
+        return leftText + rightText
+    return Rope(Builder([leftText, rightText]), 2, length)
+
+# `str`s and flattened ropes.
+def flatten(value: object) -> object:
+    return str(value) if value.__class__ is Rope else value
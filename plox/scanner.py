@@ -1,4 +1,8 @@
 
+import re
+import sys
+from typing import Iterator
+from errors import ScanError
 from tokens import Token, TokenType
 
 class ScannerState:
@@ -16,6 +20,7 @@ class ScannerState:
         "for"   : TokenType.FOR,
         "fun"   : TokenType.FUN,
         "if"    : TokenType.IF,
+        "in"    : TokenType.IN,
         "or"    : TokenType.OR,
         "return": TokenType.RETURN,
         "super" : TokenType.SUPER,
@@ -44,6 +49,84 @@ def scan(source: str):
     scanner.tokens.append(Token(TokenType.EOF, "", None, scanner.line))
     return scanner.tokens
 
+# Fast path: one compiled master regex over the whole source instead of
+# a python call per character. Produces exactly the same tokens (and
+# errors) as `scan`.
+TOKEN_REGEX = re.compile(r"""
+    [ ]*
+    (?:
+          (?P<newline>\n)
+        | (?P<comment>//[^\n]*)
+        | (?P<string>"[^"]*")
+        | (?P<number>[0-9]+(?:\.[0-9]+)?)
+        | (?P<identifier>[A-Za-z_?][A-Za-z0-9_?]*)
+        | (?P<operator>[!=<>]=?|[(){}\[\],.\-+;*/:])
+        | (?P<unterminated>")
+        | (?P<unexpected>.)
+        | (?P<end>$)
+    )
+""", re.VERBOSE | re.DOTALL)
+
+OPERATORS: dict[str, TokenType] = {
+    "(" : TokenType.LEFT_PAREN,
+    ")" : TokenType.RIGHT_PAREN,
+    "{" : TokenType.LEFT_BRACE,
+    "}" : TokenType.RIGHT_BRACE,
+    "[" : TokenType.LEFT_BRACKET,
+    "]" : TokenType.RIGHT_BRACKET,
+    ":" : TokenType.COLON,
+    "," : TokenType.COMMA,
+    "." : TokenType.DOT,
+    "-" : TokenType.MINUS,
+    "+" : TokenType.PLUS,
+    ";" : TokenType.SEMICOLON,
+    "*" : TokenType.STAR,
+    "/" : TokenType.SLASH,
+    "!" : TokenType.BANG,
+    "!=": TokenType.BANG_EQUAL,
+    "=" : TokenType.EQUAL,
+    "==": TokenType.EQUAL_EQUAL,
+    "<" : TokenType.LESS,
+    "<=": TokenType.LESS_EQUAL,
+    ">" : TokenType.GREATER,
+    ">=": TokenType.GREATER_EQUAL,
+}
+
+def scanFast(source: str) -> list[Token]:
+    return list(scanIter(source))
+
+# Generator mode: tokens are produced one at a time as the parser asks for
+# them, so the full token list never has to exist.
+def scanIter(source: str) -> Iterator[Token]:
+    keywords: dict[str, TokenType] = ScannerState.keywords
+    line    : int                  = 1
+
+    for match in TOKEN_REGEX.finditer(source):
+        kind: str = match.lastgroup
+        text: str = match.group(kind)
+
+        if kind == "identifier":
+            yield Token(keywords.get(text, TokenType.IDENTIFIER),
+                        sys.intern(text), None, line)
+        elif kind == "operator":
+            yield Token(OPERATORS[text], text, None, line)
+        elif kind == "newline":
+            line += 1
+        elif kind == "number":
+            yield Token(TokenType.NUMBER, text, float(text), line)
+        elif kind == "comment" or kind == "end":
+            continue
+        elif kind == "string":
+            # Like `scan`, the token gets the line the string ends on.
+            line += text.count("\n")
+            yield Token(TokenType.STRING, text, text[1:-1], line)
+        elif kind == "unterminated":
+            raise ScanError("unterminated string.")
+        else:
+            raise ScanError(f"unexpected character: '{text}'")
+
+    yield Token(TokenType.EOF, "", None, line)
+
 def scanToken(scanner: ScannerState):
     c: str = advance(scanner)
 
@@ -51,6 +134,9 @@ def scanToken(scanner: ScannerState):
     elif c == ")": addToken(scanner, TokenType.RIGHT_PAREN)
     elif c == "{": addToken(scanner, TokenType.LEFT_BRACE)
     elif c == "}": addToken(scanner, TokenType.RIGHT_BRACE)
+    elif c == "[": addToken(scanner, TokenType.LEFT_BRACKET)
+    elif c == "]": addToken(scanner, TokenType.RIGHT_BRACKET)
+    elif c == ":": addToken(scanner, TokenType.COLON)
     elif c == ",": addToken(scanner, TokenType.COMMA)
     elif c == ".": addToken(scanner, TokenType.DOT)
     elif c == "-": addToken(scanner, TokenType.MINUS)
@@ -96,8 +182,7 @@ def scanToken(scanner: ScannerState):
         elif isAlpha(c):
             identifier(scanner)
         else:
-            print(f"unexpected character: '{c}'")
-            exit(1)
+            raise ScanError(f"unexpected character: '{c}'")
 
 
 def identifier(scanner: ScannerState) -> None:
@@ -110,7 +195,9 @@ def identifier(scanner: ScannerState) -> None:
     if type == None:
         type = TokenType.IDENTIFIER
 
-    addToken(scanner, type)
+    # Names repeat a lot, interning lets every token for the same name
+    # share one string.
+    scanner.tokens.append(Token(type, sys.intern(text), None, scanner.line))
 
 def number(scanner: ScannerState) -> None:
     while isDigit(peek(scanner)):
@@ -133,8 +220,7 @@ def string(scanner: ScannerState) -> None:
         advance(scanner)
 
     if isAtEnd(scanner):
-        print("[scanner-error] unterminated string.")
-        exit(1)
+        raise ScanError("unterminated string.")
 
     advance(scanner)
 
@@ -189,7 +275,7 @@ def isAtEnd(scanner: ScannerState) -> bool:
 
 if __name__ == "__main__":
     import sys
-    path = sys.argv[1]
+    path = sys.argv[-1]
 
     def read_file(path: str) -> str:
         f = open(path)
@@ -198,6 +284,6 @@ if __name__ == "__main__":
         return contents
 
     source = read_file(path)
-    tokens: list[Token] = scan(source)
+    tokens: list[Token] = scanFast(source) if "--fast" in sys.argv else scan(source)
 
     [print(x) for x in tokens]
\ No newline at end of file
@@ -1,52 +1,93 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from tokens import Token, TokenType
 from expr import Expr, Variable
 
 class Stmt:
-    pass
+    __slots__ = ()
 
-@dataclass
+@dataclass(slots=True)
 class Expression(Stmt):
     expression: Expr 
 
-@dataclass
+@dataclass(slots=True)
 class Return(Stmt):
     keyword: Token 
     value: Expr 
+    # Set by the resolver on `return f(...)` in a function or method, which
+    # the backends run as a tail call: `f` takes over the caller's frame
+    # instead of going on top of it.
+    tailCall: bool = False
 
-@dataclass
+@dataclass(slots=True)
 class Function(Stmt):
     name: Token 
     params: list[Token];
     body: list[Stmt]
+    # Filled in by the resolver: where the function is stored when
+    # declared in a local scope (see `Variable`), how many slots a call's
+    # environment needs (0 for no environment at all) and how big its
+    # frame is. Parameters come first in the frame; the ones an inner
+    # function refers to are copied into the environment, as
+    # (parameter index, slot) pairs.
+    slot: int = None
+    frameSlot: int = None
+    scopeSize: int = 0
+    frameSize: int = 0
+    capturedParams: list[tuple[int, int]] = field(default_factory=list)
+    # Nodes in the body, what a call is charged against a budget (see
+    # budgets.py). Also filled in by the resolver, like `While.cost`.
+    cost: int = 0
 
-@dataclass
+# `cost` is the number of nodes in the condition and body, charged for
+# every iteration, see budgets.py.
+@dataclass(slots=True)
 class While(Stmt):
     condition: Expr 
     body: Stmt 
+    cost: int = 0
 
-@dataclass
+# `for (var name in iterable) body`. The loop variable lives in a scope of
+# its own around `body`: `slot`, `frameSlot` and `scopeSize` are filled in
+# by the resolver like a `Var`'s and a `Block`'s.
+@dataclass(slots=True)
+class ForIn(Stmt):
+    name: Token
+    iterable: Expr
+    body: Stmt
+    slot: int = None
+    frameSlot: int = None
+    scopeSize: int = 0
+    cost: int = 0
+
+@dataclass(slots=True)
 class If(Stmt):
     condition: Expr 
     thenBranch: Stmt 
     elseBranch: Stmt 
 
-@dataclass
+# A block that declares nothing, or whose variables all live in the
+# frame, gets no environment, and its `scopeSize` is 0.
+@dataclass(slots=True)
 class Block(Stmt):
     statements: list[Stmt]
+    scopeSize: int = 0
 
-@dataclass
+@dataclass(slots=True)
 class Var(Stmt):
     name: Token 
     initializer: Expr 
+    slot: int = None
+    frameSlot: int = None
 
-@dataclass
+@dataclass(slots=True)
 class Print(Stmt):
     expression: Expr 
 
-@dataclass
+@dataclass(slots=True)
 class Class(Stmt):
     name: Token 
-    methods: list[Function]
\ No newline at end of file
+    methods: list[Function]
+    slot: int = None
+    frameSlot: int = None
\ No newline at end of file
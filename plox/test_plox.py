@@ -0,0 +1,772 @@
+import glob
+import hashlib
+import hmac
+import os
+import pathlib
+import pickle
+import subprocess
+import sys
+
+import pytest
+
+# The interpreter modules import each other by their bare names, so every
+# script is run in a fresh process from this directory instead of being
+# imported into the test session.
+
+PLOX_DIR: str = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPTS: list[str] = sorted(
+    os.path.relpath(path, PLOX_DIR)
+    for pattern in ("tests/*.txt", "ideas/*.txt")
+    for path in glob.glob(os.path.join(PLOX_DIR, pattern))
+)
+
+
+# Cached programs and the key signing them go to a temporary directory,
+# not next to the scripts in this tree or in the user's home.
+@pytest.fixture(autouse=True, scope="session")
+def cache_dirs(tmp_path_factory):
+    os.environ["PLOXCACHEPREFIX"] = str(tmp_path_factory.mktemp("ploxcache"))
+    os.environ["XDG_CACHE_HOME"]  = str(tmp_path_factory.mktemp("xdg-cache"))
+
+
+def run_plox(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, "interpreter.py", *args],
+                          cwd=PLOX_DIR, capture_output=True, text=True)
+
+
+@pytest.mark.parametrize("backend", ["closure", "vm"])
+@pytest.mark.parametrize("script", SCRIPTS)
+def test_backend_matches_tree_walker(script: str, backend: str):
+    expected = run_plox("--backend", "tree", script)
+    actual   = run_plox("--backend", backend, script)
+
+    assert actual.stdout == expected.stdout
+    assert actual.returncode == expected.returncode
+
+
+def same_line_program(depth: int) -> tuple[str, str]:
+    # Everything on one line: `a` is shadowed `depth` times, then read and
+    # assigned from every level on the way back out.
+    source: str = "var a = 0;"
+    for level in range(1, depth + 1):
+        source += f" {{ var a = {level};"
+    source += " print(a);"
+    for level in range(depth, 0, -1):
+        source += " } a = a + 100; print(a);"
+
+    # Closures made on the same line must each see their own parameter.
+    source += (" fun keep(a) { fun get() { return a; } return get; }"
+               " var x = keep(1); var y = keep(2); print(x() + y() * 10);")
+
+    expected: list[str] = [f"{depth}.0"]
+    expected += [f"{level + 100}.0" for level in range(depth - 1, -1, -1)]
+    expected += ["21.0"]
+    return source, "\n".join(expected) + "\n"
+
+
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+def test_same_line_references(tmp_path, backend: str):
+    source, expected = same_line_program(50)
+    path = tmp_path / "same-line.txt"
+    path.write_text(source)
+
+    result = run_plox("--backend", backend, str(path))
+
+    assert result.returncode == 0, result.stdout
+    assert result.stdout == expected
+
+
+SCANNER_EDGE_CASES: list[str] = [
+    'var s = "spans\nthree\nlines"; print(s);\n// trailing comment',
+    "a>=b<=c!=d==e=!f<g>h/i//j\n1.5.x 2. 3..4 x?y_z9 _a ?b",
+    "fun(){}\n\n\nclass this super nil true false and or",
+    '"unterminated\nstring',
+    "var a = 1;\n\tvar b = 2;",
+]
+
+
+def run_scanner(*args: str) -> tuple[str, int]:
+    result = subprocess.run([sys.executable, "scanner.py", *args],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+    return result.stdout, result.returncode
+
+
+@pytest.mark.parametrize("case", range(len(SCANNER_EDGE_CASES)))
+def test_fast_scanner_edge_cases(tmp_path, case: int):
+    path = tmp_path / "source.txt"
+    path.write_text(SCANNER_EDGE_CASES[case])
+
+    assert run_scanner("--fast", str(path)) == run_scanner(str(path))
+
+
+@pytest.mark.parametrize("script", SCRIPTS)
+def test_fast_scanner_matches_scanner(script: str):
+    assert run_scanner("--fast", script) == run_scanner(script)
+
+
+# Running a declaration as soon as it's parsed can only change when an
+# error in a later declaration is reported, so only the working scripts.
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+@pytest.mark.parametrize("script", [s for s in SCRIPTS if s.startswith("tests")])
+def test_incremental_matches_whole_program(script: str, backend: str):
+    expected = run_plox("--backend", backend, script)
+    actual   = run_plox("--incremental", "--backend", backend, script)
+
+    assert actual.stdout == expected.stdout
+    assert actual.returncode == expected.returncode
+
+
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+def test_repl_keeps_state_between_lines(backend: str):
+    lines: str = ("var a = 1;\n"
+                  "fun f(x) {\n"
+                  "    return x + a;\n"
+                  "}\n"
+                  "print(missing);\n"
+                  "a = 10; print(f(2));\n")
+    result = subprocess.run([sys.executable, "interpreter.py", "--repl", "--backend", backend],
+                            cwd=PLOX_DIR, input=lines, capture_output=True, text=True)
+
+    assert result.returncode == 0
+    assert "undefined variable: `missing`" in result.stdout
+    assert "12.0" in result.stdout
+
+
+# Only braces outside of strings and comments keep the REPL reading.
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+def test_repl_balances_braces_by_tokens(backend: str):
+    lines: str = ('print("{");\n'
+                  "// {\n"
+                  'fun f() { // }\n'
+                  '    return "}";\n'
+                  "}\n"
+                  "print(f());\n")
+    result = subprocess.run([sys.executable, "interpreter.py", "--repl", "--backend", backend],
+                            cwd=PLOX_DIR, input=lines, capture_output=True, text=True,
+                            timeout=10)
+
+    assert result.returncode == 0
+    assert result.stdout.split() == [">", "{", ">", ">", ".", ".", ">", "}", ">"]
+
+# A resolver error halfway through a method mustn't leave the REPL
+# resolving the next line as if it were still inside it.
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+def test_repl_recovers_from_resolver_errors(backend: str):
+    lines: str = ("class A { m() { { var q = q; } } }\n"
+                  "return 5;\n"
+                  "fun f() { return 1; }\n"
+                  "print(f());\n")
+    result = subprocess.run([sys.executable, "interpreter.py", "--repl", "--backend", backend],
+                            cwd=PLOX_DIR, input=lines, capture_output=True, text=True)
+
+    assert result.returncode == 0
+    assert "Can't read local variable in it's own initializer: `q`." in result.stdout
+    assert "[resolver-error] Can't return from top-level code." in result.stdout
+    assert "1.0" in result.stdout
+
+
+GOLDEN: list[str] = sorted(
+    os.path.relpath(path, PLOX_DIR)
+    for path in glob.glob(os.path.join(PLOX_DIR, "tests/golden/*.txt"))
+)
+
+
+# Every golden script has to print its `.expected` output on every backend,
+# with and without the optimizer.
+@pytest.mark.parametrize("flags", [[], ["--no-optimize"], ["--incremental"]])
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+@pytest.mark.parametrize("script", GOLDEN)
+def test_golden_output(script: str, backend: str, flags: list[str]):
+    with open(os.path.join(PLOX_DIR, script.removesuffix(".txt") + ".expected")) as f:
+        expected: str = f.read()
+
+    result = run_plox("--backend", backend, *flags, script)
+
+    assert result.returncode == 0, result.stdout
+    assert result.stdout == expected
+
+
+def test_optimizer_folds_constants(tmp_path):
+    path = tmp_path / "constants.txt"
+    path.write_text('print(1 + 2 * 3);\n{ { if (true) print("a" + 1); } }\nwhile (false) print(1);')
+
+    result = subprocess.run([sys.executable, "optimizer.py", str(path)],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    assert "Literal(value=7.0)" in result.stdout
+    assert "Literal(value='a1.0')" in result.stdout
+    for node in ["Binary", "Block", "If", "While"]:
+        assert node not in result.stdout
+
+
+def test_profile_report(tmp_path):
+    path = tmp_path / "fib.txt"
+    path.write_text("fun fib(n) {\n"
+                    "    if (n < 2) return n;\n"
+                    "    return fib(n - 1) + fib(n - 2);\n"
+                    "}\n"
+                    "print(fib(10));\n")
+    folded = tmp_path / "fib.folded"
+
+    result = run_plox("--profile", "--profile-out", str(folded), str(path))
+
+    assert result.returncode == 0
+    assert result.stdout == "55.0\n"
+    # fib(10) makes 177 calls, 88 of which get past the `if` to line 3.
+    assert any(line.split()[0] == "177" and line.endswith("fib (line 1)")
+               for line in result.stderr.splitlines())
+    assert any(line.split() == ["88", "3"] for line in result.stderr.splitlines())
+
+    stacks: list[str] = folded.read_text().splitlines()
+    assert "<script>;fib;fib" in [line.rsplit(" ", 1)[0] for line in stacks]
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+
+
+def test_stats_counters(tmp_path):
+    path = tmp_path / "stats.txt"
+    path.write_text("class P { init(x) { this.x = x; } }\n"
+                    "fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }\n"
+                    "var p = P(1);\n"
+                    "print(fib(10));\n"
+                    "print(nope);\n")
+
+    result = run_plox("--stats", str(path))
+    stats  = {name: int(value) for value, name in map(str.split, result.stderr.splitlines()[-5:])}
+
+    assert result.returncode == 1
+    assert result.stdout.startswith("55.0\n")
+    # 177 calls of fib and the initializer.
+    assert stats["calls"] == 178
+    assert stats["instancesCreated"] == 1
+    assert stats["exceptionsRaised"] == 1
+    assert stats["nodesEvaluated"] > stats["calls"]
+
+
+def test_instrumentation_hooks():
+    script = """
+from scanner import scan
+from parser import parse
+from interpreter import Interp, interpret
+from instrumentation import Hooks, instrument, uninstrument
+
+events = []
+hooks  = Hooks(callEnter=lambda f, args: events.append(("enter", args)),
+               callExit =lambda f, result: events.append(("exit", result)),
+               statement=lambda stmt: events.append(type(stmt).__name__))
+interp = Interp()
+instrument(interp, hooks)
+interpret(parse(scan("fun f(a) { return a + 1; } var x = f(1);")), interp=interp)
+counters = uninstrument(interp)
+interpret(parse(scan("fun g() {} g();")), interp=interp)
+print(events)
+print(counters.calls, interp.instrumentation)
+"""
+    result = subprocess.run([sys.executable, "-c", script],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    assert result.stdout.splitlines() == [
+        "['Function', 'Var', ('enter', [1.0]), 'Return', ('exit', 2.0)]",
+        "1 None",
+    ]
+
+
+# Each instrumented interpreter counts its own work only, and no backend
+# gets to skip the hooks.
+def test_instrumentation_is_scoped():
+    script = """
+from scanner import scan
+from parser import parse
+from errors import LoxError
+from interpreter import Interp, interpret
+from instrumentation import instrument, uninstrument
+
+program = "class A {} fun f(a) { var b = A(); fun g() { return b; } return a + 1; } var x = f(1);"
+traced, other = Interp(), Interp()
+counters = instrument(traced)
+interpret(parse(scan(program)), interp=other)
+print(counters.nodesEvaluated, counters.calls, counters.environmentsCreated,
+      counters.instancesCreated)
+others = instrument(other)
+for run in [lambda: instrument(other),
+            lambda: interpret(parse(scan(program)), "closure", interp=traced),
+            lambda: interpret(parse(scan(program)), "vm", interp=traced)]:
+    try:
+        run()
+    except LoxError as e:
+        print(e.report())
+interpret(parse(scan(program)), interp=traced)
+counters = uninstrument(traced)
+print(counters.calls, counters.environmentsCreated, counters.instancesCreated)
+interpret(parse(scan(program)), interp=other)
+interpret(parse(scan(program)), interp=other)
+print(uninstrument(other) is others, others.calls, others.environmentsCreated,
+      others.instancesCreated)
+"""
+    result = subprocess.run([sys.executable, "-c", script],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    assert result.stdout.splitlines() == [
+        "0 0 0 0",
+        "[instrumentation-error] interpreter is already instrumented.",
+        "[instrumentation-error] instrumentation only works with the tree backend.",
+        "[instrumentation-error] instrumentation only works with the tree backend.",
+        "1 1 1",
+        "True 2 2 2",
+    ], result.stderr
+
+def test_stats_needs_the_tree_backend(tmp_path):
+    path = tmp_path / "stats.txt"
+    path.write_text("print(1);\n")
+
+    result = run_plox("--stats", "--backend", "vm", str(path))
+
+    assert result.returncode == 1
+    assert result.stdout == "[instrumentation-error] --stats only works with the tree backend.\n"
+
+
+def test_program_cache(tmp_path):
+    path   = tmp_path / "cached.txt"
+    cached = pathlib.Path(os.environ["PLOXCACHEPREFIX"], str(tmp_path).lstrip(os.sep),
+                          "cached.txt.pickle")
+    path.write_text("fun f(n) { return n * 2; }\nprint(f(21));\n")
+
+    assert run_plox(str(path)).stdout == "42.0\n"
+    assert cached.exists()
+    written = cached.stat().st_mtime_ns
+
+    # A hit reads the cache without rewriting it.
+    for backend in ["tree", "closure", "vm"]:
+        assert run_plox("--backend", backend, str(path)).stdout == "42.0\n"
+    assert cached.stat().st_mtime_ns == written
+
+    # Editing the script invalidates it.
+    path.write_text("fun f(n) { return n * 3; }\nprint(f(21));\n")
+    assert run_plox(str(path)).stdout == "63.0\n"
+    assert run_plox(str(path)).stdout == "63.0\n"
+
+    # A corrupt cache file is just a miss.
+    cached.write_bytes(b"not a pickle")
+    assert run_plox(str(path)).stdout == "63.0\n"
+
+    # So is one that wasn't signed with this user's key, and it is never
+    # unpickled.
+    header, _ = cached.read_bytes().split(b"\n", 1)
+    key       = header.split()[0]
+    forged    = pickle.dumps(Forged())
+    cached.write_bytes(key + b" " + hmac.new(b"guess", key + b"\0" + forged,
+                                             hashlib.sha256).hexdigest().encode() + b"\n" + forged)
+    assert run_plox(str(path)).stdout == "63.0\n"
+
+    path.write_text("print(1);\n")
+    assert run_plox("--no-cache", str(path)).stdout == "1.0\n"
+    assert run_plox(str(path)).stdout == "1.0\n"
+
+
+class Forged:
+    def __reduce__(self):
+        return (print, ("unpickled a forged cache",))
+
+
+# The cache key has to change whenever any stage making the program does.
+def test_program_key_covers_every_stage():
+    script = """
+import os
+import sys
+import astcache
+import scanner, parser, optimizer, resolver
+
+here = os.getcwd()
+print(sorted(name for name, module in sys.modules.items()
+             if os.path.dirname(getattr(module, "__file__", None) or "") == here
+             and name != "astcache"))
+print(sorted(astcache.AST_MODULES))
+"""
+    result = subprocess.run([sys.executable, "-c", script],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    imported, keyed = result.stdout.splitlines()
+    assert imported == keyed
+
+
+def test_register_natives():
+    script = """
+import libffi
+from scanner import scan
+from parser import parse
+from interpreter import Interp, interpret
+
+def shout(text, times=1):
+    if not isinstance(text, str):
+        raise libffi.NativeError("expected a string.")
+    return text.upper() * int(times)
+
+libffi.register("shout", shout)
+interp = Interp()
+libffi.define(interp, "answer", lambda: 42.0)
+try:
+    interpret(parse(scan('print(shout("hi", 2) + answer()); shout(1);')), interp=interp)
+except libffi.NativeError as e:
+    print(e.report())
+"""
+    result = subprocess.run([sys.executable, "-c", script],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    assert result.returncode == 0
+    assert result.stdout == "HIHI42.0\n[ffi-error] shout: expected a string.\n"
+
+
+# Every builtin answers `arity()` the same way, whichever kind it is.
+def test_native_arity():
+    script = """
+import libffi
+from scanner import scan
+from parser import parse
+from interpreter import Interp, interpret
+
+interp = Interp()
+print(sorted({type(native.arity()).__name__ for native in libffi.NATIVES.values()}))
+interpret(parse(scan("var p = memoize(print); var s = memoize(memoStats);")), interp=interp)
+print(interp.globals.gets("p").arity(), interp.globals.gets("s").arity(),
+      libffi.NATIVES["memoize"].arity())
+for source in ["memoize();", "memoize(print, 1, \\"lru\\", 4);", "memoStats();"]:
+    try:
+        interpret(parse(scan(source)), interp=interp)
+    except libffi.NativeError as e:
+        print(e.report())
+"""
+    result = subprocess.run([sys.executable, "-c", script],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    assert result.stdout.splitlines() == [
+        "['NoneType', 'int']",
+        "None 1 3",
+        "[ffi-error] memoize: expected 1 to 3 arguments but got 0.",
+        "[ffi-error] memoize: expected 1 to 3 arguments but got 4.",
+        "[ffi-error] memoStats: expected 1 arguments but got 0.",
+    ], result.stderr
+
+
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+@pytest.mark.parametrize("source, error", [
+    ("print([1, 2][2]);",   "index 2 out of range for length 2."),
+    ("print([1, 2][0.5]);", "index must be a whole number, got `0.5`."),
+    ("var x = 1; x[0] = 2;", "can only assign into lists and maps: `1.0`"),
+    ("var m = {}; for (var k in m) m[k] = 1; for (var k in {1: 1}) m[k] = 1; "
+     "var n = {1: 1}; for (var k in n) n[k + 1] = 1;",
+     "map changed size while looping over it."),
+])
+def test_collection_errors(tmp_path, backend: str, source: str, error: str):
+    path = tmp_path / "collections.txt"
+    path.write_text(source)
+    result = run_plox("--no-cache", "--backend", backend, str(path))
+
+    assert result.returncode == 1
+    assert result.stdout.endswith(f"[interpreter-error] {error}\n")
+
+
+@pytest.mark.parametrize("source, error", [
+    ("print(range(0.5, 3.7));",       "range: expected a whole number, got `0.5`."),
+    ("print(range(2.5));",            "range: expected a whole number, got `2.5`."),
+    ("print(sum(list(true, true)));", "sum: can only sum numbers."),
+    ("print(sum(list(1, nil)));",     "sum: can only sum numbers."),
+])
+def test_native_argument_errors(tmp_path, source: str, error: str):
+    path = tmp_path / "natives.txt"
+    path.write_text("print(range(-2, 1)); print(sum(list(1, 2.5)));\n" + source)
+    result = run_plox("--no-cache", str(path))
+
+    assert result.returncode == 1
+    assert result.stdout == f"[-2.0, -1.0, 0.0]\n3.5\n[ffi-error] {error}\n"
+
+
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+def test_budgets(backend: str):
+    script = """
+import sys
+from scanner import scan
+from parser import parse
+from interpreter import Interp, interpret
+from budgets import Budget, BudgetExceeded
+
+programs = [
+    ("var i = 0; while (true) i = i + 1;",                  Budget(maxNodes=10000)),
+    ("for (var i in range(1000000)) {}",                    Budget(seconds=0.05)),
+    ("class A {} var l = list(); while (true) push(l, A());", Budget(maxInstances=100)),
+    ("fun f(n) { return 1 + f(n + 1); } f(0);",             Budget(maxDepth=50)),
+    ("fun f(n) { return 1 + f(n + 1); } f(0);",             Budget(seconds=0.5)),
+    # Cycles are collected before counting, tail calls don't nest.
+    ("class A {} for (var i in range(1000)) { var a = A(); a.me = a; }", Budget(maxInstances=10)),
+    ("fun f(n) { if (n > 0) return f(n - 1); } f(1000);",   Budget(maxDepth=10)),
+]
+interp = Interp()
+for source, budget in programs:
+    try:
+        interpret(parse(scan(source)), sys.argv[1], interp=interp, budget=budget)
+        print("done")
+    except BudgetExceeded as e:
+        print(e.limit, e)
+
+interpret(parse(scan("print(1 + 1);")), sys.argv[1], interp=interp)
+print(interp.depth, interp.budget)
+"""
+    result = subprocess.run([sys.executable, "-c", script, backend],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    expected = [
+        "nodes evaluated more than 10000 nodes",
+        "seconds ran for more than 0.05 seconds",
+        "instances more than 100 live instances",
+        "depth calls nested 50 deep",
+        # The VM doesn't recurse in python, so it only stops at the deadline.
+        "seconds ran for more than 0.5 seconds" if backend == "vm" else "depth calls nested too deep",
+        "done",
+        "done",
+        "2.0",
+        "0 None",
+    ]
+    assert result.stdout.splitlines() == expected
+
+
+# Each budget counts the instances its own interpreter made, even with
+# others running at the same time.
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+def test_instance_budget_is_per_interpreter(backend: str):
+    script = """
+import sys, threading
+from scanner import scan
+from parser import parse
+from interpreter import Interp, interpret
+from budgets import Budget, BudgetExceeded
+
+source = "class A {} var l = list(); for (var i in range(3000)) push(l, A());"
+kept   = Interp()
+interpret(parse(scan(source)), sys.argv[1], interp=kept)
+results = []
+
+def run(limit):
+    try:
+        interpret(parse(scan(source)), sys.argv[1], budget=Budget(maxInstances=limit))
+        results.append("done")
+    except BudgetExceeded as e:
+        results.append(str(e))
+
+threads = [threading.Thread(target=run, args=(limit,)) for limit in (5000, 5000, 5000, 2999)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+print(sorted(results))
+"""
+    result = subprocess.run([sys.executable, "-c", script, backend],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    assert result.stdout.splitlines() == [
+        "['done', 'done', 'done', 'more than 2999 live instances']",
+    ], result.stderr
+
+
+# At its limits a budget stops the program instead of checking again on
+# every step: a loop in the deepest call allowed, and a program whose
+# garbage cycles keep it at its instance limit.
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+def test_budget_limits_stay_cheap(backend: str):
+    script = """
+import gc, sys
+from scanner import scan
+from parser import parse
+from interpreter import interpret
+from budgets import Budget, BudgetExceeded
+
+fullCollections = []
+gc.callbacks.append(lambda phase, info: phase == "start" and info["generation"] == 2
+                                        and fullCollections.append(info))
+programs = [
+    ("fun f(n) { if (n > 0) return 1 + f(n - 1); while (true) {} } f(2);", Budget(maxDepth=3)),
+    ("class A {} var l = list(); for (var i in range(11)) push(l, A());"
+     "for (var i in range(5000)) { var a = A(); var b = A(); a.b = b; b.a = a; }",
+     Budget(maxInstances=14)),
+]
+for source, budget in programs:
+    try:
+        interpret(parse(scan(source)), sys.argv[1], budget=budget)
+        print("done")
+    except BudgetExceeded as e:
+        print(e.limit, e)
+# Without a limit on them, nearly every allocation collected the whole heap.
+print(len(fullCollections) < 100)
+"""
+    result = subprocess.run([sys.executable, "-c", script, backend],
+                            cwd=PLOX_DIR, capture_output=True, text=True, timeout=60)
+
+    assert result.stdout.splitlines()[0] == "depth calls nested 3 deep", result.stderr
+    assert result.stdout.splitlines()[2] == "True"
+
+
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+def test_program_api(backend: str):
+    script = """
+import sys
+import program
+from budgets import Budget
+from errors import LoxError
+
+backend = sys.argv[1]
+area = program.compile("var scale = 2; width * height * scale;", backend)
+print(area.run({"width": 3, "height": 4}), area.run({"width": 1, "height": 1}))
+
+greet = program.compile('fun hi(n) { return "hi " + n; } [hi(name), twice(items[1])];', backend)
+print(greet.run({"name": "bob", "items": [1, 2], "twice": lambda x: x * 2}))
+print(program.compile("1 + 2;", backend).run(), program.compile("var a = 1;", backend).run())
+
+# Warnings are kept on the program, not printed, and don't stop it running.
+warned = program.compile("fun f() { var a = 1; var a = 2; return a; } "
+                         "class A { init() { return 1; } } f();", backend)
+print([warning.report() for warning in warned.warnings], warned.run())
+
+for source in ['"open', "var = 1;", "return 1;", "print(nope);", "len(1);",
+               "while (true) {}"]:
+    try:
+        for _ in range(2):
+            program.compile(source, backend).run(budget=Budget(maxNodes=1000))
+    except LoxError as e:
+        print(type(e).__name__, e.report())
+"""
+    result = subprocess.run([sys.executable, "-c", script, backend],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    assert result.stdout.splitlines() == [
+        "24.0 2.0",
+        '["hi bob", 4.0]',
+        "3.0 None",
+        "['[resolver-error] Already a variable with this name.', "
+        "\"[resolver-error: line 1] Can't return a value from an initializer.\"] 2.0",
+        "ScanError [scanner-error] unterminated string.",
+        "ParseError [parser-error] Expect variable name.",
+        "ResolveError [resolver-error] Can't return from top-level code.",
+        "LoxRuntimeError [environment-error] undefined variable: `nope`",
+        "NativeError [ffi-error] len: expected a string, list or map, got `1.0`.",
+        "BudgetExceeded [budget-error] evaluated more than 1000 nodes",
+    ]
+
+
+# Only the command line prints the resolver's warnings, before running.
+def test_cli_prints_resolver_warnings(tmp_path):
+    path = tmp_path / "warnings.txt"
+    path.write_text("fun f() { var a = 1; var a = 2; return a; }\nprint(f());\n")
+
+    for flags in [[], ["--incremental"]]:
+        result = run_plox("--no-cache", *flags, str(path))
+        assert result.stdout == "[resolver-error] Already a variable with this name.\n2.0\n"
+
+
+# The compiled program outlives each run, its inline caches mustn't keep
+# anything of a run alive.
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+def test_program_run_releases_its_globals(backend: str):
+    script = """
+import gc, sys, weakref
+import program
+
+class Marker:
+    pass
+
+area = program.compile("class A { m() { return 1; } } var a = A(); a.x = 1; "
+                       "var b = a.m; a.m() + b() + a.x;", sys.argv[1])
+marker = Marker()
+kept   = weakref.ref(marker)
+print(area.run(), area.run({"marker": marker}))
+del marker
+gc.collect()
+print(kept())
+"""
+    result = subprocess.run([sys.executable, "-c", script, backend],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    assert result.stdout.splitlines() == ["3.0 3.0", "None"], result.stderr
+
+
+# Shapes belong to their class, so a host running the same program over
+# and over doesn't collect them forever.
+def test_shapes_go_away_with_their_run():
+    script = """
+import gc
+import program
+from interpreter import Shape
+
+def shapes():
+    gc.collect()
+    return sum(1 for o in gc.get_objects() if type(o) is Shape)
+
+before = shapes()
+for i in range(50):
+    program.compile(f"class A {{}} var a = A(); a.x = 2; a.y{i} = 3; a.x * a.y{i};").run()
+print(program.compile("class A {} var a = A(); a.x = 2; a.y = 3; a.x * a.y;").run())
+print(shapes() - before)
+"""
+    result = subprocess.run([sys.executable, "-c", script],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    assert result.stdout.splitlines() == ["6.0", "0"], result.stderr
+
+
+@pytest.mark.parametrize("backend", ["tree", "closure", "vm"])
+def test_runtime_errors(backend: str):
+    script = """
+import sys
+import program
+from errors import LoxRuntimeError
+
+for source in ['"x"();', 'var s = "a"; s - 1;', '-"a";', 'var n = 1; "a" < n;',
+               'var z = 0; 1 / z;', '1 / 0;', 'nil + 1;',
+               'fun f() { return "x"(); } f();',
+               'class A { init() { this.f = 1; } } A().f();',
+               'fun f(a) {} f(1, 2);', 'class B { init(x) {} } B();', 'class C {} C(1);',
+               'class D { m(a, b) {} } D().m(1);', 'fun g(a) { return g(); } g(1);']:
+    try:
+        program.compile(source, sys.argv[1]).run()
+    except LoxRuntimeError as e:
+        print(e.report())
+"""
+    result = subprocess.run([sys.executable, "-c", script, backend],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    assert result.stdout.splitlines() == [
+        "[interpreter-error] Can only call functions and classes.",
+        "[interpreter-error] Operands must be numbers.",
+        "[interpreter-error] Operands must be numbers.",
+        "[interpreter-error] Operands must be numbers.",
+        "[interpreter-error] Division by zero.",
+        "[interpreter-error] Division by zero.",
+        "[interpreter-error] Operands must be two numbers or two strings.",
+        "[interpreter-error] Can only call functions and classes.",
+        "[interpreter-error] Can only call functions and classes.",
+        "[interpreter-error] Expected 1 arguments but got 2.",
+        "[interpreter-error] Expected 1 arguments but got 0.",
+        "[interpreter-error] Expected 0 arguments but got 1.",
+        "[interpreter-error] Expected 2 arguments but got 1.",
+        "[interpreter-error] Expected 1 arguments but got 0.",
+    ], result.stderr
+
+
+# The parser never makes one, the operator has to be put in by hand.
+@pytest.mark.parametrize("backend", ["tree", "closure"])
+def test_unknown_binary_operator(backend: str):
+    script = """
+import sys
+from errors import LoxRuntimeError
+from expr import Binary, Literal
+from interpreter import interpret
+from stmt import Expression
+from tokens import Token, TokenType
+
+comma = Token(TokenType.COMMA, ",", None, 1)
+try:
+    interpret([Expression(Binary(Literal(1.0), comma, Literal(2.0)))], sys.argv[1])
+except LoxRuntimeError as e:
+    print(e.report())
+"""
+    result = subprocess.run([sys.executable, "-c", script, backend],
+                            cwd=PLOX_DIR, capture_output=True, text=True)
+
+    assert result.stdout == "[interpreter-error] unknown binary operator: `,`\n", result.stderr
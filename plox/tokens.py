@@ -6,6 +6,9 @@ class TokenType(StrEnum):
     RIGHT_PAREN=auto(), 
     LEFT_BRACE=auto(), 
     RIGHT_BRACE=auto(),
+    LEFT_BRACKET=auto(),
+    RIGHT_BRACKET=auto(),
+    COLON=auto(),
     
     COMMA=auto(), 
     DOT=auto(), 
@@ -39,6 +42,7 @@ class TokenType(StrEnum):
     FUN=auto(), 
     FOR=auto(), 
     IF=auto(), 
+    IN=auto(),
     NIL=auto(), 
     OR=auto(),
     
@@ -51,7 +55,7 @@ class TokenType(StrEnum):
     EOF=auto()
 
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     type: TokenType
     lexeme: str
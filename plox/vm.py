@@ -0,0 +1,496 @@
+from __future__ import annotations
+
+from compiler import Chunk, FunctionProto, OpCode
+from environment import Environment
+from errors import LoxError, LoxRuntimeError
+from tokens import Token
+from containers import LoxList, LoxMap
+from ropes import Rope, concat
+import budgets
+from operators import add, divide, negate, number
+from interpreter import (Interp, LoxCallable, LoxClass, LoxInstance, arityError, callOf,
+                         getIndex, isTruthy, iterate, setIndex)
+
+# Stack based virtual machine for the bytecode produced by compiler.py.
+#
+# Calls between Lox functions push a `CallFrame` instead of recursing in
+# python. Classes and instances are the same `LoxClass`/`LoxInstance`
+# objects the tree-walker uses, only the functions are `VMFunction`s.
+
+CONSTANT      = int(OpCode.CONSTANT)
+NIL           = int(OpCode.NIL)
+TRUE          = int(OpCode.TRUE)
+FALSE         = int(OpCode.FALSE)
+POP           = int(OpCode.POP)
+DEFINE_GLOBAL = int(OpCode.DEFINE_GLOBAL)
+GET_GLOBAL    = int(OpCode.GET_GLOBAL)
+SET_GLOBAL    = int(OpCode.SET_GLOBAL)
+DEFINE_LOCAL  = int(OpCode.DEFINE_LOCAL)
+GET_LOCAL     = int(OpCode.GET_LOCAL)
+SET_LOCAL     = int(OpCode.SET_LOCAL)
+DEFINE_FRAME  = int(OpCode.DEFINE_FRAME)
+GET_FRAME     = int(OpCode.GET_FRAME)
+SET_FRAME     = int(OpCode.SET_FRAME)
+GET_PROPERTY  = int(OpCode.GET_PROPERTY)
+SET_PROPERTY  = int(OpCode.SET_PROPERTY)
+GET_INDEX     = int(OpCode.GET_INDEX)
+SET_INDEX     = int(OpCode.SET_INDEX)
+BUILD_LIST    = int(OpCode.BUILD_LIST)
+BUILD_MAP     = int(OpCode.BUILD_MAP)
+EQUAL         = int(OpCode.EQUAL)
+NOT_EQUAL     = int(OpCode.NOT_EQUAL)
+GREATER       = int(OpCode.GREATER)
+GREATER_EQUAL = int(OpCode.GREATER_EQUAL)
+LESS          = int(OpCode.LESS)
+LESS_EQUAL    = int(OpCode.LESS_EQUAL)
+ADD           = int(OpCode.ADD)
+SUBTRACT      = int(OpCode.SUBTRACT)
+MULTIPLY      = int(OpCode.MULTIPLY)
+DIVIDE        = int(OpCode.DIVIDE)
+NOT           = int(OpCode.NOT)
+NEGATE        = int(OpCode.NEGATE)
+JUMP          = int(OpCode.JUMP)
+JUMP_IF_FALSE = int(OpCode.JUMP_IF_FALSE)
+JUMP_IF_TRUE  = int(OpCode.JUMP_IF_TRUE)
+LOOP          = int(OpCode.LOOP)
+ITERATE       = int(OpCode.ITERATE)
+FOR_ITER      = int(OpCode.FOR_ITER)
+PUSH_SCOPE    = int(OpCode.PUSH_SCOPE)
+POP_SCOPE     = int(OpCode.POP_SCOPE)
+CALL          = int(OpCode.CALL)
+INVOKE        = int(OpCode.INVOKE)
+CLOSURE       = int(OpCode.CLOSURE)
+CLASS         = int(OpCode.CLASS)
+METHOD        = int(OpCode.METHOD)
+RETURN        = int(OpCode.RETURN)
+
+
+class VMFunction(LoxCallable):
+    proto        : FunctionProto
+    closure      : Environment
+    isInitializer: bool
+
+    def __init__(self, proto: FunctionProto, closure: Environment):
+        self.proto         = proto
+        self.closure       = closure
+        self.isInitializer = proto.isInitializer
+
+    def __repr__(self):
+        return f"<fn `{self.proto.name}`>"
+
+    def arity(self) -> int:
+        return len(self.proto.params)
+
+    # Only used when something outside the VM loop calls us, e.g.
+    # `LoxClass.call` or a builtin.
+    def call(self, interp: Interp, arguments: list[object]) -> object:
+        return execute_call(interp, self, arguments)
+
+    def invoke(self, interp: Interp, instance: LoxInstance, arguments: list[object]) -> object:
+        return execute_call(interp, self, arguments, this_environment(self, instance))
+
+    def bind(self, instance: LoxInstance) -> VMFunction:
+        environment: Environment = Environment(self.closure, 1)
+        environment.slots[0] = instance
+        return VMFunction(self.proto, environment)
+
+
+# The callee sits at `stack[base]` with its arguments above it. Those
+# arguments become the first slots of the call's frame, the rest of the
+# frame is pushed on top of them, and temporaries go above that.
+class CallFrame:
+    __slots__ = ("function", "code", "constants", "ip", "environment", "closure", "base")
+
+    def __init__(self, interp: Interp, function: VMFunction, closure: Environment,
+                 stack: list[object], base: int):
+        proto: FunctionProto = function.proto
+        # The arguments are on the stack already, above the callee.
+        argc : int           = len(stack) - base - 1
+        if argc != len(proto.params):
+            raise arityError(len(proto.params), argc)
+
+        interp.fuel -= proto.cost
+        if interp.fuel < 0:
+            budgets.refuel(interp)
+
+        self.function    = function
+        self.code        = proto.chunk.code
+        self.constants   = proto.chunk.constants
+        self.ip          = 0
+        # What the call's environment encloses: the function's closure, or
+        # the environment holding `this` for an INVOKE.
+        self.closure     = closure
+        self.environment = call_environment(proto, closure, stack, base + 1)
+        # Everything from here up is discarded on return.
+        self.base        = base
+
+        stack.extend([None] * (proto.frameSize - (len(stack) - base - 1)))
+
+
+def interpret(interp: Interp, script: FunctionProto) -> object:
+    depth: int = interp.depth
+    try:
+        return execute(interp, VMFunction(script, interp.globals), [])
+    finally:
+        # An error leaves the frames it went through counted.
+        interp.depth = depth
+
+# Calls made from outside the VM loop count towards `interp.depth` like the
+# frames it pushes itself.
+def execute_call(interp: Interp, function: VMFunction, arguments: list[object],
+                 closure: Environment = None) -> object:
+    depth: int = interp.depth
+    interp.depth += 1
+    try:
+        return execute(interp, function, arguments, closure)
+    finally:
+        interp.depth = depth
+
+# Only a function with captured variables gets an environment of its own,
+# with the captured parameters copied from the frame.
+def call_environment(proto: FunctionProto, closure: Environment, stack: list[object],
+                     bp: int) -> Environment:
+    if proto.scopeSize == 0:
+        return closure
+
+    environment = Environment(closure, proto.scopeSize)
+    for i, slot in proto.capturedParams:
+        environment.slots[slot] = stack[bp + i]
+    return environment
+
+# The environment `bind` would make, for calling a method on `instance`
+# without making the bound function.
+def this_environment(method: VMFunction, instance: LoxInstance) -> Environment:
+    environment: Environment = Environment(method.closure, 1)
+    environment.slots[0] = instance
+    return environment
+
+def execute(interp: Interp, function: VMFunction, arguments: list[object],
+            closure: Environment = None) -> object:
+    stack : list[object]    = [function, *arguments]
+    frames: list[CallFrame] = []
+
+    frame       = CallFrame(interp, function, closure if closure is not None else function.closure,
+                            stack, 0)
+    code        = frame.code
+    constants   = frame.constants
+    environment = frame.environment
+    globals_    = interp.globals
+    ip          = 0
+    # Where the running call's frame starts on the stack.
+    bp          = 1
+
+    push = stack.append
+    pop  = stack.pop
+
+    while True:
+        op: int = code[ip]
+        ip += 1
+
+        if op == GET_FRAME:
+            push(stack[bp + code[ip]])
+            ip += 1
+
+        elif op == GET_LOCAL:
+            env: Environment = environment
+            for _ in range(code[ip]):
+                env = env.enclosing
+            push(env.slots[code[ip + 1]])
+            ip += 2
+
+        elif op == CONSTANT:
+            push(constants[code[ip]])
+            ip += 1
+
+        elif op == GET_GLOBAL:
+            push(globals_.get(constants[code[ip]]))
+            ip += 1
+
+        elif op == POP:
+            pop()
+
+        elif op == JUMP_IF_FALSE:
+            if not isTruthy(stack[-1]):
+                ip = code[ip]
+            else:
+                ip += 1
+
+        elif op == JUMP:
+            ip = code[ip]
+
+        elif op == LOOP:
+            interp.fuel -= code[ip + 1]
+            if interp.fuel < 0:
+                budgets.refuel(interp)
+            ip = code[ip]
+
+        elif op == FOR_ITER:
+            value = next(stack[-1], stack)
+            if value is stack:
+                ip = code[ip]
+            else:
+                push(value)
+                ip += 1
+        elif op == GET_INDEX:
+            index = pop()
+            stack[-1] = getIndex(stack[-1], index)
+
+        elif op == LESS:
+            right = pop()
+            left  = stack[-1]
+            if left.__class__ is float and right.__class__ is float:
+                stack[-1] = left < right
+            else:
+                stack[-1] = number(left) < number(right)
+        elif op == ADD:
+            right = pop()
+            left  = stack[-1]
+            if left.__class__ is float and right.__class__ is float:
+                stack[-1] = left + right
+            elif isinstance(left, str | Rope) or isinstance(right, str | Rope):
+                stack[-1] = concat(left, right)
+            else:
+                stack[-1] = add(left, right)
+        elif op == SUBTRACT:
+            right = pop()
+            left  = stack[-1]
+            if left.__class__ is float and right.__class__ is float:
+                stack[-1] = left - right
+            else:
+                stack[-1] = number(left) - number(right)
+
+        elif op == SET_FRAME:
+            stack[bp + code[ip]] = stack[-1]
+            ip += 1
+        elif op == DEFINE_FRAME:
+            stack[bp + code[ip]] = pop()
+            ip += 1
+
+        elif op == SET_LOCAL:
+            env: Environment = environment
+            for _ in range(code[ip]):
+                env = env.enclosing
+            env.slots[code[ip + 1]] = stack[-1]
+            ip += 2
+
+        elif op == CALL:
+            argc: int = code[ip]
+            ip += 1
+            callee: object = stack[-argc - 1]
+
+            if isinstance(callee, VMFunction):
+                base: int = len(stack) - argc - 1
+
+                if code[ip] == RETURN and not frame.function.isInitializer:
+                    # `return f(...)`: the call replaces this frame instead of
+                    # going on top of it, so tail recursion doesn't grow `frames`.
+                    del stack[frame.base:base]
+                    base = frame.base
+                else:
+                    frame.ip = ip
+                    frames.append(frame)
+                    interp.depth += 1
+                frame = CallFrame(interp, callee, callee.closure, stack, base)
+                code, constants, environment, ip, bp = (frame.code, frame.constants,
+                                                        frame.environment, 0, base + 1)
+
+            elif isinstance(callee, LoxClass) and \
+                    isinstance(callee.findMethod("init"), VMFunction):
+                instance: LoxInstance = LoxInstance(callee)
+                if interp.budget is not None:
+                    budgets.allocated(interp, instance)
+                initializer: VMFunction = callee.findMethod("init")
+                base: int = len(stack) - argc - 1
+
+                frame.ip = ip
+                frames.append(frame)
+                interp.depth += 1
+                frame = CallFrame(interp, initializer, this_environment(initializer, instance),
+                                  stack, base)
+                code, constants, environment, ip, bp = (frame.code, frame.constants,
+                                                        frame.environment, 0, base + 1)
+
+            else:
+                arguments = stack[len(stack) - argc:]
+                del stack[len(stack) - argc - 1:]
+                push(callOf(callee)(interp, arguments))
+
+        elif op == INVOKE:
+            name: Token = constants[code[ip]]
+            argc: int   = code[ip + 1]
+            ip += 2
+            receiver: object = stack[-argc - 1]
+
+            if not isinstance(receiver, LoxInstance):
+                raise LoxRuntimeError(f"only instances have properties: `{receiver}`")
+
+            slot: int = receiver.shape.slots.get(name.lexeme)
+            if slot is None:
+                method: VMFunction = receiver.klass.findMethod(name.lexeme)
+                if method is None:
+                    raise LoxRuntimeError(f"Undefined property `{name.lexeme}`")
+
+                base: int = len(stack) - argc - 1
+
+                # A tail call, see CALL.
+                if code[ip] == RETURN and not frame.function.isInitializer:
+                    del stack[frame.base:base]
+                    base = frame.base
+                else:
+                    frame.ip = ip
+                    frames.append(frame)
+                    interp.depth += 1
+                frame = CallFrame(interp, method, this_environment(method, receiver), stack, base)
+                code, constants, environment, ip, bp = (frame.code, frame.constants,
+                                                        frame.environment, 0, base + 1)
+            else:
+                # A function stored in a field. Rare enough to just take the
+                # slow, recursive way.
+                arguments = stack[len(stack) - argc:]
+                del stack[len(stack) - argc - 1:]
+                push(callOf(receiver.values[slot])(interp, arguments))
+
+        elif op == RETURN:
+            result: object = pop()
+
+            if frame.function.isInitializer:
+                result = frame.closure.slots[0]
+
+            if not frames:
+                return result
+
+            del stack[frame.base:]
+            push(result)
+
+            frame = frames.pop()
+            interp.depth -= 1
+            code, constants, environment, ip, bp = (frame.code, frame.constants,
+                                                    frame.environment, frame.ip,
+                                                    frame.base + 1)
+
+        elif op == NIL:
+            push(None)
+        elif op == TRUE:
+            push(True)
+        elif op == FALSE:
+            push(False)
+
+        elif op == DEFINE_LOCAL:
+            environment.slots[code[ip]] = pop()
+            ip += 1
+        elif op == DEFINE_GLOBAL:
+            globals_.define(constants[code[ip]], pop())
+            ip += 1
+        elif op == SET_GLOBAL:
+            globals_.assign(constants[code[ip]], stack[-1])
+            ip += 1
+
+        elif op == GET_PROPERTY:
+            obj: object = pop()
+            if not isinstance(obj, LoxInstance):
+                raise LoxRuntimeError(f"only instances have properties: `{obj}`")
+            push(obj.get(constants[code[ip]]))
+            ip += 1
+        elif op == SET_PROPERTY:
+            value: object = pop()
+            obj  : object = pop()
+            if not isinstance(obj, LoxInstance):
+                raise LoxRuntimeError("Only instances have fields.")
+            obj.set(constants[code[ip]], value)
+            push(value)
+            ip += 1
+        elif op == SET_INDEX:
+            value: object = pop()
+            index: object = pop()
+            setIndex(pop(), index, value)
+            push(value)
+        elif op == BUILD_LIST:
+            count: int = code[ip]
+            ip += 1
+            items = LoxList(stack[len(stack) - count:])
+            del stack[len(stack) - count:]
+            push(items)
+        elif op == BUILD_MAP:
+            count: int = code[ip]
+            ip += 1
+            entries = LoxMap()
+            for i in range(len(stack) - 2 * count, len(stack), 2):
+                setIndex(entries, stack[i], stack[i + 1])
+            del stack[len(stack) - 2 * count:]
+            push(entries)
+        elif op == ITERATE:
+            stack[-1] = iterate(stack[-1])
+
+        elif op == JUMP_IF_TRUE:
+            if isTruthy(stack[-1]):
+                ip = code[ip]
+            else:
+                ip += 1
+
+        elif op == PUSH_SCOPE:
+            environment = Environment(environment, code[ip])
+            frame.environment = environment
+            ip += 1
+        elif op == POP_SCOPE:
+            environment = environment.enclosing
+            frame.environment = environment
+
+        elif op == EQUAL:
+            right = pop()
+            stack[-1] = stack[-1] == right
+        elif op == NOT_EQUAL:
+            right = pop()
+            stack[-1] = stack[-1] != right
+        elif op == GREATER:
+            right = pop()
+            left  = stack[-1]
+            if left.__class__ is float and right.__class__ is float:
+                stack[-1] = left > right
+            else:
+                stack[-1] = number(left) > number(right)
+        elif op == GREATER_EQUAL:
+            right = pop()
+            left  = stack[-1]
+            if left.__class__ is float and right.__class__ is float:
+                stack[-1] = left >= right
+            else:
+                stack[-1] = number(left) >= number(right)
+        elif op == LESS_EQUAL:
+            right = pop()
+            left  = stack[-1]
+            if left.__class__ is float and right.__class__ is float:
+                stack[-1] = left <= right
+            else:
+                stack[-1] = number(left) <= number(right)
+        elif op == MULTIPLY:
+            right = pop()
+            left  = stack[-1]
+            if left.__class__ is float and right.__class__ is float:
+                stack[-1] = left * right
+            else:
+                stack[-1] = number(left) * number(right)
+        elif op == DIVIDE:
+            right = pop()
+            left  = stack[-1]
+            if left.__class__ is float and right.__class__ is float and right:
+                stack[-1] = left / right
+            else:
+                stack[-1] = divide(left, right)
+        elif op == NOT:
+            stack[-1] = not isTruthy(stack[-1])
+        elif op == NEGATE:
+            stack[-1] = negate(stack[-1])
+
+        elif op == CLOSURE:
+            push(VMFunction(constants[code[ip]], environment))
+            ip += 1
+        elif op == CLASS:
+            push(LoxClass(constants[code[ip]], {}))
+            ip += 1
+        elif op == METHOD:
+            method: VMFunction = pop()
+            stack[-1].methods[constants[code[ip]]] = method
+            ip += 1
+
+        else:
+            raise LoxError(f"unknown opcode: `{op}`", "vm-error")